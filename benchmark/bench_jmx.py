@@ -0,0 +1,81 @@
+'''
+Copyright © 2020 YutoWatanabe
+
+震源・震度に関する情報の解析をxmltodictとjmx.Extractorで比較します。
+
+    python benchmark/bench_jmx.py --municipalities 500
+'''
+import os
+import sys
+import timeit
+import tracemalloc
+from typing import Any, Callable
+
+import click
+import xmltodict
+
+import jmx_samples
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import jmx  # noqa: E402 pylint: disable=C0413,E0401
+
+
+def parse_xmltodict(content: bytes) -> Any:
+    '''
+    変更前の処理(xmltodictで全体を変換してから値を取得)。
+    '''
+    details_root = xmltodict.parse(content)
+    report = details_root['Report']
+    values = {
+        'body': report['Head']['Headline']['Text'],
+        'magnitude': report['Body']['Earthquake']['jmx_eb:Magnitude']['#text'],
+        'area': report['Body']['Earthquake']['Hypocenter']['Area']['Name'],
+        'max_seismic_intensity': str(report['Body']['Intensity']['Observation']['MaxInt']),
+        'info': report['Body']['Comments']['ForecastComment']['Text'],
+    }
+    for element in report['Head']['Headline']['Information']:
+        if element['@type'] == '震源・震度に関する情報（市町村等）':
+            items = element['Item'] if isinstance(element['Item'], list) else [element['Item']]
+            values['areas'] = [
+                (item['Kind']['Name'], [area['Name'] for area in item['Areas']['Area']]
+                 if isinstance(item['Areas']['Area'], list) else [item['Areas']['Area']['Name']])
+                for item in items]
+    return values
+
+
+def parse_extractor(content: bytes) -> Any:
+    '''
+    変更後の処理(必要な値のみを取得)。
+    '''
+    return jmx.EPICENTER_AND_SEISMIC_INTENSITY.extract(content)
+
+
+def peak_memory(function: Callable[[bytes], Any], content: bytes) -> int:
+    '''
+    実行中の最大メモリ使用量(byte)を返します。
+    '''
+    tracemalloc.start()
+    function(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+@click.command()
+@click.option('--municipalities', default=500, help='市町村の数')
+@click.option('--number', default=20, help='計測する回数')
+def main(municipalities: int, number: int):
+    '''
+    ベンチマークを実行します。
+    '''
+    content = jmx_samples.epicenter_and_seismic_intensity(municipalities=municipalities).encode('utf-8')
+    click.echo(f'document: {len(content) / 1024:.1f} KiB, {municipalities} municipalities')
+
+    for name, function in (('xmltodict', parse_xmltodict), ('jmx.Extractor', parse_extractor)):
+        elapsed = min(timeit.repeat(lambda f=function: f(content), number=number, repeat=5)) / number
+        peak = peak_memory(function, content)
+        click.echo(f'{name:>14}: {elapsed * 1000:8.3f} ms/doc, peak {peak / 1024:8.1f} KiB')
+
+
+if __name__ == '__main__':
+    main()  # pylint: disable=E1120
@@ -0,0 +1,176 @@
+'''
+Copyright © 2020 YutoWatanabe
+
+make_fixtures.pyで生成したフィクスチャ(benchmark/fixtures)をローカルサーバーから配信し、
+取得からLINEへの送信まで(偽のLINE API)の処理を段階ごとに計測します。
+フィクスチャは合成したもので、通信もローカルのため、計測値は変更前後の比較用です。本番の負荷・遅延は表しません。
+
+    python benchmark/bench_pipeline.py --scenario m7 --runs 5
+    python benchmark/bench_pipeline.py --scenario m7 --json before.json
+
+段階: check_update, get_earthquake_information, find_latest, apply_template, post_line(送信完了まで)
+- wall: 経過時間の中央値
+- cpu: プロセス全体のCPU時間の中央値(ローカルサーバーのスレッドを含む)
+- peak: 段階ごとに新たに確保したメモリの最大値(tracemallocを有効にした別の実行で計測)
+'''
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+import click
+
+from stand_in import FakeLine, FixtureServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from main import Earthquake  # noqa: E402 pylint: disable=C0413,E0401
+from template import render_template  # noqa: E402 pylint: disable=C0413,E0401
+
+STAGES = ('check_update', 'get_earthquake_information', 'find_latest', 'apply_template', 'post_line')
+
+
+class Run():
+    '''
+    新しい保存ディレクトリで1回分の処理を実行します。
+    '''
+
+    def __init__(self, server: FixtureServer, line: FakeLine, memory: bool):
+        self.memory = memory
+        self.line = line
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=R1732
+        self.earthquake = Earthquake(
+            self.directory.name, f'{server.url}/eqvol.xml', 'token',
+            line_endpoint=line.url, detail_hosts=('127.0.0.1',))
+        self.result: Dict[str, Any] = {}
+
+    def measure(self, name: str, function: Callable[[], Any]) -> Any:
+        '''
+        `function`を実行し、経過時間・CPU時間・メモリを記録します。
+        '''
+        if self.memory:
+            tracemalloc.start()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        value = function()
+        self.result[name] = {
+            'wall': time.perf_counter() - wall,
+            'cpu': time.process_time() - cpu,
+        }
+        if self.memory:
+            self.result[name]['peak'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return value
+
+    def execute(self) -> Dict[str, Any]:
+        '''
+        すべての段階を実行します。
+        '''
+        earthquake = self.earthquake
+        self.line.reset()
+        earthquake.delivery.start()
+        started = time.perf_counter()
+
+        updated = self.measure('check_update', earthquake.check_update)
+        assert updated, 'fixture was not served'
+        self.measure('get_earthquake_information', earthquake.get_earthquake_information)
+        self.measure('find_latest', earthquake.find_latest)
+        messages = earthquake.urgent_message + earthquake.post_message
+        self.measure('apply_template', lambda: [render_template(message) for message in messages])
+
+        def post_line():
+            earthquake.post_line()
+            assert earthquake.delivery.join(30), 'delivery did not finish'
+
+        self.measure('post_line', post_line)
+        self.result['end_to_end'] = time.perf_counter() - started
+        self.result['first_message'] = self.line.first_at - started if self.line.first_at else None
+        self.result['messages'] = len(self.line.messages)
+        self.result['api_calls'] = self.line.requests
+        self.result['bytes'] = self.line.received
+
+        self.measure('check_update_unchanged', earthquake.check_update)
+        return self.result
+
+    def close(self):
+        '''
+        後片付けをします。
+        '''
+        self.earthquake.delivery.stop()
+        self.earthquake.executor.shutdown()
+        self.earthquake.http.close()
+        self.earthquake.posted.close()
+        self.directory.cleanup()
+
+
+def summarize(results: List[Dict[str, Any]], memory: List[Dict[str, Any]]) -> Dict[str, Any]:
+    '''
+    複数回の結果をまとめます。
+    '''
+    summary: Dict[str, Any] = {}
+    for stage in STAGES + ('check_update_unchanged',):
+        summary[stage] = {
+            'wall_ms': statistics.median(result[stage]['wall'] for result in results) * 1000,
+            'cpu_ms': statistics.median(result[stage]['cpu'] for result in results) * 1000,
+            'peak_kib': max(result[stage]['peak'] for result in memory) / 1024,
+        }
+    for key in ('end_to_end', 'first_message'):
+        values = [result[key] for result in results if result[key] is not None]
+        summary[f'{key}_ms'] = statistics.median(values) * 1000 if values else None
+    for key in ('messages', 'api_calls', 'bytes'):
+        summary[key] = results[-1][key]
+    return summary
+
+
+@click.command()
+@click.option('--scenario', default='m7', type=click.Choice(['m7', 'm4']), help='フィクスチャ')
+@click.option('--runs', default=5, help='計測する回数')
+@click.option('--json', 'json_path', default=None, help='結果を書き込むJSONファイル')
+def main(scenario: str, runs: int, json_path: Optional[str]):
+    '''
+    ベンチマークを実行します。
+    '''
+    server = FixtureServer(scenario)
+    line = FakeLine()
+    server.start()
+    line.start()
+
+    results = []
+    memory = []
+    try:
+        # 1回目はウォームアップとして捨てる
+        for index in range(runs + 2):
+            run = Run(server, line, memory=index == runs + 1)
+            try:
+                result = run.execute()
+            finally:
+                run.close()
+            if index == runs + 1:
+                memory.append(result)
+            elif index > 0:
+                results.append(result)
+    finally:
+        server.stop()
+        line.stop()
+
+    summary = summarize(results, memory)
+    click.echo(f'scenario {scenario}: {summary["messages"]} messages, {summary["api_calls"]} API calls, '
+               f'{summary["bytes"] / 1024:.1f} KiB sent, {runs} runs')
+    click.echo(f'{"stage":<28}{"wall ms":>10}{"cpu ms":>10}{"peak KiB":>10}')
+    for stage in STAGES + ('check_update_unchanged',):
+        values = summary[stage]
+        click.echo(f'{stage:<28}{values["wall_ms"]:10.2f}{values["cpu_ms"]:10.2f}{values["peak_kib"]:10.1f}')
+    click.echo(f'{"end_to_end":<28}{summary["end_to_end_ms"]:10.2f}')
+    if summary['first_message_ms'] is not None:
+        click.echo(f'{"first_message":<28}{summary["first_message_ms"]:10.2f}')
+
+    if json_path:
+        with open(json_path, mode='w', encoding='utf-8') as file:
+            json.dump({'scenario': scenario, 'runs': runs, 'summary': summary}, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()  # pylint: disable=E1120
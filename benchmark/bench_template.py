@@ -0,0 +1,114 @@
+'''
+Copyright © 2020 YutoWatanabe
+
+メッセージ1件あたりのテンプレート適用のコストを、変更前(Dictを組み立ててからJSONに変換)と
+変更後(コンパイル済みのテンプレートに値を埋め込む)で比較します。
+before はLineBotApi.broadcastと同じSendMessage経由の変換、dict+json はDictをjson.dumpsのみで変換した場合です。
+変更前もメッセージごとに表示する値(areasなど)をフォーマットしてDictを作っていたため、どちらもその時間を含めます。
+
+    python benchmark/bench_template.py --areas 50
+'''
+import json
+import os
+import re
+import sys
+import timeit
+from typing import Any, Dict
+
+import click
+from linebot.models import FlexSendMessage
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import events  # noqa: E402 pylint: disable=C0413,E0401
+import template  # noqa: E402 pylint: disable=C0413,E0401
+from jmx import Coordinate  # noqa: E402 pylint: disable=C0413,E0401
+
+
+def messages(areas: int) -> Dict[str, Any]:
+    '''
+    種類ごとのフォーマットした情報を生成します。
+    '''
+    items = tuple((f'震度{index % 7 + 1}', (f'市町村{index}', f'市町村{index + 1}'), (f'{index:07}', f'{index + 1:07}'),
+                   '地震情報／市町村等') for index in range(areas))
+    body = '１８日１０時２０分ころ、地震がありました。\n震源地は石川県能登地方です。'
+    info = 'この地震による津波の心配はありません。'
+    coordinate = Coordinate(37.5, 137.2, -10000.0)
+    return {
+        '震度速報': events.IntensityReport(1, 'url', body, info, items),
+        '震源に関する情報': events.EpicenterReport(1, 'url', body, '7.6', '石川県能登地方', info, coordinate),
+        '震源・震度に関する情報': events.EpicenterIntensityReport(
+            1, 'url', body, '7.6', '石川県能登地方', info, coordinate, events.Intensity.SEVEN, True, items, ()),
+        '緊急地震速報(予報)': events.EarlyWarningForecast(1, 'url', body),
+        '緊急地震速報(警報)': events.EarlyWarningAlarm(
+            1, 'url', body, tuple(
+                ('緊急地震速報（警報）', (f'地域{i}',), (f'{i}',), '緊急地震速報／府県予報区') for i in range(areas))),
+        '津波': events.Tsunami(1, 'url', body, '大津波警報・津波警報・津波注意報・津波予報', items),
+    }
+
+
+def legacy_text(event: Any) -> Dict[str, Any]:
+    '''
+    変更前のmain.pyが生成していたDictに変換します。
+    '''
+    names = ('title', 'body', 'info', 'magnitude', 'area', 'max_seismic_intensity', 'areas')
+    return {name: getattr(event, name) for name in names if getattr(event, name, None) is not None}
+
+
+def legacy_apply_template(text: Any) -> Any:  # pylint: disable=R0911
+    '''
+    変更前のapply_template(正規表現でタイトルを判定し、Dictを組み立てる)。
+    緊急地震速報はmain.pyが生成するタイトルで比較します。
+    '''
+    title = text['title']
+    if re.search(r'震度速報', title):
+        return template.seismic_intensity_bulletin_template(text)
+    if title == '震源に関する情報':
+        return template.epicenter_information_template(text)
+    if re.search(r'震源・震度に関する情報', title):
+        return template.epicenter_and_seismic_intensity_template(text)
+    if title == '緊急地震速報(予報)':
+        return template.earthquake_early_warning_forecast_template(text)
+    if title == '緊急地震速報 (警報)':
+        return template.earthquake_early_warning_alarm_template(text)
+    if re.search(r'津波', title):
+        return template.tsunami_template(text)
+    return template.error_template(text)
+
+
+def legacy_render(text: Any) -> bytes:
+    '''
+    変更前の処理(Dictを組み立て、LineBotApi.broadcastと同じくSendMessageからJSONに変換)。
+    '''
+    message = FlexSendMessage(alt_text=(text.get('body') or text['title'])[:400], contents=legacy_apply_template(text))
+    return json.dumps(message.as_json_dict()).encode('utf-8')
+
+
+def legacy_serialize(text: Any) -> bytes:
+    '''
+    変更前のテンプレートをjson.dumpsのみで変換します。(SendMessageの変換を除いた比較用)
+    '''
+    message = {'type': 'flex', 'altText': (text.get('body') or text['title'])[:400],
+               'contents': legacy_apply_template(text)}
+    return json.dumps(message, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+@click.command()
+@click.option('--areas', default=50, help='エリアの行数')
+@click.option('--number', default=2000, help='計測する回数')
+def main(areas: int, number: int):
+    '''
+    ベンチマークを実行します。
+    '''
+    for name, text in messages(areas).items():
+        results = []
+        for function in (lambda t: legacy_render(legacy_text(t)), lambda t: legacy_serialize(legacy_text(t)),
+                         template.render_template):
+            elapsed = min(timeit.repeat(lambda f=function, t=text: f(t), number=number, repeat=5)) / number
+            results.append(elapsed)
+        size = len(template.render_template(text))
+        click.echo(f'{name:<12}\tbefore {results[0] * 1e6:8.1f} us\tdict+json {results[1] * 1e6:7.1f} us\t'
+                   f'after {results[2] * 1e6:6.1f} us\t{size / 1024:5.1f} KiB')
+
+
+if __name__ == '__main__':
+    main()  # pylint: disable=E1120
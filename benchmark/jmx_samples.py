@@ -0,0 +1,199 @@
+'''
+Copyright © 2020 YutoWatanabe
+
+ベンチマーク用のJMX(気象庁防災情報XML)を生成します。
+'''
+from typing import List, Sequence, Tuple
+
+REPORT = '''<?xml version="1.0" encoding="UTF-8" ?>
+<Report xmlns="http://xml.kishou.go.jp/jmaxml1/" xmlns:jmx="http://xml.kishou.go.jp/jmaxml1/" \
+xmlns:jmx_add="http://xml.kishou.go.jp/jmaxml1/addition1/">
+<Control>
+<Title>{title}</Title>
+<DateTime>2024-01-01T07:{minute:02d}:00Z</DateTime>
+<Status>通常</Status>
+<EditorialOffice>気象庁本庁</EditorialOffice>
+<PublishingOffice>気象庁</PublishingOffice>
+</Control>
+<Head xmlns="http://xml.kishou.go.jp/jmaxml1/informationBasis1/">
+<Title>{title}</Title>
+<ReportDateTime>2024-01-01T16:{minute:02d}:00+09:00</ReportDateTime>
+<TargetDateTime>2024-01-01T16:10:00+09:00</TargetDateTime>
+<EventID>{event_id}</EventID>
+<InfoType>発表</InfoType>
+<Serial>{serial}</Serial>
+<InfoKind>{info_kind}</InfoKind>
+<InfoKindVersion>1.0_0</InfoKindVersion>
+<Headline>
+<Text>{headline}</Text>
+{information}</Headline>
+</Head>
+<Body xmlns="http://xml.kishou.go.jp/jmaxml1/body/seismology1/" \
+xmlns:jmx_eb="http://xml.kishou.go.jp/jmaxml1/elementBasis1/">
+{body}</Body>
+</Report>
+'''
+
+EARTHQUAKE = '''<Earthquake>
+<OriginTime>2024-01-01T16:10:00+09:00</OriginTime>
+<ArrivalTime>2024-01-01T16:10:00+09:00</ArrivalTime>
+<Hypocenter>
+<Area>
+<Name>石川県能登地方</Name>
+<Code type="震央地名">390</Code>
+<jmx_eb:Coordinate description="北緯３７．５度　東経１３７．３度　深さ１０ｋｍ" datum="日本測地系">\
++37.5+137.3-10000/</jmx_eb:Coordinate>
+</Area>
+</Hypocenter>
+<jmx_eb:Magnitude type="Mj" description="Ｍ{magnitude}">{magnitude}</jmx_eb:Magnitude>
+</Earthquake>
+'''
+
+COMMENTS = '''<Comments>
+<ForecastComment codeType="固定付加文">
+<Text>{comment}</Text>
+<Code>0215</Code>
+</ForecastComment>
+</Comments>
+'''
+
+INTENSITY_NAMES = ['震度７', '震度６強', '震度６弱', '震度５強', '震度５弱', '震度４', '震度３', '震度２', '震度１']
+INTENSITY_CODES = ['7', '6+', '6-', '5+', '5-', '4', '3', '2', '1']
+
+Areas = Sequence[Tuple[str, Sequence[Tuple[str, str]]]]
+
+
+def information(info_type: str, items: Areas, code_type: str = '地震情報／細分区域') -> str:
+    '''
+    Information要素を生成します。
+
+    Args:
+        info_type (str): type属性
+        items (Areas): [(種類, [(エリア名, コード)])]
+        code_type (str): Areasのコード種別(codeType属性)
+
+    Returns:
+        str: Information要素
+    '''
+    lines = [f'<Information type="{info_type}">']
+    for kind, areas in items:
+        lines.append(f'<Item>\n<Kind>\n<Name>{kind}</Name>\n</Kind>\n<Areas codeType="{code_type}">')
+        for name, code in areas:
+            lines.append(f'<Area>\n<Name>{name}</Name>\n<Code>{code}</Code>\n</Area>')
+        lines.append('</Areas>\n</Item>')
+    lines.append('</Information>\n')
+    return '\n'.join(lines)
+
+
+def spread_areas(count: int, prefix: str, code_base: int, levels: int = 7) -> Areas:
+    '''
+    `count`個のエリアを震度ごとに振り分けます。
+
+    Args:
+        count (int): エリア数
+        prefix (str): エリア名の接頭辞
+        code_base (int): エリアコードの開始値
+        levels (int): 使用する震度の段階数(震度7から)
+
+    Returns:
+        Areas: [(種類, [(エリア名, コード)])]
+    '''
+    buckets: List[List[Tuple[str, str]]] = [[] for _ in range(levels)]
+    for index in range(count):
+        # 震度が小さいほどエリアが多くなるように振り分ける
+        level = min(levels - 1, int((index / max(count, 1)) ** 0.5 * levels))
+        buckets[level].append((f'{prefix}{index + 1}', str(code_base + index)))
+    return [(INTENSITY_NAMES[level], areas) for level, areas in enumerate(buckets) if areas]
+
+
+def earthquake_intensity_report(event_id: str = '20240101161010', areas: int = 12, minute: int = 11) -> str:
+    '''
+    震度速報(VXSE51)を生成します。
+    '''
+    return REPORT.format(
+        title='震度速報', info_kind='震度速報', event_id=event_id, serial=1, minute=minute,
+        headline='１日１６時１０分ころ、地震による強い揺れを感じました。震度３以上が観測された地域をお知らせします。',
+        information=information('震度速報', spread_areas(areas, '地域', 100)),
+        body='<Intensity>\n<Observation>\n<MaxInt>7</MaxInt>\n</Observation>\n</Intensity>\n'
+        + COMMENTS.format(comment='今後の情報に注意してください。'))
+
+
+def epicenter_information(event_id: str = '20240101161010', magnitude: str = '7.6', minute: int = 12) -> str:
+    '''
+    震源に関する情報(VXSE52)を生成します。
+    '''
+    return REPORT.format(
+        title='震源に関する情報', info_kind='震源速報', event_id=event_id, serial=1, minute=minute,
+        headline='１日１６時１０分ころ、地震がありました。',
+        information='',
+        body=EARTHQUAKE.format(magnitude=magnitude) + COMMENTS.format(comment='津波警報等を発表中です。'))
+
+
+def epicenter_and_seismic_intensity(event_id: str = '20240101161010', magnitude: str = '7.6',
+                                    municipalities: int = 500, max_intensity: str = '7', minute: int = 15) -> str:
+    '''
+    震源・震度に関する情報(VXSE53)を生成します。
+    `municipalities`で市町村の数を指定します。大規模な地震では数百になります。
+    '''
+    levels = INTENSITY_CODES.index(max_intensity)
+    intensity_areas = spread_areas(max(municipalities // 10, 1), '地域', 100, len(INTENSITY_CODES) - levels)
+    city_areas = spread_areas(municipalities, '市町村', 1720000, len(INTENSITY_CODES) - levels)
+    shift = [(INTENSITY_NAMES[INTENSITY_NAMES.index(kind) + levels], areas) for kind, areas in intensity_areas]
+    city_shift = [(INTENSITY_NAMES[INTENSITY_NAMES.index(kind) + levels], areas) for kind, areas in city_areas]
+
+    observation = ['<Intensity>', '<Observation>', f'<MaxInt>{max_intensity}</MaxInt>']
+    for index in range(municipalities):
+        observation.append(
+            f'<Pref><Name>都道府県{index // 40}</Name><Code>{index // 40}</Code><MaxInt>{max_intensity}</MaxInt>'
+            f'<Area><Name>地域{index}</Name><Code>{100 + index}</Code><MaxInt>{max_intensity}</MaxInt>'
+            f'<City><Name>市町村{index + 1}</Name><Code>{1720000 + index}</Code><MaxInt>{max_intensity}</MaxInt>'
+            f'<IntensityStation><Name>観測点{index + 1}</Name><Code>{index}</Code><Int>{max_intensity}</Int>'
+            '</IntensityStation></City></Area></Pref>')
+    observation.extend(['</Observation>', '</Intensity>'])
+
+    return REPORT.format(
+        title='震源・震度に関する情報', info_kind='地震情報', event_id=event_id, serial=1, minute=minute,
+        headline='１日１６時１０分ころ、地震がありました。',
+        information=information('震源・震度に関する情報（細分区域）', shift)
+        + information('震源・震度に関する情報（市町村等）', city_shift, '地震情報／市町村等'),
+        body=EARTHQUAKE.format(magnitude=magnitude) + '\n'.join(observation) + '\n'
+        + COMMENTS.format(comment='津波警報等を発表中です。'))
+
+
+def earthquake_early_warning_forecast(event_id: str = '20240101161005', minute: int = 10) -> str:
+    '''
+    緊急地震速報(予報)(VXSE45相当)を生成します。
+    '''
+    return REPORT.format(
+        title='緊急地震速報（予報）', info_kind='緊急地震速報', event_id=event_id, serial=1, minute=minute,
+        headline='', information='', body='')
+
+
+def earthquake_early_warning_alarm(event_id: str = '20240101161005', minute: int = 10) -> str:
+    '''
+    緊急地震速報(警報)(VXSE43)を生成します。
+    '''
+    return REPORT.format(
+        title='緊急地震速報（警報）', info_kind='緊急地震速報', event_id=event_id, serial=1, minute=minute,
+        headline='緊急地震速報です。強い揺れに警戒してください。',
+        information=information('緊急地震速報（警報）', [
+            ('緊急地震速報（警報）', [
+                ('石川県能登', '390'), ('石川県加賀', '391'), ('新潟県上越', '372'),
+                ('富山県東部', '380'), ('富山県西部', '381')])], '緊急地震速報／府県予報区'),
+        body='')
+
+
+def tsunami(event_id: str = '20240101161010', minute: int = 12) -> str:
+    '''
+    津波警報・注意報・予報(VTSE41)を生成します。
+    '''
+    return REPORT.format(
+        title='津波警報・注意報・予報a', info_kind='津波警報・注意報・予報', event_id=event_id, serial=1, minute=minute,
+        headline='大津波警報を発表しました。',
+        information=information('津波予報領域表現', [
+            ('大津波警報', [('能登', '191')]),
+            ('津波警報', [('石川県加賀', '190'), ('新潟県上中下越', '380'), ('佐渡', '381')]),
+            ('津波注意報', [
+                ('北海道日本海沿岸南部', '102'), ('青森県日本海沿岸', '200'), ('秋田県', '230'), ('山形県', '250')])],
+            '津波予報区'),
+        body='')
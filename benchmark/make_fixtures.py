@@ -0,0 +1,137 @@
+'''
+Copyright © 2020 YutoWatanabe
+
+ベンチマーク用のフィードと詳細情報(benchmark/fixtures)を生成します。
+jmx_samples.pyのテンプレートから合成したもので、気象庁の実際の配信を記録したものではありません。
+生成したファイルはリポジトリに含めているため、通常は実行する必要はありません。
+
+    python benchmark/make_fixtures.py
+
+- m7: M7.6・最大震度6強の地震。緊急地震速報・大津波警報・数百の市町村を含む震源・震度に関する情報
+- m4: M4.5・最大震度4の地震
+'''
+import os
+from typing import Callable, List, Tuple
+
+import click
+
+import jmx_samples
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# フィードに書き込むホスト名。stand_in.pyが起動したアドレスに置き換えます
+FIXTURE_HOST = 'http://stand-in'
+
+FEED = '''<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" lang="ja">
+<title>高頻度（地震火山）</title>
+<subtitle>JMAXML publishing feed</subtitle>
+<updated>{updated}</updated>
+<id>{host}/eqvol.xml#short_1704093000</id>
+<link rel="related" href="http://www.jma.go.jp/"/>
+<link rel="self" href="{host}/eqvol.xml"/>
+<link rel="hub" href="http://alert-hub.appspot.com/"/>
+<rights type="html"><![CDATA[<a href="http://www.jma.go.jp/jma/kishou/info/coment.html">利用規約</a>]]></rights>
+{entries}</feed>
+'''
+
+ENTRY = '''<entry>
+<title>{title}</title>
+<id>{host}/data/{name}</id>
+<updated>{updated}</updated>
+<author><name>{author}</name></author>
+<link type="application/xml" href="{host}/data/{name}"/>
+<content type="text">{title}</content>
+</entry>
+'''
+
+# (タイトル, 詳細情報のファイル名, 発表官署, 詳細情報を生成する関数)
+Document = Tuple[str, str, str, Callable[[], str]]
+
+
+def volcano(index: int) -> Document:
+    '''
+    bot が対象としない火山の情報。
+    '''
+    return ('降灰予報（定時）', f'volcano_{index:02d}.xml', '気象庁地震火山部',
+            lambda: jmx_samples.REPORT.format(
+                title='降灰予報（定時）', info_kind='降灰予報', event_id=f'5060{index:02d}', serial=1, minute=0,
+                headline='噴火が発生した場合には、火口周辺に小さな噴石が落下するおそれがあります。',
+                information='', body=''))
+
+
+def past_events(count: int) -> List[Document]:
+    '''
+    前日までの小さな地震の震源・震度に関する情報。
+    '''
+    return [
+        ('震源・震度に関する情報', f'past_{index:02d}.xml', '気象庁',
+         lambda index=index: jmx_samples.epicenter_and_seismic_intensity(
+             event_id=f'202312311{index:02d}000', magnitude='3.8', municipalities=8, max_intensity='3'))
+        for index in range(count)]
+
+
+def m7() -> List[Document]:
+    '''
+    大規模な地震。新しい順に並べます。
+    '''
+    event_id = '20240101161010'
+    return [
+        ('震源・震度に関する情報', 'vxse53_2.xml', '気象庁', lambda: jmx_samples.epicenter_and_seismic_intensity(
+            event_id=event_id, municipalities=600, max_intensity='6+', minute=30)),
+        ('震源・震度に関する情報', 'vxse53_1.xml', '気象庁', lambda: jmx_samples.epicenter_and_seismic_intensity(
+            event_id=event_id, municipalities=300, max_intensity='6+', minute=20)),
+        ('津波警報・注意報・予報a', 'vtse41.xml', '気象庁', lambda: jmx_samples.tsunami(event_id=event_id)),
+        ('震源に関する情報', 'vxse52.xml', '気象庁', lambda: jmx_samples.epicenter_information(event_id=event_id)),
+        ('震度速報', 'vxse51.xml', '気象庁', lambda: jmx_samples.earthquake_intensity_report(
+            event_id=event_id, areas=60)),
+        ('緊急地震速報（警報）', 'vxse43.xml', '気象庁', lambda: jmx_samples.earthquake_early_warning_alarm(
+            event_id=event_id)),
+        ('緊急地震速報（予報）', 'vxse45.xml', '気象庁', lambda: jmx_samples.earthquake_early_warning_forecast(
+            event_id=event_id)),
+    ] + [volcano(index) for index in range(10)] + past_events(20)
+
+
+def m4() -> List[Document]:
+    '''
+    小さな地震。新しい順に並べます。
+    '''
+    event_id = '20240101161010'
+    return [
+        ('震源・震度に関する情報', 'vxse53.xml', '気象庁', lambda: jmx_samples.epicenter_and_seismic_intensity(
+            event_id=event_id, magnitude='4.5', municipalities=30, max_intensity='4')),
+        ('震度速報', 'vxse51.xml', '気象庁', lambda: jmx_samples.earthquake_intensity_report(
+            event_id=event_id, areas=4)),
+    ] + [volcano(index) for index in range(10)]
+
+
+def write(scenario: str, documents: List[Document]):
+    '''
+    フィードと詳細情報を書き込みます。
+    '''
+    directory = os.path.join(FIXTURES, scenario)
+    os.makedirs(os.path.join(directory, 'data'), exist_ok=True)
+
+    entries = []
+    for index, (title, name, author, generate) in enumerate(documents):
+        updated = f'2024-01-01T07:{59 - index:02d}:00Z'
+        entries.append(ENTRY.format(title=title, host=FIXTURE_HOST, name=name, updated=updated, author=author))
+        with open(os.path.join(directory, 'data', name), mode='w', encoding='utf-8') as file:
+            file.write(generate())
+
+    with open(os.path.join(directory, 'eqvol.xml'), mode='w', encoding='utf-8') as file:
+        file.write(FEED.format(updated='2024-01-01T07:59:00Z', host=FIXTURE_HOST, entries=''.join(entries)))
+    click.echo(f'{scenario}: {len(documents)} entries')
+
+
+@click.command()
+def main():
+    '''
+    フィクスチャを生成します。
+    '''
+    write('m7', m7())
+    write('m4', m4())
+
+
+if __name__ == '__main__':
+    main()  # pylint: disable=E1120
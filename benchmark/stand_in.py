@@ -0,0 +1,171 @@
+'''
+Copyright © 2020 YutoWatanabe
+
+ベンチマーク用のローカルサーバー。
+- FixtureServer: 気象庁の代わりにmake_fixtures.pyで生成したフィードと詳細情報を配信します
+- FakeLine: LINE Messaging APIの代わりに送信されたメッセージを記録します
+'''
+import hashlib
+import json
+import os
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Any, Dict, List, Optional
+
+from make_fixtures import FIXTURES, FIXTURE_HOST
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    '''
+    リクエストごとにスレッドで処理するHTTPサーバー。
+    '''
+    daemon_threads = True
+    # 並列で取得した際に接続を取りこぼさないようにする(既定は5)
+    request_queue_size = 64
+
+
+class StandIn():
+    '''
+    別スレッドで起動するHTTPサーバー。
+    '''
+
+    def __init__(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.handler())
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def handler(self) -> type:
+        '''
+        リクエストハンドラを返します。
+        '''
+        raise NotImplementedError
+
+    def start(self):
+        '''
+        サーバーを起動します。
+        '''
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        '''
+        サーバーを停止します。
+        '''
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FixtureServer(StandIn):
+    '''
+    benchmark/fixtures/<scenario> を配信します。
+    フィード内のURLは起動したアドレスに置き換え、Last-Modified・ETagによる条件付きGETに対応します。
+    '''
+
+    def __init__(self, scenario: str):
+        self.files: Dict[str, bytes] = {}
+        self.requests = 0
+        super().__init__()
+
+        directory = os.path.join(FIXTURES, scenario)
+        for root, _, names in os.walk(directory):
+            for name in names:
+                path = os.path.join(root, name)
+                with open(path, mode='rb') as file:
+                    content = file.read().replace(FIXTURE_HOST.encode('utf-8'), self.url.encode('utf-8'))
+                self.files['/' + os.path.relpath(path, directory).replace(os.sep, '/')] = content
+        self.last_modified = formatdate(usegmt=True)
+
+    def handler(self) -> type:
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            '''
+            生成済みのファイルを返します。
+            '''
+
+            def do_GET(self):  # pylint: disable=C0103
+                '''
+                ファイルを返します。
+                '''
+                stand_in.requests += 1
+                content = stand_in.files.get(self.path)
+                if content is None:
+                    self.send_error(404)
+                    return
+                etag = '"' + hashlib.sha1(content).hexdigest() + '"'
+                if self.headers.get('If-None-Match') == etag \
+                        or self.headers.get('If-Modified-Since') == stand_in.last_modified:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/xml')
+                self.send_header('Content-Length', str(len(content)))
+                self.send_header('Last-Modified', stand_in.last_modified)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):  # pylint: disable=W0622
+                pass
+
+        return Handler
+
+
+class FakeLine(StandIn):
+    '''
+    LINE Messaging APIのbroadcastを受け付け、送信されたメッセージを記録します。
+    Earthquake(..., line_endpoint=FakeLine.url) で使用します。
+    '''
+
+    def __init__(self):
+        self.messages: List[Any] = []
+        self.requests = 0
+        self.received = 0
+        # 最初のメッセージを受信した時刻(time.perf_counter)
+        self.first_at: Optional[float] = None
+        self.condition = threading.Condition()
+        super().__init__()
+
+    def reset(self):
+        '''
+        記録を消去します。
+        '''
+        with self.condition:
+            self.messages = []
+            self.requests = 0
+            self.received = 0
+            self.first_at = None
+
+    def handler(self) -> type:
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            '''
+            broadcastを受け付けます。
+            '''
+
+            def do_POST(self):  # pylint: disable=C0103
+                '''
+                メッセージを記録して200を返します。
+                '''
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                messages = json.loads(body).get('messages', [])
+                with stand_in.condition:
+                    if stand_in.first_at is None:
+                        stand_in.first_at = time.perf_counter()
+                    stand_in.requests += 1
+                    stand_in.received += len(body)
+                    stand_in.messages.extend(messages)
+                    stand_in.condition.notify_all()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'{}')
+
+            def log_message(self, format, *args):  # pylint: disable=W0622
+                pass
+
+        return Handler
@@ -0,0 +1,248 @@
+'''
+Copyright © 2020 YutoWatanabe
+'''
+import heapq
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from events import EpicenterIntensityReport, EpicenterReport, Event, Intensity, IntensityReport
+from json_operation import json_read, json_write
+import metrics
+
+LOGGER = logging.getLogger(__name__)
+
+# まとめる情報の種類。震源・震度に関する情報は他の2つの内容をすべて含みます
+_AGGREGATED = (IntensityReport, EpicenterReport)
+
+
+class _Group():  # pylint: disable=R0903
+    '''
+    同じEventIDの情報。
+    '''
+    __slots__ = ('held', 'sent', 'deadline', 'complete', 'expires')
+
+    def __init__(self, deadline: float, expires: float):
+        # 種類(KIND): 送信を待っている情報
+        self.held: Dict[str, Event] = {}
+        # 種類(KIND): 最後に送信した情報。後から届いた情報とまとめる時に使用します
+        self.sent: Dict[str, Event] = {}
+        self.deadline = deadline
+        # 震源・震度に関する情報を送信済みの場合True
+        self.complete = False
+        self.expires = expires
+
+
+class EventAggregator():
+    '''
+    同じ地震(EventID)の震度速報・震源に関する情報をまとめ、送信数を減らします。
+    - 最初の情報(通常は震度速報)は待たずに送信します
+    - 後から届いた情報は`window`秒待ち、その間に届いた情報と送信済みの情報を1件の更新にまとめます。
+      震度速報と震源に関する情報がそろった場合は、震源・震度に関する情報の形式にまとめます
+    - 震源・震度に関する情報は待たずに送信し、待っている情報は破棄します(内容がすべて含まれるため)。
+      送信後は、その訂正のみ送信します
+
+    EventIDごとの状態はメモリ上で管理し、ファイルへは変更があった場合にsaveで書き込みます。
+    '''
+
+    def __init__(self, save_directory: str, window: float = 60.0, retention: float = 3600.0):
+        self.save_file_path = os.path.join(save_directory, 'aggregate.json')
+        self.window = window
+        # 送信後にEventIDを記録しておく期間(秒)
+        self.retention = retention
+        self.__groups: Dict[Any, _Group] = {}
+        # (送信する時刻, EventID)。更新前の古い要素も残るため、取り出すときに時刻を確認する
+        self.__deadlines: List[Tuple[float, Any]] = []
+        self.__changed = False
+        self.__load()
+
+    def add(self, event: Event, now: Optional[float] = None) -> List[Event]:
+        '''
+        情報を追加します。
+
+        Args:
+            event (Event): フォーマットした情報
+            now (Optional[float]): 現在時刻(UNIX時間)
+
+        Returns:
+            List[Event]: すぐに送信する情報
+        '''
+        if not isinstance(event, _AGGREGATED) or not event.event_id:
+            return [event]
+        now = time.time() if now is None else now
+
+        group = self.__groups.get(event.event_id)
+        if group is None:
+            group = _Group(now + self.window, now + self.retention)
+            self.__groups[event.event_id] = group
+        group.expires = max(group.expires, now + self.retention)
+        self.__changed = True
+
+        if isinstance(event, EpicenterIntensityReport):
+            self.__consolidate(group.held.values())
+            group.held = {}
+            group.complete = True
+            return [event]
+        if group.complete:
+            self.__consolidate([event])
+            return []
+        if not group.sent and not group.held:
+            group.sent[event.KIND] = event
+            return [event]
+
+        if not group.held:
+            group.deadline = now + self.window
+            heapq.heappush(self.__deadlines, (group.deadline, event.event_id))
+        if event.KIND in group.held:
+            # 古い情報を除いてから追加し、heldを届いた順に保つ
+            self.__consolidate([group.held.pop(event.KIND)])
+        group.held[event.KIND] = event
+        return []
+
+    def expire(self, now: Optional[float] = None) -> List[Event]:
+        '''
+        まとめる期間が過ぎた情報を返し、記録する期間が過ぎたEventIDを削除します。
+
+        Args:
+            now (Optional[float]): 現在時刻(UNIX時間)
+
+        Returns:
+            List[Event]: 送信する情報
+        '''
+        now = time.time() if now is None else now
+        ready = []
+        while self.__deadlines and self.__deadlines[0][0] <= now:
+            deadline, event_id = heapq.heappop(self.__deadlines)
+            group = self.__groups.get(event_id)
+            if group is None or not group.held or group.deadline != deadline:
+                continue
+            ready.append(self.__merge(list(group.held.values()), group.sent))
+            group.sent.update(group.held)
+            group.held = {}
+            self.__changed = True
+
+        for event_id in [event_id for event_id, group in self.__groups.items()
+                         if not group.held and group.expires <= now]:
+            del self.__groups[event_id]
+            self.__changed = True
+        return ready
+
+    def next_wait(self, now: Optional[float] = None) -> Optional[float]:
+        '''
+        次にまとめた情報を送信するまでの時間を返します。
+
+        Args:
+            now (Optional[float]): 現在時刻(UNIX時間)
+
+        Returns:
+            Optional[float]: 待機時間(秒)。待っている情報が無い場合はNone
+        '''
+        now = time.time() if now is None else now
+        deadlines = [group.deadline for group in self.__groups.values() if group.held]
+        return max(min(deadlines) - now, 0.0) if deadlines else None
+
+    def pending(self) -> List[Any]:
+        '''
+        送信を待っている情報のEventIDを返します。
+
+        Returns:
+            List[Any]: EventID
+        '''
+        return [event_id for event_id, group in self.__groups.items() if group.held]
+
+    def save(self):
+        '''
+        変更があった場合のみファイルに保存します。
+        '''
+        if not self.__changed:
+            return
+        json_write(self.save_file_path, [
+            {
+                'event_id': event_id,
+                'deadline': group.deadline,
+                'complete': group.complete,
+                'expires': group.expires,
+                'held': [event.to_dict() for event in group.held.values()],
+                'sent': [event.to_dict() for event in group.sent.values()],
+            } for event_id, group in self.__groups.items()])
+        self.__changed = False
+
+    def __merge(self, events: List[Event], sent: Dict[str, Event]) -> Event:
+        '''
+        震度速報と震源に関する情報を震源・震度に関する情報の形式にまとめます。
+        待っていた情報に無い種類は、送信済みの情報を使用します。
+        - 震度(最大震度・震度ごとの地域)は最新の震度速報
+        - 震源(震源地・マグニチュード・位置)・付加文は最新の震源に関する情報(付加文が無い場合は震度速報)
+        - 見出し(本文)・詳細情報のURLは最後に届いた情報
+
+        Args:
+            events (List[Event]): 同じEventIDの待っていた情報(届いた順)
+            sent (Dict[str, Event]): 同じEventIDの送信済みの情報
+
+        Returns:
+            Event: 送信する情報
+        '''
+        held_intensity = next((event for event in events if isinstance(event, IntensityReport)), None)
+        held_epicenter = next((event for event in events if isinstance(event, EpicenterReport)), None)
+        intensity = held_intensity or sent.get(IntensityReport.KIND)
+        epicenter = held_epicenter or sent.get(EpicenterReport.KIND)
+        if not isinstance(intensity, IntensityReport) or not isinstance(epicenter, EpicenterReport):
+            return events[-1]
+
+        latest = events[-1]
+        # 両方を待っていた場合は1件にまとめるため、先に届いた方は送信しない
+        self.__consolidate(events[:-1])
+        intensities = [Intensity.parse(kind) for kind, _, _, _ in intensity.area_items or ()]
+        merged = EpicenterIntensityReport(
+            event_id=epicenter.event_id,
+            url=latest.url,
+            body=latest.body,
+            magnitude=epicenter.magnitude,
+            area=epicenter.area,
+            info=epicenter.info if epicenter.info is not None else intensity.info,
+            coordinate=epicenter.coordinate,
+            max_intensity=max((value for value in intensities if value is not None), default=None),
+            has_information=True,
+            area_items=intensity.area_items,
+            region_items=())
+        detected = [event.detected_at for event in events if event.detected_at is not None]
+        merged.detected_at = min(detected) if detected else None
+        return merged
+
+    @staticmethod
+    def __consolidate(events: Any):
+        '''
+        他の情報にまとめて送信しなかった情報を記録します。
+
+        Args:
+            events (Any): 送信しなかった情報
+        '''
+        for event in events:
+            LOGGER.info('Consolidated %s (%s)', event.title.split('\n')[0], event.event_id)
+            metrics.CONSOLIDATED.inc(type=event.KIND)
+
+    def __load(self):
+        '''
+        ファイルから読み込みます。
+        '''
+        try:
+            elements = json_read(self.save_file_path) if os.path.isfile(self.save_file_path) else []
+        except ValueError:
+            LOGGER.warning('Discarded unreadable %s', self.save_file_path)
+            elements = []
+
+        for element in elements:
+            try:
+                held = [Event.from_dict(values) for values in element['held']]
+                sent = [Event.from_dict(values) for values in element.get('sent', [])]
+            except (KeyError, TypeError, ValueError):
+                LOGGER.warning('Discarded unreadable aggregate: %s', element.get('event_id'))
+                continue
+            group = _Group(element['deadline'], element['expires'])
+            group.complete = element['complete']
+            group.held = {event.KIND: event for event in held}
+            group.sent = {event.KIND: event for event in sent}
+            self.__groups[element['event_id']] = group
+            if held:
+                heapq.heappush(self.__deadlines, (group.deadline, element['event_id']))
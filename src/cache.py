@@ -0,0 +1,64 @@
+'''
+Copyright © 2020 YutoWatanabe
+'''
+from collections import OrderedDict
+from typing import Any, Hashable, List, Tuple
+
+
+class LRUCache():
+    '''
+    サイズ上限付きのLRUキャッシュ。
+    上限を超えた場合は最も長い間参照されていない要素から削除します。
+    '''
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.__elements: 'OrderedDict[Hashable, Any]' = OrderedDict()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.__elements
+
+    def __len__(self) -> int:
+        return len(self.__elements)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        '''
+        要素を取得します。取得した要素は最新として扱われます。
+
+        Args:
+            key (Hashable): キー
+            default (Any): 要素が無い場合に返す値
+
+        Returns:
+            Any: 要素
+        '''
+        if key not in self.__elements:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.__elements.move_to_end(key)
+        return self.__elements[key]
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        '''
+        古い順にすべての要素を返します。参照した扱いにはしません。
+
+        Returns:
+            List[Tuple[Hashable, Any]]: (キー, 要素)
+        '''
+        return list(self.__elements.items())
+
+    def put(self, key: Hashable, value: Any):
+        '''
+        要素を追加します。上限を超えた場合は古い要素を削除します。
+
+        Args:
+            key (Hashable): キー
+            value (Any): 要素
+        '''
+        self.__elements[key] = value
+        self.__elements.move_to_end(key)
+        while len(self.__elements) > self.max_size:
+            self.__elements.popitem(last=False)
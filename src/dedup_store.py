@@ -0,0 +1,116 @@
+'''
+Copyright © 2020 YutoWatanabe
+'''
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+from json_operation import Journal
+
+
+class DedupStore():
+    '''
+    投稿済みの情報を記録します。
+    (event_id, url)のハッシュをキーにしてメモリ上で管理し、ファイルには追記のみ行います。
+    期限切れ・上限超過の要素はcompactで削除します。
+    '''
+
+    def __init__(self, path: str, ttl: float = 7 * 24 * 3600, max_size: int = 10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.__keys: 'OrderedDict[str, float]' = OrderedDict()
+        self.__journal = Journal(self.path)
+        for record in self.__journal.replay():
+            if isinstance(record, list) and len(record) == 2:
+                self.__keys[record[0]] = record[1]
+
+    def __contains__(self, data: Dict[str, Any]) -> bool:
+        return self.key(data) in self.__keys
+
+    def __len__(self) -> int:
+        return len(self.__keys)
+
+    @staticmethod
+    def key(data: Dict[str, Any]) -> str:
+        '''
+        キーを生成します。
+
+        Args:
+            data (Dict[str, Any]): {'event_id': EventID, 'url': 詳細情報のURL}
+
+        Returns:
+            str: キー
+        '''
+        source = f'{data.get("event_id")}\n{data.get("url")}'
+        return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+    def add(self, data: Dict[str, Any], now: Optional[float] = None):
+        '''
+        投稿済みとして記録します。
+
+        Args:
+            data (Dict[str, Any]): {'event_id': EventID, 'url': 詳細情報のURL}
+            now (Optional[float]): 記録する時刻(UNIX時間)
+        '''
+        key = self.key(data)
+        if key in self.__keys:
+            return
+        timestamp = time.time() if now is None else now
+        self.__keys[key] = timestamp
+        self.__journal.append([key, round(timestamp)])
+
+    def records(self) -> List[List[Any]]:
+        '''
+        記録をファイルと同じ形式で返します。
+
+        Returns:
+            List[List[Any]]: [キー, 記録した時刻(UNIX時間)]
+        '''
+        return [[key, round(timestamp)] for key, timestamp in self.__keys.items()]
+
+    def merge(self, records: Iterable[Any]) -> int:
+        '''
+        他の記録(recordsの形式)のうち、記録していないものを追加します。
+
+        Args:
+            records (Iterable[Any]): [キー, 記録した時刻(UNIX時間)]
+
+        Returns:
+            int: 追加した数
+        '''
+        added = [record for record in records
+                 if isinstance(record, list) and len(record) == 2 and record[0] not in self.__keys]
+        for key, timestamp in sorted(added, key=lambda record: record[1]):
+            self.__keys[key] = timestamp
+            self.__journal.append([key, timestamp])
+        if added:
+            # 古い順(compactで期限切れを先頭から削除する順)に並べ直す
+            self.__keys = OrderedDict(sorted(self.__keys.items(), key=lambda item: item[1]))
+        return len(added)
+
+    def compact(self, now: Optional[float] = None, force: bool = False):
+        '''
+        期限切れ・上限を超えた要素を削除します。
+        ファイルに削除済みの行が多く溜まった場合はファイルを書き直します。
+
+        Args:
+            now (Optional[float]): 現在時刻(UNIX時間)
+            force (bool): Trueの場合は必ずファイルを書き直す
+        '''
+        expire = (time.time() if now is None else now) - self.ttl
+        while self.__keys:
+            key, timestamp = next(iter(self.__keys.items()))
+            if timestamp >= expire and len(self.__keys) <= self.max_size:
+                break
+            del self.__keys[key]
+
+        if force or self.__journal.lines > 2 * len(self.__keys) + 100:
+            self.__journal.compact([key, round(timestamp)] for key, timestamp in self.__keys.items())
+
+    def close(self):
+        '''
+        ファイルを閉じます。
+        '''
+        self.__journal.close()
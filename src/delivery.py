@@ -0,0 +1,608 @@
+'''
+Copyright © 2020 YutoWatanabe
+'''
+import hashlib
+import heapq
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import requests
+from linebot.exceptions import LineBotApiError
+from linebot.models import Error
+
+from events import Event
+from http_client import HttpClient
+from json_operation import Journal
+import metrics
+from subscribers import SubscriberRegistry
+from template import render_template, template_key
+
+LOGGER = logging.getLogger(__name__)
+
+# 1回のリクエストで送信できるメッセージの最大数
+MAX_MESSAGES_PER_REQUEST = 5
+# multicastの1回のリクエストで送信できる宛先の最大数
+MAX_RECIPIENTS_PER_REQUEST = 500
+# 同じリトライキーのリクエストが既に受け付けられている場合のステータスコード
+RETRY_KEY_ACCEPTED = 409
+LINE_API_ENDPOINT = 'https://api.line.me'
+
+# 送信する優先度(小さいほど優先)。キーはtemplate_keyで正規化したタイトル
+PRIORITY = {
+    '緊急地震速報(警報)': 0,
+    # 配信を絞る・戻すおしらせは、同時に追加した情報より先に送信する
+    'おしらせ': 1,
+    '津波': 1,
+    '震度速報': 2,
+    '震源・震度に関する情報': 3,
+    '震源に関する情報': 4,
+    '緊急地震速報(予報)': 5,
+}
+
+
+def retry_headers(retry_key: str) -> Dict[str, str]:
+    '''
+    リトライしても二重に送信されないよう、X-Line-Retry-Keyを付けたリクエストヘッダを返します。
+
+    Args:
+        retry_key (str): リトライキー(UUID)
+
+    Returns:
+        Dict[str, str]: リクエストヘッダ
+    '''
+    return {'Content-Type': 'application/json', 'X-Line-Retry-Key': retry_key}
+
+
+def message_priority(message: Any) -> int:
+    '''
+    送信する優先度を返します。
+
+    Args:
+        message (Any): フォーマットした情報
+
+    Returns:
+        int: 優先度(小さいほど優先)
+    '''
+    return PRIORITY.get(template_key(message.title), len(PRIORITY))
+
+
+class LineApi():  # pylint: disable=R0903
+    '''
+    シリアライズ済みのメッセージをLINE Messaging APIに送信します。
+    詳細情報の取得と同じHttpClient(コネクションプール)を使用します。
+    '''
+
+    def __init__(self, http: HttpClient, token: str, endpoint: str = LINE_API_ENDPOINT):
+        self.http = http
+        self.endpoint = endpoint
+        self.headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+
+    def post(self, path: str, data: bytes, retry_key: str):
+        '''
+        POSTします。リトライはDeliveryQueueがリトライキーを付けて行うため、HttpClientではリトライしません。
+
+        Args:
+            path (str): APIのパス。例: /v2/bot/message/broadcast
+            data (bytes): リクエストの本文(JSON)
+            retry_key (str): リトライキー
+
+        Raises:
+            LineBotApiError: LINE APIがエラーを返した場合
+            requests.exceptions.RequestException: 接続できなかった場合
+        '''
+        headers = dict(self.headers, **retry_headers(retry_key))
+        responce = self.http.post(self.endpoint + path, data=data, headers=headers)
+        if 200 <= responce.status_code < 300:
+            return
+        try:
+            error = Error.new_from_json_dict(responce.json())
+        except ValueError:
+            error = Error(message=responce.text)
+        raise LineBotApiError(
+            status_code=responce.status_code,
+            headers=dict(responce.headers.items()),
+            request_id=responce.headers.get('X-Line-Request-Id'),
+            accepted_request_id=responce.headers.get('X-Line-Accepted-Request-Id'),
+            error=error)
+
+
+class LineSender():  # pylint: disable=R0903
+    '''
+    LINEにbroadcastします。
+    '''
+
+    def __init__(self, api: LineApi):
+        self.api = api
+
+    def __call__(self, messages: List[Any], retry_key: str):
+        '''
+        まとめて送信します。
+        テンプレートはJSONにシリアライズ済みのため、LineBotApi.broadcastを使わずに本文を組み立てて送信します。
+
+        Args:
+            messages (List[Any]): フォーマットした情報(最大5件)
+            retry_key (str): リトライキー。同じメッセージをリトライする場合は同じキーを使用します
+
+        Raises:
+            LineBotApiError: LINE APIがエラーを返した場合
+        '''
+        with metrics.STAGE_SECONDS.time(stage='template'):
+            data = b'{"messages":[' + b','.join(render_template(message) for message in messages) + b']}'
+        with metrics.STAGE_SECONDS.time(stage='broadcast'):
+            self.api.post('/v2/bot/message/broadcast', data, retry_key)
+
+
+class MulticastSender():  # pylint: disable=R0903
+    '''
+    購読者の地域・震度の設定に合わせて、送信先を絞ってLINEにmulticastします。
+    同じメッセージの組み合わせを受け取る購読者をまとめ、500人ずつ送信します。
+    友だちの一覧を取り込めず一覧に無い購読者がいる場合(`broadcast_unknown`)は、その購読者が受信する情報を
+    broadcastします。
+    '''
+
+    def __init__(self, api: LineApi, registry: SubscriberRegistry, broadcast_unknown: bool = False):
+        self.api = api
+        self.registry = registry
+        self.broadcast_unknown = broadcast_unknown
+        # リトライ時に送信済みのリクエストを再送しないよう、送信中のバッチと送信済みのリクエストを記録します
+        self.__batch: Optional[str] = None
+        self.__delivered: Set[str] = set()
+
+    def __call__(self, messages: List[Any], retry_key: str):  # pylint: disable=R0914
+        '''
+        まとめて送信します。
+
+        Args:
+            messages (List[Any]): フォーマットした情報(最大5件)。targets()・hypocenter()で送信先を絞ります
+            retry_key (str): リトライキー。リクエストごとのキーはこのキーと宛先・内容から求めます
+
+        Raises:
+            LineBotApiError: LINE APIがエラーを返した場合
+        '''
+        with metrics.STAGE_SECONDS.time(stage='template'):
+            rendered = [render_template(message) for message in messages]
+        batch = hashlib.sha1(b'\n'.join(rendered)).hexdigest()
+        if batch != self.__batch:
+            self.__batch = batch
+            self.__delivered = set()
+
+        with metrics.STAGE_SECONDS.time(stage='recipients'):
+            broadcast = [index for index, message in enumerate(messages)
+                         if self.broadcast_unknown and self.registry.receives_by_default(message.targets())]
+            recipients = [set() if index in broadcast else set(self.registry.recipients(
+                message.targets(), message.hypocenter())) for index, message in enumerate(messages)]
+            # 受け取るメッセージの組み合わせごとに購読者をまとめる
+            groups: Dict[Tuple[int, ...], List[str]] = {}
+            for user_id in sorted(set().union(*recipients)):
+                key = tuple(index for index, users in enumerate(recipients) if user_id in users)
+                groups.setdefault(key, []).append(user_id)
+
+        if broadcast:
+            data = b'{"messages":[' + b','.join(rendered[index] for index in broadcast) + b']}'
+            self.__post('/v2/bot/message/broadcast', data, retry_key)
+        for key, users in sorted(groups.items()):
+            body = b'"messages":[' + b','.join(rendered[index] for index in key) + b']}'
+            for start in range(0, len(users), MAX_RECIPIENTS_PER_REQUEST):
+                chunk = users[start:start + MAX_RECIPIENTS_PER_REQUEST]
+                if self.__post('/v2/bot/message/multicast',
+                               b'{"to":' + json.dumps(chunk).encode('utf-8') + b',' + body, retry_key):
+                    for index in key:
+                        metrics.MULTICAST_RECIPIENTS.inc(len(chunk), type=template_key(messages[index].title))
+
+    def __post(self, path: str, data: bytes, retry_key: str) -> bool:
+        '''
+        送信済みではないリクエストを送信します。
+
+        Args:
+            path (str): APIのパス
+            data (bytes): リクエストの本文
+            retry_key (str): バッチのリトライキー。リクエストのキーはこのキーと本文から求めます
+
+        Returns:
+            bool: 送信した場合True。リトライ前に送信済みだった場合False
+
+        Raises:
+            LineBotApiError: LINE APIがエラーを返した場合
+        '''
+        digest = hashlib.sha1(data).hexdigest()
+        if digest in self.__delivered:
+            return False
+        try:
+            with metrics.STAGE_SECONDS.time(stage=path.rsplit('/', 1)[-1]):
+                self.api.post(path, data, str(uuid.uuid5(uuid.UUID(retry_key), digest)))
+        except LineBotApiError as error:
+            # 前回のリクエストが届いていた場合は送信済みとして残りの宛先に送信する
+            if error.status_code != RETRY_KEY_ACCEPTED:
+                raise
+        self.__delivered.add(digest)
+        return True
+
+
+class DeliveryQueue():  # pylint: disable=R0902
+    '''
+    LINEへの送信待ちキュー。
+    ワーカースレッドが優先度の高い順に最大5件ずつ送信するため、取得処理は送信を待ちません。
+    - 429の場合はRetry-Afterの間送信を止めます
+    - 5xx・接続エラーの場合は指数バックオフでリトライします。リトライは同じメッセージの組み合わせと
+      リトライキー(X-Line-Retry-Key)で行うため、前回のリクエストが届いていた場合も二重に送信されません
+    - 送信していないメッセージはファイルに記録し、再起動後に送信します
+    '''
+
+    def __init__(self, journal_path: str, send: Callable[[List[Any], str], None],  # pylint: disable=R0913
+                 max_size: int = 1000, max_attempts: int = 5, backoff_factor: float = 1.0,
+                 max_backoff: float = 60.0):
+        self.send = send
+        self.max_size = max_size
+        self.max_attempts = max_attempts
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+
+        self.sent = 0
+        self.api_calls = 0
+        self.dropped = 0
+        self.retried = 0
+        # 最後に送信したメッセージの検知から送信までの時間(秒)
+        self.latency = 0.0
+
+        # (優先度, 番号, 要素)
+        self.__queue: List[Tuple[int, int, Dict[str, Any]]] = []
+        self.__in_flight = 0
+        self.__sequence = 0
+        self.__not_before = 0.0
+        self.__condition = threading.Condition()
+        self.__stopping = False
+        self.__workers: List[threading.Thread] = []
+
+        self.__journal = Journal(journal_path)
+        self.__restore()
+
+    def put(self, message: Any) -> bool:
+        '''
+        メッセージを追加します。
+        キューが一杯の場合は優先度の最も低いメッセージを破棄します。
+
+        Args:
+            message (Any): フォーマットした情報
+
+        Returns:
+            bool: 追加した場合True。追加するメッセージの優先度が最も低く破棄した場合False
+        '''
+        return self.put_many([message]) == 1
+
+    def put_many(self, messages: List[Any]) -> int:
+        '''
+        メッセージをまとめて追加します。
+        すべて追加してからワーカースレッドを起こすため、同時に追加したメッセージは優先度の高い順に最大5件ずつ送信されます。
+
+        Args:
+            messages (List[Any]): フォーマットした情報
+
+        Returns:
+            int: 追加した件数
+        '''
+        added = 0
+        with self.__condition:
+            for message in messages:
+                added += self.__push(message)
+            if added:
+                self.__condition.notify_all()
+        return added
+
+    def start(self, workers: int = 1):
+        '''
+        ワーカースレッドを起動します。
+
+        Args:
+            workers (int): スレッド数
+        '''
+        self.__stopping = False
+        for index in range(workers):
+            worker = threading.Thread(target=self.__run, name=f'delivery-{index}', daemon=True)
+            worker.start()
+            self.__workers.append(worker)
+
+    def stop(self, timeout: Optional[float] = None):
+        '''
+        ワーカースレッドを停止します。送信していないメッセージはファイルに残ります。
+
+        Args:
+            timeout (Optional[float]): 待機する最大時間(秒)
+        '''
+        with self.__condition:
+            self.__stopping = True
+            self.__condition.notify_all()
+        for worker in self.__workers:
+            worker.join(timeout)
+        self.__workers = []
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        '''
+        キューが空になるまで待機します。
+
+        Args:
+            timeout (Optional[float]): 待機する最大時間(秒)
+
+        Returns:
+            bool: 空になった場合True
+        '''
+        with self.__condition:
+            return self.__condition.wait_for(lambda: not self.__queue and not self.__in_flight, timeout)
+
+    def pending(self) -> List[Any]:
+        '''
+        送信待ちのメッセージを優先度の高い順に返します。(送信中のものを除く)
+
+        Returns:
+            List[Any]: メッセージ
+        '''
+        with self.__condition:
+            return [item['message'] for _, _, item in sorted(self.__queue)]
+
+    def stats(self) -> Dict[str, float]:
+        '''
+        キューの状態を返します。
+
+        Returns:
+            Dict[str, float]: depth: 送信待ちの件数、age: 最も古い送信待ちの経過時間(秒)、
+                sent: 送信した件数、api_calls: APIの呼び出し回数、dropped: 破棄した件数、retried: リトライ回数、
+                latency: 最後に送信したメッセージの検知から送信までの時間(秒)
+        '''
+        with self.__condition:
+            oldest = min((item['enqueued'] for _, _, item in self.__queue), default=None)
+            return {
+                'depth': len(self.__queue) + self.__in_flight,
+                'age': time.time() - oldest if oldest is not None else 0.0,
+                'sent': self.sent,
+                'api_calls': self.api_calls,
+                'dropped': self.dropped,
+                'retried': self.retried,
+                'latency': self.latency,
+            }
+
+    def __run(self):
+        '''
+        ワーカースレッドの処理。
+        '''
+        while True:
+            with self.__condition:
+                while not self.__stopping and (not self.__queue or time.time() < self.__not_before):
+                    wait = self.__not_before - time.time() if self.__queue else None
+                    self.__condition.wait(wait)
+                if self.__stopping:
+                    return
+                batch = self.__next_batch()
+                self.__in_flight += len(batch)
+
+            retry_after = self.__deliver([item for _, _, item in batch])
+
+            with self.__condition:
+                self.__in_flight -= len(batch)
+                if retry_after is not None:
+                    self.__not_before = max(self.__not_before, time.time() + retry_after)
+                    if batch[0][2]['attempts'] < self.max_attempts:
+                        self.__journal.append(['retry', batch[0][2]['retry_key'], [entry[2]['id'] for entry in batch]])
+                        for entry in batch:
+                            heapq.heappush(self.__queue, entry)
+                    else:
+                        for entry in batch:
+                            self.__drop(entry[2])
+                else:
+                    for entry in batch:
+                        self.__journal.append(['done', entry[2]['id']])
+                self.__compact()
+                self.__condition.notify_all()
+
+    def __push(self, message: Any) -> int:
+        '''
+        メッセージをキューに追加します。呼び出し元でロックを取得してください。
+
+        Args:
+            message (Any): フォーマットした情報
+
+        Returns:
+            int: 追加した場合1。追加するメッセージの優先度が最も低く破棄した場合0
+        '''
+        self.__sequence += 1
+        item = {'id': self.__sequence, 'enqueued': time.time(), 'attempts': 0, 'message': message}
+        entry = (message_priority(message), self.__sequence, item)
+        if len(self.__queue) >= self.max_size:
+            lowest = max(self.__queue)
+            if entry > lowest:
+                self.__drop(item)
+                return 0
+            self.__queue.remove(lowest)
+            heapq.heapify(self.__queue)
+            self.__drop(lowest[2])
+
+        self.__journal.append(['put', item['id'], item['enqueued'], message.to_dict()])
+        heapq.heappush(self.__queue, entry)
+        return 1
+
+    def __next_batch(self) -> List[Tuple[int, int, Dict[str, Any]]]:
+        '''
+        次に送信する要素を取り出します。呼び出し元でロックを取得してください。
+        リトライする要素は前回と同じ組み合わせ・リトライキーで、それ以外は優先度の高い順に最大5件を新しいキーで返します。
+
+        Returns:
+            List[Tuple[int, int, Dict[str, Any]]]: (優先度, 番号, 要素)
+        '''
+        retry_key = self.__queue[0][2].get('retry_key')
+        if retry_key is not None:
+            batch = sorted(entry for entry in self.__queue if entry[2].get('retry_key') == retry_key)
+            self.__queue = [entry for entry in self.__queue if entry[2].get('retry_key') != retry_key]
+            heapq.heapify(self.__queue)
+            return batch
+
+        batch = []
+        while (self.__queue and len(batch) < MAX_MESSAGES_PER_REQUEST
+               and self.__queue[0][2].get('retry_key') is None):
+            batch.append(heapq.heappop(self.__queue))
+        retry_key = str(uuid.uuid4())
+        for _, _, item in batch:
+            item['retry_key'] = retry_key
+        return batch
+
+    def __deliver(self, items: List[Dict[str, Any]]) -> Optional[float]:
+        '''
+        送信します。
+
+        Args:
+            items (List[Dict[str, Any]]): 送信する要素
+
+        Returns:
+            Optional[float]: リトライする場合は待機時間(秒)。送信した・リトライしない場合はNone
+        '''
+        self.api_calls += 1
+        started = time.time()
+        try:
+            self.send([item['message'] for item in items], items[0]['retry_key'])
+        except LineBotApiError as error:
+            if error.status_code == RETRY_KEY_ACCEPTED:
+                # 前回のリクエストが届いていた(応答を受け取る前に失敗した)ため、送信済みとする
+                LOGGER.info('LINE API already accepted retry key %s', items[0]['retry_key'])
+                self.__record_sent(items, started)
+                return None
+            if error.status_code == 429:
+                retry_after = self.__retry_after(error.headers)
+            elif error.status_code >= 500:
+                retry_after = self.__backoff(items)
+            else:
+                LOGGER.error('LINE API rejected %d messages: %s', len(items), error)
+                metrics.ERRORS.inc(len(items), kind='delivery_rejected')
+                self.dropped += len(items)
+                return None
+        except requests.exceptions.RequestException as error:
+            LOGGER.warning('Failed to connect to LINE API: %s', error)
+            retry_after = self.__backoff(items)
+        except Exception:  # pylint: disable=W0703
+            LOGGER.exception('Failed to deliver %d messages', len(items))
+            metrics.ERRORS.inc(len(items), kind='delivery_failed')
+            self.dropped += len(items)
+            return None
+        else:
+            self.__record_sent(items, started)
+            stats = self.stats()
+            LOGGER.info('Delivered %d messages (queue depth %d, oldest %.1fs)',
+                        len(items), stats['depth'] - len(items), stats['age'])
+            return None
+
+        for item in items:
+            item['attempts'] += 1
+        self.retried += len(items)
+        metrics.ERRORS.inc(kind='delivery_retry')
+        LOGGER.warning('Retrying %d messages in %.1fs', len(items), retry_after)
+        return retry_after
+
+    def __record_sent(self, items: List[Dict[str, Any]], started: float):
+        '''
+        送信した件数と、フィードで検知してから送信を開始するまでの時間をメッセージごとに記録します。
+
+        Args:
+            items (List[Dict[str, Any]]): 送信した要素
+            started (float): 送信を開始した時刻(UNIX時間)
+        '''
+        self.sent += len(items)
+        for item in items:
+            message_type = template_key(item['message'].title)
+            metrics.MESSAGES_SENT.inc(type=message_type)
+            detected_at = item['message'].detected_at
+            if detected_at is None:
+                continue
+            self.latency = started - detected_at
+            metrics.DELIVERY_LATENCY_SECONDS.observe(self.latency, type=message_type)
+            LOGGER.info('%s: broadcast %.3fs after detection (attempt %d)',
+                        item['message'].title.split('\n')[0], self.latency, item['attempts'] + 1)
+
+    def __retry_after(self, headers: Any) -> float:
+        '''
+        Retry-Afterヘッダの秒数を返します。無い場合はバックオフします。
+
+        Args:
+            headers (Any): レスポンスヘッダ
+
+        Returns:
+            float: 待機時間(秒)
+        '''
+        value = headers.get('Retry-After') if headers else None
+        if value is not None and value.strip().isdigit():
+            return float(value)
+        return self.backoff_factor * 2
+
+    def __backoff(self, items: List[Dict[str, Any]]) -> float:
+        '''
+        リトライまでの待機時間を返します。(Full Jitter)
+
+        Args:
+            items (List[Dict[str, Any]]): リトライする要素
+
+        Returns:
+            float: 待機時間(秒)
+        '''
+        attempts = max(item['attempts'] for item in items)
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempts))
+
+    def __drop(self, item: Dict[str, Any]):
+        '''
+        要素を破棄します。
+
+        Args:
+            item (Dict[str, Any]): 要素
+        '''
+        LOGGER.error('Dropped message: %s', item['message'].title)
+        metrics.ERRORS.inc(kind='delivery_dropped')
+        self.dropped += 1
+        self.__journal.append(['done', item['id']])
+
+    def __compact(self):
+        '''
+        送信済みの記録が溜まったらファイルを書き直します。
+        '''
+        if self.__journal.lines > 2 * (len(self.__queue) + self.__in_flight) + 100:
+            items = [item for _, _, item in sorted(self.__queue)]
+            retries: Dict[str, List[int]] = {}
+            for item in items:
+                if item['attempts']:
+                    retries.setdefault(item['retry_key'], []).append(item['id'])
+            self.__journal.compact(
+                [['put', item['id'], item['enqueued'], item['message'].to_dict()] for item in items]
+                + [['retry', retry_key, identifiers] for retry_key, identifiers in retries.items()])
+
+    def __restore(self):
+        '''
+        前回送信していなかったメッセージを読み込みます。
+        '''
+        pending: Dict[int, Tuple[float, Any]] = {}
+        retry_keys: Dict[int, str] = {}
+        for record in self.__journal.replay():
+            if not isinstance(record, list) or len(record) < 2:
+                continue
+            if record[0] == 'retry' and len(record) == 3:
+                # 前回リトライ中だった要素は、同じ組み合わせ・リトライキーで送信する
+                retry_keys.update((identifier, record[1]) for identifier in record[2])
+                continue
+            self.__sequence = max(self.__sequence, record[1])
+            if record[0] == 'put' and len(record) == 4:
+                pending[record[1]] = (record[2], record[3])
+            elif record[0] == 'done' and len(record) == 2:
+                pending.pop(record[1], None)
+
+        for identifier, (enqueued, values) in sorted(pending.items()):
+            try:
+                message = Event.from_dict(values)
+            except (KeyError, TypeError, ValueError):
+                # 形式の異なる(古いバージョンの)メッセージは送信せずに破棄する
+                LOGGER.warning('Discarded unreadable message in journal: %d', identifier)
+                self.__journal.append(['done', identifier])
+                continue
+            item = {'id': identifier, 'enqueued': enqueued, 'attempts': 0, 'message': message}
+            if identifier in retry_keys:
+                item['retry_key'] = retry_keys[identifier]
+                item['attempts'] = 1
+            heapq.heappush(self.__queue, (message_priority(message), identifier, item))
+        if self.__queue:
+            LOGGER.info('Restored %d undelivered messages', len(self.__queue))
@@ -1,34 +1,262 @@
 '''
 Copyright © 2020 YutoWatanabe
 '''
-import sys
-from typing import Any
+import collections
+import logging
+import os
+import time
+from typing import Any, Deque, Dict, List, Optional, Tuple
 
-import linebot
-from linebot.models import TextSendMessage
+from delivery import PRIORITY, message_priority
+from events import EpicenterIntensityReport, Event, Intensity, Notice
+from json_operation import json_read, json_write
+import metrics
+from template import template_key
 
+LOGGER = logging.getLogger(__name__)
 
-def stop(messages: Any, line_bot_api: linebot.LineBotApi):
-    '''
-    震度7を観測した場合、システムの動作を停止する。
-    震源・震度に関する情報の最大震度を取得する。
-    (通信網のパンクを防ぐため)
+DEGRADED_NOTICE = '''【配信を絞るおしらせ】
+
+先程、震度7を観測したためネットワークの混雑を避けるために「地震情報・速報」の配信を一時的に絞ります。
+緊急地震速報(警報)・津波の情報は引き続きお届けします。
+
+詳しい地震情報につきましては、「Yahoo!防災」「NERV防災」などのサービスをご利用ください。
+
+災害時には情報を過信しすぎず周りの状況を見て行動してください。'''
+
+RECOVERED_NOTICE = '''【配信再開のおしらせ】
+
+地震活動が落ち着いたため、「地震情報・速報」の配信を通常どおりに戻しました。'''
 
-    Args:
-        messages(Any): フォーマットしていない送信する内容。複数の内容がある。
-        line_bot_api: LINE API
+# 制限せずに送信する優先度(緊急地震速報(警報)・津波)
+URGENT_PRIORITY = PRIORITY['津波']
 
+
+class DegradedMode():  # pylint: disable=R0902
     '''
-    for message in messages:
-        if 'max_seismic_intensity' in message:
-            if message['max_seismic_intensity'] == '7':
-                text = '''【システム一時停止のおしらせ】
+    震度7を観測した場合に、停止する代わりに送信量を抑えるモード。(通信網のパンクを防ぐため)
+    - 優先度が`max_priority`より低い情報(震源に関する情報・緊急地震速報(予報)など)は送信しない
+    - 同じ地震(EventID)・種類の情報は最新の1件のみ
+    - 1分あたりの送信数を`max_per_minute`件までにする。緊急地震速報(警報)・津波は制限しない
+    上限を超えた情報は破棄せずに保留し(同じ地震・種類は最新のみ)、送信数に空きができてから送信します。
 
-先程、震度7を観測したためネットワークの混雑を避けるために「地震情報・速報」のサービスを一時停止いたします。
+    モードの切り替えはおしらせ(events.Notice)として送信する情報の先頭に追加します。
+    最後に情報を受信してから`cooldown`秒経過すると通常の配信に戻り、保留していた情報もすべて送信します。
+    `save_directory`を指定した場合は、再起動してもモードが続くように状態を`degraded.json`に保存します。
+    '''
 
-詳しい地震情報につきましては、「Yahoo!防災」「NERV防災」などのサービスをご利用ください。
+    def __init__(self, max_per_minute: int = 6, cooldown: float = 1800.0,
+                 max_priority: int = PRIORITY['震源・震度に関する情報'], save_directory: Optional[str] = None):
+        self.max_per_minute = max_per_minute
+        self.cooldown = cooldown
+        self.max_priority = max_priority
+        self.save_file_path = os.path.join(save_directory, 'degraded.json') if save_directory is not None else None
+        # 通常の配信に戻る時刻(UNIX時間)。Noneの場合は通常の配信
+        self.until: Optional[float] = None
+        self.entered_at: Optional[float] = None
+        # 直近1分間に送信した時刻
+        self.__sent: Deque[float] = collections.deque()
+        # 送信数の上限を超えたため保留している情報。{(EventID, 種類): 情報}
+        self.__held: Dict[Tuple[Any, str], Any] = {}
+        self.__load()
 
-災害時には情報を過信しすぎず周りの状況を見て行動してください。'''
+    def active(self, now: Optional[float] = None) -> bool:
+        '''
+        送信量を抑えているか返します。
+
+        Args:
+            now (Optional[float]): 現在時刻(UNIX時間)
+
+        Returns:
+            bool: 抑えている場合True
+        '''
+        return self.until is not None and (time.time() if now is None else now) < self.until
+
+    def expired(self, now: Optional[float] = None) -> bool:
+        '''
+        通常の配信に戻る時刻を過ぎているか返します。(filterを呼ぶと通常の配信に戻ります)
+
+        Args:
+            now (Optional[float]): 現在時刻(UNIX時間)
+
+        Returns:
+            bool: 過ぎている場合True
+        '''
+        return self.until is not None and (time.time() if now is None else now) >= self.until
+
+    def held(self) -> int:
+        '''
+        保留している情報の数を返します。
+
+        Returns:
+            int: 件数
+        '''
+        return len(self.__held)
+
+    def next_wait(self, now: Optional[float] = None) -> Optional[float]:
+        '''
+        保留している情報を送信できるまでの時間を返します。
+
+        Args:
+            now (Optional[float]): 現在時刻(UNIX時間)
+
+        Returns:
+            Optional[float]: 秒数。0の場合はfilterを呼ぶと送信できる。保留している情報が無い場合はNone
+        '''
+        if not self.__held:
+            return None
+        now = time.time() if now is None else now
+        if self.expired(now):
+            return 0.0
+        recent = [sent for sent in self.__sent if sent > now - 60]
+        if len(recent) < self.max_per_minute:
+            return 0.0
+        return recent[-self.max_per_minute] + 60 - now
+
+    def filter(self, urgent: List[Any], messages: List[Any], now: Optional[float] = None) -> List[Any]:
+        '''
+        震度7の情報を確認してモードを切り替え、送信するメッセージを返します。
+        `messages`が空の場合も、送信数に空きがあれば保留していた情報を返します。
+
+        Args:
+            urgent (List[Any]): 先に送信した情報(緊急地震速報)
+            messages (List[Any]): 送信する情報
+            now (Optional[float]): 現在時刻(UNIX時間)
+
+        Returns:
+            List[Any]: 送信する情報。切り替えた場合は先頭におしらせ。通常の配信では`messages`のまま
+        '''
+        now = time.time() if now is None else now
+        notices: List[Any] = []
+        released: List[Any] = []
+        if self.expired(now):
+            notices.append(self.__leave(now))
+            released = list(self.__held.values())
+            self.__held.clear()
+        # 保留していた情報(震度7を含む)ではモードを切り替えない
+        if any(isinstance(message, EpicenterIntensityReport) and message.max_intensity == Intensity.SEVEN
+               for message in urgent + messages) and self.until is None:
+            notices.append(self.__enter(now))
+        messages = released + messages
+        if self.until is None:
+            return notices + messages
+        if urgent or messages:
+            self.until = max(self.until, now + self.cooldown)
+        allowed = self.__shed(messages, now)
+        self.__save()
+        return notices + allowed
+
+    def __shed(self, messages: List[Any], now: float) -> List[Any]:
+        '''
+        送信するメッセージを絞ります。上限を超えた情報は保留し、保留していた情報と合わせて優先度の高い順に送信します。
+
+        Args:
+            messages (List[Any]): 送信する情報
+            now (float): 現在時刻(UNIX時間)
+
+        Returns:
+            List[Any]: 送信する情報
+        '''
+        while self.__sent and self.__sent[0] <= now - 60:
+            self.__sent.popleft()
+
+        # 同じ地震・種類の情報は新しいものを残す(保留していた情報より後に届いた情報が新しい)
+        candidates = list(self.__held.values()) + messages
+        first_new = len(self.__held)
+        latest = {}
+        for index, message in enumerate(candidates):
+            latest[(message.event_id, message.KIND)] = index
+        self.__held.clear()
+
+        allowed: List[Tuple[int, int]] = []
+        for priority, index in sorted((message_priority(message), index) for index, message in enumerate(candidates)):
+            message = candidates[index]
+            key = (message.event_id, message.KIND)
+            if priority <= URGENT_PRIORITY:
+                reason = None
+            elif priority > self.max_priority:
+                reason = 'suppressed'
+            elif latest[key] != index:
+                reason = 'coalesced'
+            elif len(self.__sent) >= self.max_per_minute:
+                self.__held[key] = message
+                # 既に保留していた情報は数えない
+                if index >= first_new:
+                    LOGGER.info('Held %s (rate_limited)', message.title.split('\n')[0])
+                    metrics.SHED.inc(type=template_key(message.title), reason='rate_limited')
+                continue
+            else:
+                reason = None
+                self.__sent.append(now)
+
+            if reason is None:
+                allowed.append((index, priority))
+            else:
+                LOGGER.info('Shed %s (%s)', message.title.split('\n')[0], reason)
+                metrics.SHED.inc(type=template_key(message.title), reason=reason)
+        return [candidates[index] for index, _ in sorted(allowed)]
+
+    def __enter(self, now: float) -> Any:
+        '''
+        送信量を抑えるモードに切り替えます。
+
+        Args:
+            now (float): 現在時刻(UNIX時間)
+
+        Returns:
+            Any: 送信するおしらせ
+        '''
+        self.until = now + self.cooldown
+        self.entered_at = now
+        self.__sent.clear()
+        self.__save()
+        LOGGER.warning('Seismic intensity 7 observed: entering degraded mode (%d messages/min)', self.max_per_minute)
+        metrics.MODE_TRANSITIONS.inc(mode='degraded')
+        return Notice(f'degraded-{now:.0f}', '', DEGRADED_NOTICE)
+
+    def __leave(self, now: float) -> Any:
+        '''
+        通常の配信に戻します。
+
+        Args:
+            now (float): 現在時刻(UNIX時間)
+
+        Returns:
+            Any: 送信するおしらせ
+        '''
+        LOGGER.warning('Activity subsided: leaving degraded mode after %.0fs (releasing %d held)',
+                       now - (self.entered_at or now), len(self.__held))
+        self.until = None
+        self.entered_at = None
+        self.__save()
+        metrics.MODE_TRANSITIONS.inc(mode='normal')
+        return Notice(f'recovered-{now:.0f}', '', RECOVERED_NOTICE)
+
+    def __save(self):
+        '''
+        状態(保留している情報を含む)をファイルに保存します。
+        '''
+        if self.save_file_path is not None:
+            json_write(self.save_file_path, {
+                'until': self.until, 'entered_at': self.entered_at,
+                'held': [message.to_dict() for message in self.__held.values()]})
 
-                line_bot_api.broadcast(TextSendMessage(text=text))
-                sys.exit('The operation was stopped normally because of the seismic intensity 7 was observed.')
+    def __load(self):
+        '''
+        ファイルから状態を読み込みます。
+        '''
+        if self.save_file_path is None or not os.path.isfile(self.save_file_path):
+            return
+        try:
+            state = json_read(self.save_file_path)
+            self.until = state['until']
+            self.entered_at = state['entered_at']
+            for values in state.get('held', []):
+                message = Event.from_dict(values)
+                self.__held[(message.event_id, message.KIND)] = message
+        except (KeyError, TypeError, ValueError):
+            LOGGER.warning('Discarded unreadable %s', self.save_file_path)
+            return
+        if self.until is not None:
+            LOGGER.warning('Resuming degraded mode until %s (%d held)',
+                           time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.until)), len(self.__held))
@@ -0,0 +1,429 @@
+'''
+Copyright © 2020 YutoWatanabe
+
+フォーマットした情報(送信するメッセージ)。情報の種類ごとにクラスを分け、`__slots__`で属性を固定します。
+エリアはJMXから取得したタプル(jmx.AreaItem)のまま保持し、表示用の文字列はテンプレートを適用する時に生成します。
+'''
+import copy
+import enum
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import geo
+import jmx
+
+# 震度ではない種類(震度５弱以上未入電など)のエリアの順位。閾値に関係なく送信します
+WARNING_RANK = 0
+
+
+class Intensity(enum.IntEnum):
+    '''
+    震度。大小を比較できます。
+    '''
+    ONE = 1
+    TWO = 2
+    THREE = 3
+    FOUR = 4
+    FIVE_LOWER = 5
+    FIVE_UPPER = 6
+    SIX_LOWER = 7
+    SIX_UPPER = 8
+    SEVEN = 9
+
+    @property
+    def code(self) -> str:
+        '''
+        JMXの表記。例: 5-
+        '''
+        return _CODES[self]
+
+    @property
+    def label(self) -> str:
+        '''
+        表示用の名前。例: 5弱
+        '''
+        return _CODES[self].replace('-', '弱').replace('+', '強')
+
+    @classmethod
+    def parse(cls, text: Optional[str]) -> Optional['Intensity']:
+        '''
+        震度を変換します。
+
+        Args:
+            text (Optional[str]): 震度。例: 震度５弱, 5弱, 5-
+
+        Returns:
+            Optional[Intensity]: 震度。震度ではない場合はNone
+        '''
+        if not text:
+            return None
+        normalized = unicodedata.normalize('NFKC', text).replace('震度', '').replace(' ', '')
+        return _BY_CODE.get(normalized.replace('弱', '-').replace('強', '+'))
+
+
+_CODES = {
+    Intensity.ONE: '1', Intensity.TWO: '2', Intensity.THREE: '3', Intensity.FOUR: '4',
+    Intensity.FIVE_LOWER: '5-', Intensity.FIVE_UPPER: '5+', Intensity.SIX_LOWER: '6-', Intensity.SIX_UPPER: '6+',
+    Intensity.SEVEN: '7',
+}
+_BY_CODE = {code: intensity for intensity, code in _CODES.items()}
+
+AreaItems = Tuple[jmx.AreaItem, ...]
+# (コード種別, エリアコード)。種別が異なるコード(細分区域と津波予報区など)は値が同じでも別のエリアです
+AreaKey = Tuple[str, str]
+
+
+def as_area_items(items: Optional[Iterable[Any]]) -> Optional[AreaItems]:
+    '''
+    エリアをタプルにします。JSONから読み込んだリストにも使用します。
+    コード種別の無い以前の形式は、種別を空文字列にして読み込みます。
+
+    Args:
+        items (Optional[Iterable[Any]]): [(種類, (エリア名, ...), (エリアコード, ...), コード種別)]
+
+    Returns:
+        Optional[AreaItems]: エリア。Noneの場合はNone
+    '''
+    if items is None:
+        return None
+    return tuple((kind, tuple(names), tuple(codes), code_type[0] if code_type else '')
+                 for kind, names, codes, *code_type in items)
+
+
+def area_targets(items: Optional[Iterable[jmx.AreaItem]]) -> Dict[AreaKey, int]:
+    '''
+    情報に含まれるエリアと、そのエリアの震度の順位を返します。
+
+    Args:
+        items (Optional[Iterable[jmx.AreaItem]]): [('震度4', ('エリア1',), ('コード1',), '地震情報／細分区域')]
+
+    Returns:
+        Dict[AreaKey, int]: {(コード種別, エリアコード): 順位}。震度ではない種類(震度５弱以上未入電など)はWARNING_RANK
+    '''
+    targets: Dict[AreaKey, int] = {}
+    for kind, _, codes, code_type in items or ():
+        rank = Intensity.parse(kind) or WARNING_RANK
+        for code in codes:
+            if code:
+                key = (code_type, code)
+                targets[key] = max(targets.get(key, WARNING_RANK), rank)
+    return targets
+
+
+def format_areas(items: Optional[Iterable[jmx.AreaItem]]) -> List[str]:
+    '''
+    震度とエリアの情報をフォーマットします。
+
+    Args:
+        items (Optional[Iterable[jmx.AreaItem]]): [('震度4', ('エリア1',), ('コード1',), '地震情報／細分区域'), ...]
+
+    Returns:
+        List[str]: フォーマットされたデータ。例: ['[震度4] エリア1', '[震度3] エリア2、エリア3']
+    '''
+    return [f'[{kind}] {"、".join(names)}' for kind, names, _, _ in items or ()]
+
+
+class Event():
+    '''
+    フォーマットした情報。
+
+    Attributes:
+        event_id (str): EventID
+        url (str): 詳細情報のURL
+        body (str): 本文
+        report (int): 第何報か
+        detected_at (Optional[float]): フィードで検知した時刻(UNIX時間)
+    '''
+    __slots__ = ('event_id', 'url', 'body', 'report', 'detected_at')
+    # to_dict・from_dictで使用する種類の名前
+    KIND = ''
+    TITLE = ''
+    # to_dictで保存する属性(基本の属性以外)
+    FIELDS: Tuple[str, ...] = ()
+
+    def __init__(self, event_id: Any, url: str, body: str, report: int = 1, detected_at: Optional[float] = None):
+        self.event_id = event_id
+        self.url = url
+        self.body = body
+        self.report = report
+        self.detected_at = detected_at
+
+    @property
+    def title(self) -> str:
+        '''
+        タイトル。第2報以降は2行目に`第n報`を付けます。
+        '''
+        if self.report > 1:
+            return f'{self.TITLE}\n第{self.report}報'
+        return self.TITLE
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        '''
+        投稿済みの記録に使用するキー。{'event_id': EventID, 'url': 詳細情報のURL}
+        '''
+        return {'event_id': self.event_id, 'url': self.url}
+
+    def detected(self, detected_at: float) -> 'Event':
+        '''
+        検知した時刻を設定したコピーを返します。キャッシュした情報は変更しません。
+
+        Args:
+            detected_at (float): フィードで検知した時刻(UNIX時間)
+
+        Returns:
+            Event: コピー
+        '''
+        event = copy.copy(self)
+        event.detected_at = detected_at
+        return event
+
+    def targets(self) -> Dict[AreaKey, int]:
+        '''
+        送信先のエリアと震度の順位。空の場合はエリアで絞り込みません。
+
+        Returns:
+            Dict[AreaKey, int]: {(コード種別, エリアコード): 順位}
+        '''
+        return {}
+
+    def hypocenter(self) -> Optional[Dict[str, Any]]:
+        '''
+        送信先を距離で絞り込むための震源。
+
+        Returns:
+            Optional[Dict[str, Any]]: {'latitude', 'longitude', 'depth', 'radius'}。震源の無い情報はNone
+        '''
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        '''
+        状態ファイル(送信待ちキュー)に保存する形式にします。
+
+        Returns:
+            Dict[str, Any]: JSONにできるDict
+        '''
+        values = {'kind': self.KIND, 'event_id': self.event_id, 'url': self.url, 'body': self.body}
+        if self.report > 1:
+            values['report'] = self.report
+        if self.detected_at is not None:
+            values['detected_at'] = self.detected_at
+        for name in self.FIELDS:
+            values[name] = getattr(self, name)
+        return values
+
+    @staticmethod
+    def from_dict(values: Dict[str, Any]) -> 'Event':
+        '''
+        to_dictの形式から復元します。
+
+        Args:
+            values (Dict[str, Any]): to_dictの形式
+
+        Returns:
+            Event: 情報
+
+        Raises:
+            KeyError: 種類・属性が不足している場合
+        '''
+        cls = _KINDS[values['kind']]
+        event = cls.__new__(cls)
+        Event.__init__(event, values['event_id'], values['url'], values['body'],
+                       values.get('report', 1), values.get('detected_at'))
+        for name in cls.FIELDS:
+            setattr(event, name, values[name])
+        event.restore()
+        return event
+
+    def restore(self):
+        '''
+        from_dictで読み込んだ属性を変換します。(JSONのリストをタプルに戻すなど)
+        '''
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.event_id!r}, {self.url!r})'
+
+
+class IntensityReport(Event):
+    '''
+    震度速報。
+    '''
+    __slots__ = ('info', 'area_items')
+    KIND = 'intensity'
+    TITLE = '震度速報'
+    FIELDS = ('info', 'area_items')
+
+    def __init__(self, event_id: Any, url: str, body: str, info: Optional[str],  # pylint: disable=R0913
+                 area_items: Optional[AreaItems]):
+        super().__init__(event_id, url, body)
+        self.info = info
+        self.area_items = area_items
+
+    @property
+    def areas(self) -> List[str]:
+        '''
+        表示する震度ごとのエリア。
+        '''
+        if self.area_items is None:
+            return ['[N/A] No data.']
+        return format_areas(self.area_items)
+
+    def targets(self) -> Dict[AreaKey, int]:
+        return area_targets(self.area_items)
+
+    def restore(self):
+        self.area_items = as_area_items(self.area_items)
+
+
+class EpicenterReport(Event):
+    '''
+    震源に関する情報。
+    '''
+    __slots__ = ('magnitude', 'area', 'info', 'coordinate')
+    KIND = 'epicenter'
+    TITLE = '震源に関する情報'
+    FIELDS: Tuple[str, ...] = ('magnitude', 'area', 'info', 'coordinate')
+
+    def __init__(self, event_id: Any, url: str, body: str, magnitude: Optional[str],  # pylint: disable=R0913
+                 area: Optional[str], info: Optional[str], coordinate: Optional[jmx.Coordinate]):
+        super().__init__(event_id, url, body)
+        self.magnitude = magnitude
+        self.area = area
+        self.info = info
+        self.coordinate = coordinate
+
+    def hypocenter(self) -> Optional[Dict[str, Any]]:
+        return geo.hypocenter(self.coordinate, self.magnitude)
+
+    def restore(self):
+        if self.coordinate is not None:
+            self.coordinate = jmx.Coordinate(*self.coordinate)
+
+
+class EpicenterIntensityReport(EpicenterReport):
+    '''
+    震源・震度に関する情報。
+    '''
+    __slots__ = ('max_intensity', 'has_information', 'area_items', 'region_items')
+    KIND = 'epicenter_intensity'
+    TITLE = '震源・震度に関する情報'
+    FIELDS = EpicenterReport.FIELDS + ('max_intensity', 'has_information', 'area_items', 'region_items')
+
+    def __init__(self, event_id: Any, url: str, body: str, magnitude: Optional[str],  # pylint: disable=R0913
+                 area: Optional[str], info: Optional[str], coordinate: Optional[jmx.Coordinate],
+                 max_intensity: Optional[Intensity], has_information: bool,
+                 area_items: Optional[AreaItems], region_items: AreaItems):
+        super().__init__(event_id, url, body, magnitude, area, info, coordinate)
+        self.max_intensity = max_intensity
+        self.has_information = has_information
+        # 市町村等・細分区域ごとの震度
+        self.area_items = area_items
+        self.region_items = region_items
+
+    @property
+    def max_seismic_intensity(self) -> str:
+        '''
+        表示する最大震度。例: 5-
+        '''
+        return self.max_intensity.code if self.max_intensity is not None else 'None'
+
+    @property
+    def areas(self) -> Optional[List[str]]:
+        '''
+        表示する震度ごとの市町村。震度の情報が無い場合はNone
+        '''
+        if not self.has_information:
+            return None
+        if self.area_items is None:
+            return ['[Null] No data.']
+        return format_areas(self.area_items)
+
+    def targets(self) -> Dict[AreaKey, int]:
+        return area_targets((self.area_items or ()) + self.region_items)
+
+    def restore(self):
+        super().restore()
+        if self.max_intensity is not None:
+            self.max_intensity = Intensity(self.max_intensity)
+        self.area_items = as_area_items(self.area_items)
+        self.region_items = as_area_items(self.region_items) or ()
+
+
+class EarlyWarningForecast(Event):
+    '''
+    緊急地震速報(予報)。
+    '''
+    __slots__ = ()
+    KIND = 'eew_forecast'
+    TITLE = '緊急地震速報(予報)'
+
+
+class EarlyWarningAlarm(Event):
+    '''
+    緊急地震速報(警報)。
+    対象地域(府県予報区)と購読者が登録する細分区域・市町村等の対応が無いため、地域で絞り込まずにすべての購読者に送信します。
+    '''
+    __slots__ = ('area_items',)
+    KIND = 'eew_alarm'
+    TITLE = '緊急地震速報 (警報)'
+    FIELDS = ('area_items',)
+
+    def __init__(self, event_id: Any, url: str, body: str, area_items: AreaItems):
+        super().__init__(event_id, url, body)
+        self.area_items = area_items
+
+    @property
+    def areas(self) -> List[str]:
+        '''
+        表示する警報の対象地域。
+        '''
+        return ['、'.join(names) for _, names, _, _ in self.area_items]
+
+    def restore(self):
+        self.area_items = as_area_items(self.area_items) or ()
+
+
+class Tsunami(Event):
+    '''
+    津波警報・注意報・予報。タイトルは情報に含まれるものを使用します。
+    予報区(津波予報区)と購読者が登録する細分区域・市町村等の対応が無いため、地域で絞り込まずにすべての購読者に送信します。
+    '''
+    __slots__ = ('tsunami_title', 'area_items')
+    KIND = 'tsunami'
+    FIELDS = ('tsunami_title', 'area_items')
+
+    def __init__(self, event_id: Any, url: str, body: str, tsunami_title: str,  # pylint: disable=R0913
+                 area_items: Optional[AreaItems]):
+        super().__init__(event_id, url, body)
+        self.tsunami_title = tsunami_title
+        self.area_items = area_items
+
+    @property
+    def title(self) -> str:
+        return self.tsunami_title
+
+    @property
+    def area(self) -> Optional[str]:
+        '''
+        表示する種類ごとの予報区。予報区の無い情報(津波予報など)はNone
+        '''
+        if self.area_items is None:
+            return None
+        return '\n'.join(format_areas(self.area_items))
+
+    def restore(self):
+        self.area_items = as_area_items(self.area_items)
+
+
+class Notice(Event):
+    '''
+    運用のおしらせ(震度7で配信を絞る・通常の配信に戻るなど)。地域で絞り込まずにすべての購読者に送信します。
+    '''
+    __slots__ = ()
+    KIND = 'notice'
+    TITLE = 'おしらせ'
+
+
+_KINDS = {cls.KIND: cls for cls in (
+    IntensityReport, EpicenterReport, EpicenterIntensityReport, EarlyWarningForecast, EarlyWarningAlarm, Tsunami,
+    Notice)}
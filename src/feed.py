@@ -0,0 +1,175 @@
+'''
+Copyright © 2020 YutoWatanabe
+'''
+import calendar
+import io
+import re
+import time
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, Iterator, NamedTuple, Optional, Sequence
+from urllib.parse import urlparse
+
+ATOM = '{http://www.w3.org/2005/Atom}'
+ENTRY = f'{ATOM}entry'
+
+JMA_FEED_URL = 'http://www.data.jma.go.jp/developer/xml/feed/{name}.xml'
+# 気象庁のフィード。それぞれ高頻度(直近の約10分)と長期(`_l`)の2種類がある
+JMA_FEEDS = ('eqvol', 'extra', 'regular', 'other')
+# 詳細情報を取得するホスト。フィードの内容は外部(WebSubのハブ)から届くため、これ以外のURLは取得しない
+JMA_DETAIL_HOSTS = ('www.data.jma.go.jp',)
+
+_TIME_PATTERN = re.compile(r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(?:\.\d+)?(Z|[+-]\d{2}:?\d{2})?')
+
+
+class Entry(NamedTuple):
+    '''
+    フィードのエントリ。
+    '''
+    id: str
+    title: str
+    updated: str
+    url: str
+
+    def to_cursor(self) -> Dict[str, str]:
+        '''
+        このエントリをカーソルとして保存できる形式にします。
+
+        Returns:
+            Dict[str, str]: {'id': エントリID, 'updated': 更新日時}
+        '''
+        return {'id': self.id, 'updated': self.updated}
+
+
+class FeedSource(NamedTuple):
+    '''
+    ポーリングするフィード。
+    '''
+    name: str
+    url: str
+    # 高頻度フィードがカーソルより先に進んでしまった場合に、取りこぼしを補う長期フィードのURL
+    backfill_url: Optional[str] = None
+
+
+def jma_feed(name: str) -> FeedSource:
+    '''
+    気象庁のフィードを返します。長期フィードで取りこぼしを補います。
+
+    Args:
+        name (str): フィードの名前。eqvol, extra, regular, other
+
+    Returns:
+        FeedSource: フィード
+    '''
+    return FeedSource(name, JMA_FEED_URL.format(name=name), JMA_FEED_URL.format(name=f'{name}_l'))
+
+
+def is_allowed_url(url: str, hosts: Optional[Sequence[str]]) -> bool:
+    '''
+    詳細情報を取得してよいURLか判定します。
+
+    Args:
+        url (str): 詳細情報のURL
+        hosts (Optional[Sequence[str]]): 取得してよいホスト。Noneの場合は制限しない
+
+    Returns:
+        bool: http(s)で`hosts`のいずれかのURLの場合True
+    '''
+    if hosts is None:
+        return True
+    parsed = urlparse(url)
+    return parsed.scheme in ('http', 'https') and parsed.hostname in hosts
+
+
+def parse_time(text: str) -> float:
+    '''
+    Atomの日時(RFC3339)をUNIX時間に変換します。
+
+    Args:
+        text (str): 日時。例: 2020-04-22T13:02:00Z, 2020-04-22T22:02:00+09:00
+
+    Returns:
+        float: UNIX時間。解析できない場合は0。
+    '''
+    match = _TIME_PATTERN.match(text.strip())
+    if match is None:
+        return 0.0
+    timestamp = calendar.timegm(time.strptime(match.group(1), r'%Y-%m-%dT%H:%M:%S'))
+    offset = match.group(2)
+    if offset and offset != 'Z':
+        sign = -1 if offset[0] == '-' else 1
+        digits = offset[1:].replace(':', '')
+        timestamp -= sign * (int(digits[:2]) * 3600 + int(digits[2:]) * 60)
+    return float(timestamp)
+
+
+class FeedReader():  # pylint: disable=R0903
+    '''
+    Atomフィードを逐次読み込み、新しいエントリを新しい順に返します。
+    前回保存したカーソル(最後に処理したエントリのIDと更新日時)に到達した時点で読み込みを終了します。
+    '''
+
+    def __init__(self, cursor: Optional[Dict[str, Any]] = None):
+        self.cursor = cursor
+        self.cursor_time = parse_time(cursor['updated']) if cursor else 0.0
+        self.reached_cursor = False
+        self.read_entries = 0
+
+    def read(self, content: bytes) -> Iterator[Entry]:
+        '''
+        フィードを読み込みます。
+        エントリを読み終えるごとに要素を破棄するため、フィード全体をメモリに保持しません。
+
+        Args:
+            content (bytes): フィードの内容
+
+        Yields:
+            Entry: カーソルより新しいエントリ
+        '''
+        self.reached_cursor = False
+        self.read_entries = 0
+        root = None
+        for event, element in ET.iterparse(io.BytesIO(content), events=('start', 'end')):
+            if root is None:
+                root = element
+            if event != 'end' or element.tag != ENTRY:
+                continue
+
+            entry = self.__to_entry(element)
+            root.clear()
+            self.read_entries += 1
+            if self.__is_cursor(entry):
+                self.reached_cursor = True
+                return
+            yield entry
+
+    def __is_cursor(self, entry: Entry) -> bool:
+        '''
+        カーソルに到達したか判定します。
+
+        Args:
+            entry (Entry): エントリ
+
+        Returns:
+            bool: カーソルのエントリ、またはそれより古いエントリの場合True
+        '''
+        if self.cursor is None:
+            return False
+        return entry.id == self.cursor['id'] or parse_time(entry.updated) < self.cursor_time
+
+    @staticmethod
+    def __to_entry(element: ET.Element) -> Entry:
+        '''
+        entry要素を変換します。
+
+        Args:
+            element (ET.Element): entry要素
+
+        Returns:
+            Entry: エントリ
+        '''
+        link = element.find(f'{ATOM}link')
+        return Entry(
+            id=element.findtext(f'{ATOM}id', ''),
+            title=element.findtext(f'{ATOM}title', ''),
+            updated=element.findtext(f'{ATOM}updated', ''),
+            url=link.get('href', '') if link is not None else '')
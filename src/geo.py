@@ -0,0 +1,100 @@
+'''
+Copyright © 2020 YutoWatanabe
+'''
+import math
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+from jmx import Coordinate
+
+# 地球の平均半径(km)
+EARTH_RADIUS = 6371.0088
+
+
+def impact_radius(magnitude: Optional[str], minimum: float = 30.0, maximum: float = 1000.0) -> Optional[float]:
+    '''
+    マグニチュードから揺れを感じる範囲の目安(震央からの距離)を返します。
+    log10(R) = 0.5M - 0.8 (M4: 約16km, M5: 約50km, M6: 約160km, M7: 約500km)
+
+    Args:
+        magnitude (Optional[str]): マグニチュード。例: 7.6
+        minimum (float): 最小の半径(km)
+        maximum (float): 最大の半径(km)
+
+    Returns:
+        Optional[float]: 半径(km)。マグニチュードが不明(NaN・M8を超える等)の場合はNone
+    '''
+    try:
+        value = float(magnitude or '')
+    except ValueError:
+        return None
+    if math.isnan(value):
+        return None
+    return min(max(10 ** (0.5 * value - 0.8), minimum), maximum)
+
+
+def hypocenter(coordinate: Optional[Coordinate], magnitude: Optional[str]) -> Optional[Dict[str, Any]]:
+    '''
+    フォーマットした情報に含める震源を返します。
+
+    Args:
+        coordinate (Optional[Coordinate]): 震源の位置
+        magnitude (Optional[str]): マグニチュード
+
+    Returns:
+        Optional[Dict[str, Any]]: {'latitude', 'longitude', 'depth', 'radius'}。位置・マグニチュードが不明の場合はNone
+    '''
+    radius = impact_radius(magnitude)
+    if coordinate is None or radius is None:
+        return None
+    return {
+        'latitude': coordinate.latitude,
+        'longitude': coordinate.longitude,
+        'depth': coordinate.depth,
+        'radius': radius,
+    }
+
+
+class LocationIndex():
+    '''
+    地点(購読者の位置・エリアの代表点など)の配列。
+    震源からの距離で地点をまとめて絞り込みます。ラジアン・cos(緯度)は生成時に一度だけ求めます。
+    '''
+
+    def __init__(self, keys: Sequence[str], latitudes: Sequence[float], longitudes: Sequence[float],
+                 values: Optional[Sequence[float]] = None):
+        self.keys = np.asarray(keys, dtype=object)
+        self.latitudes = np.radians(np.asarray(latitudes, dtype=np.float64))
+        self.longitudes = np.radians(np.asarray(longitudes, dtype=np.float64))
+        self.cos_latitudes = np.cos(self.latitudes)
+        # 地点ごとの値(購読者の震度の閾値など)
+        self.values = np.asarray(values if values is not None else np.zeros(len(self.keys)), dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def within(self, latitude: float, longitude: float, radius: float,
+               max_value: Optional[float] = None) -> np.ndarray:
+        '''
+        震央から`radius`km以内の地点を返します。
+
+        Args:
+            latitude (float): 緯度(度)
+            longitude (float): 経度(度)
+            radius (float): 半径(km)
+            max_value (Optional[float]): 指定した場合は値がこれ以下の地点のみ
+
+        Returns:
+            np.ndarray: 地点のキー
+        '''
+        origin = math.radians(latitude)
+        # 半径を角度にした値のsin^2(haversine)と比較し、arcsin・sqrtを省く
+        limit = math.sin(min(radius / EARTH_RADIUS, math.pi) / 2) ** 2
+        sin_latitude = np.sin((self.latitudes - origin) / 2)
+        sin_longitude = np.sin((self.longitudes - math.radians(longitude)) / 2)
+        haversine = sin_latitude * sin_latitude + math.cos(origin) * self.cos_latitudes * sin_longitude * sin_longitude
+        mask = haversine <= limit
+        if max_value is not None:
+            mask &= self.values <= max_value
+        return self.keys[mask]
@@ -0,0 +1,179 @@
+'''
+Copyright © 2020 YutoWatanabe
+'''
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# 指定しない場合にリトライするメソッド。POSTは二重に処理される場合があるため、呼び出し元が指定した場合のみ
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+
+
+class HttpClient():  # pylint: disable=R0902
+    '''
+    コネクションプールを共有するHTTPクライアント。
+    タイムアウトを設定し、冪等なメソッドが失敗した場合は指数バックオフ(ジッターあり)でリトライします。
+    429の場合はRetry-Afterの間待ちます。(`max_backoff`より長い場合はリトライせずにレスポンスを返します)
+    '''
+
+    def __init__(self, pool_size: int = 10, connect_timeout: float = 3.05,  # pylint: disable=R0913
+                 read_timeout: float = 10.0, retries: int = 3, backoff_factor: float = 0.5,
+                 max_backoff: float = 10.0):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.retried = 0
+        self.__lock = threading.Lock()
+
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = 'LINE-alert-bot'
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        '''
+        GETリクエストを送信します。
+        接続エラー・タイムアウト・一時的なエラー(429, 5xx)の場合はリトライします。
+
+        Args:
+            url (str): URL
+            headers (Optional[Dict[str, str]]): 追加するヘッダ
+
+        Returns:
+            requests.Response: レスポンス。リトライしても失敗した場合は最後のレスポンス。
+
+        Raises:
+            requests.exceptions.RequestException: リトライしても接続できなかった場合
+        '''
+        return self.request('GET', url, headers=headers)
+
+    def post(self, url: str, data: Any = None, headers: Optional[Dict[str, str]] = None,
+             retry: bool = False) -> requests.Response:
+        '''
+        POSTリクエストを送信します。
+        デフォルトではリトライしません。二重に処理されても問題ない場合のみ`retry`を指定してください。
+
+        Args:
+            url (str): URL
+            data (Any): 送信する内容
+            headers (Optional[Dict[str, str]]): 追加するヘッダ
+            retry (bool): getと同じ条件でリトライするか
+
+        Returns:
+            requests.Response: レスポンス
+
+        Raises:
+            requests.exceptions.RequestException: 接続できなかった場合
+        '''
+        return self.request('POST', url, retry=retry, data=data, headers=headers)
+
+    def request(self, method: str, url: str, retry: Optional[bool] = None, **kwargs: Any) -> requests.Response:
+        '''
+        リクエストを送信します。
+
+        Args:
+            method (str): HTTPメソッド
+            url (str): URL
+            retry (Optional[bool]): リトライするか。Noneの場合は冪等なメソッド(GETなど)のみリトライします
+            **kwargs (Any): requests.Session.requestの引数
+
+        Returns:
+            requests.Response: レスポンス
+
+        Raises:
+            requests.exceptions.RequestException: リトライしても接続できなかった場合
+        '''
+        retries = self.retries if (method.upper() in IDEMPOTENT_METHODS if retry is None else retry) else 0
+        attempt = 0
+        while True:
+            try:
+                responce = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt >= retries:
+                    raise
+                wait = self.__backoff(attempt)
+            else:
+                if responce.status_code not in RETRY_STATUS or attempt >= retries:
+                    return responce
+                wait = self.__backoff(attempt)
+                if responce.status_code == 429:
+                    retry_after = _retry_after(responce.headers.get('Retry-After'))
+                    if retry_after is not None:
+                        if retry_after > self.max_backoff:
+                            return responce
+                        wait = retry_after
+                responce.close()
+
+            time.sleep(wait)
+            attempt += 1
+            with self.__lock:
+                self.retried += 1
+
+    def stats(self) -> Dict[str, int]:
+        '''
+        コネクションの統計を返します。
+
+        Returns:
+            Dict[str, int]: requests: リクエスト数、new: 新規接続数、reused: 再利用した接続数、retried: リトライ数
+        '''
+        pools = self.adapter.poolmanager.pools
+        total_requests = 0
+        new_connections = 0
+        for key in pools.keys():
+            pool = pools[key]
+            total_requests += pool.num_requests
+            new_connections += pool.num_connections
+
+        return {
+            'requests': total_requests,
+            'new': new_connections,
+            'reused': max(total_requests - new_connections, 0),
+            'retried': self.retried,
+        }
+
+    def close(self):
+        '''
+        コネクションプールを閉じます。
+        '''
+        self.session.close()
+
+    def __backoff(self, attempt: int) -> float:
+        '''
+        リトライまでの待機時間を返します。(Full Jitter)
+
+        Args:
+            attempt (int): 何回目のリトライか(0から)
+
+        Returns:
+            float: 待機時間(秒)
+        '''
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+    '''
+    Retry-Afterヘッダの待機時間を返します。
+
+    Args:
+        value (Optional[str]): ヘッダの値(秒数またはHTTP日付)
+
+    Returns:
+        Optional[float]: 待機時間(秒)。ヘッダが無い・読めない場合はNone
+    '''
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,282 @@
+'''
+Copyright © 2020 YutoWatanabe
+'''
+import io
+import re
+import xml.etree.ElementTree as ET
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+NAMESPACES = {
+    'jmx': 'http://xml.kishou.go.jp/jmaxml1/',
+    'ib': 'http://xml.kishou.go.jp/jmaxml1/informationBasis1/',
+    'seis': 'http://xml.kishou.go.jp/jmaxml1/body/seismology1/',
+    'jmx_eb': 'http://xml.kishou.go.jp/jmaxml1/elementBasis1/',
+}
+
+_PREFIX_PATTERN = re.compile(r'([A-Za-z_]+):(?=[A-Za-z_])')
+_PREDICATE_PATTERN = re.compile(r'\[[^\]]*\]')
+_TAG_PATTERN = re.compile(r'(?:\{[^}]*\})?[^/{]+')
+
+_COORDINATE_PATTERN = re.compile(r'([+-][\d.]+)([+-][\d.]+)([+-][\d.]+)?/')
+
+# (種類, (エリア名, ...), (エリアコード, ...), コード種別(Areas/@codeType))
+AreaItem = Tuple[str, Tuple[str, ...], Tuple[str, ...], str]
+
+# 震度の情報のコード種別。同じ値のコードでも種別が異なる場合は別のエリアです
+REGION_CODE_TYPE = '地震情報／細分区域'
+CITY_CODE_TYPE = '地震情報／市町村等'
+
+
+class Coordinate(NamedTuple):
+    '''
+    震源の位置。
+
+    Attributes:
+        latitude (float): 緯度(度)
+        longitude (float): 経度(度)
+        depth (Optional[float]): 深さ(km)。不明の場合はNone
+    '''
+    latitude: float
+    longitude: float
+    depth: Optional[float]
+
+
+def compile_path(path: str) -> str:
+    '''
+    接頭辞付きのパスを名前空間URI付きのパスに変換します。
+
+    Args:
+        path (str): パス。例: ib:Head/ib:Headline/ib:Text
+
+    Returns:
+        str: ElementTreeで使用するパス。例: {http://...}Head/{http://...}Headline/{http://...}Text
+    '''
+    return _PREFIX_PATTERN.sub(lambda match: '{' + NAMESPACES[match.group(1)] + '}', path)
+
+
+def information_items(element: ET.Element) -> List[AreaItem]:
+    '''
+    Information要素から種類ごとのエリアを取得します。
+    ItemやAreaが1つだけの場合も同じ形式で返します。
+
+    Args:
+        element (ET.Element): Information要素
+
+    Returns:
+        List[AreaItem]: [('震度4', ('エリア1', 'エリア2'), ('コード1', 'コード2'), '地震情報／細分区域')]
+    '''
+    items = []
+    for item in element.iterfind(_ITEM):
+        areas = item.findall(_AREA)
+        code_type = item.find(_AREAS)
+        items.append((
+            item.findtext(_KIND_NAME, ''),
+            tuple(area.findtext(_AREA_NAME, '') for area in areas),
+            tuple(area.findtext(_AREA_CODE, '') for area in areas),
+            code_type.get('codeType', '') if code_type is not None else ''))
+    return items
+
+
+def parse_coordinate(element: ET.Element) -> Optional[Coordinate]:
+    '''
+    jmx_eb:Coordinate要素(ISO 6709)を変換します。
+    度(+37.5+137.3-10000/)・度分(+3730.0+13718.0-10000/)のどちらにも対応します。
+
+    Args:
+        element (ET.Element): jmx_eb:Coordinate要素
+
+    Returns:
+        Optional[Coordinate]: 震源の位置。震源要素不明などで値が無い場合はNone
+    '''
+    match = _COORDINATE_PATTERN.match((element.text or '').strip())
+    if match is None:
+        return None
+    latitude, longitude, height = match.groups()
+    return Coordinate(
+        _degrees(latitude, 2), _degrees(longitude, 3), -float(height) / 1000 if height is not None else None)
+
+
+def _degrees(text: str, digits: int) -> float:
+    '''
+    ISO 6709の緯度・経度を度に変換します。
+
+    Args:
+        text (str): 符号付きの値。例: +37.5, +3730.0, +373015
+        digits (int): 度の桁数。緯度は2、経度は3
+
+    Returns:
+        float: 度
+    '''
+    sign = -1.0 if text[0] == '-' else 1.0
+    integer, _, fraction = text[1:].partition('.')
+    # 度・分・秒。小数部は最後の単位に付く
+    parts = [part for part in (integer[:digits], integer[digits:digits + 2], integer[digits + 2:]) if part]
+    if fraction:
+        parts[-1] += '.' + fraction
+    return sign * sum(float(part) / 60 ** index for index, part in enumerate(parts))
+
+
+class Field(NamedTuple):
+    '''
+    取得する値の定義。
+
+    Attributes:
+        path (str): Report要素からのパス
+        attribute (Optional[str]): 取得する属性名。Noneの場合はテキストを取得
+        parse (Optional[Callable[[ET.Element], Any]]): 要素を変換する関数。指定した場合はattributeより優先
+        default (Any): 要素が存在しない場合の値
+    '''
+    path: str
+    attribute: Optional[str] = None
+    parse: Optional[Callable[[ET.Element], Any]] = None
+    default: Any = None
+
+
+class Extractor():  # pylint: disable=R0903
+    '''
+    JMX(気象庁防災情報XML)から必要な値のみを取得します。
+    パスは生成時に一度だけ変換し、解析中は必要なパス以外の要素を破棄します。
+    '''
+
+    def __init__(self, fields: Dict[str, Union[str, Field]]):
+        self.fields: List[Tuple[str, str, Field]] = []
+        # 必要なパスをタグごとの木構造にする。葉(取得する要素)以下はすべて残す
+        self.tree: Dict[str, Any] = {}
+        for name, field in fields.items():
+            if isinstance(field, str):
+                field = Field(field)
+            path = compile_path(field.path)
+            self.fields.append((name, path, field))
+
+            node = self.tree
+            tags = _TAG_PATTERN.findall(_PREDICATE_PATTERN.sub('', path))
+            for tag in tags[:-1]:
+                node = node.setdefault(tag, {})
+            node[tags[-1]] = _KEEP
+
+    def extract(self, content: Union[str, bytes]) -> Dict[str, Any]:
+        '''
+        値を取得します。
+
+        Args:
+            content (Union[str, bytes]): JMXの内容
+
+        Returns:
+            Dict[str, Any]: フィールド名と値
+
+        Raises:
+            ET.ParseError: XMLとして解析できない場合
+        '''
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        root = self.__parse(content)
+
+        values = {}
+        for name, path, field in self.fields:
+            element = root.find(path)
+            if element is None:
+                values[name] = field.default
+            elif field.parse is not None:
+                values[name] = field.parse(element)
+            elif field.attribute is not None:
+                values[name] = element.get(field.attribute, field.default)
+            else:
+                values[name] = element.text if element.text is not None else field.default
+        return values
+
+    def __parse(self, content: bytes) -> ET.Element:
+        '''
+        XMLを解析します。どのフィールドにも必要ない要素は解析中に破棄します。
+
+        Args:
+            content (bytes): JMXの内容
+
+        Returns:
+            ET.Element: Report要素
+        '''
+        skip: Dict[str, Any] = {}
+        stack: List[Dict[str, Any]] = []
+        root = None
+        for event, element in ET.iterparse(io.BytesIO(content), events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = element
+                    stack.append(self.tree)
+                else:
+                    stack.append(stack[-1].get(element.tag, skip))
+            elif stack.pop() is skip and stack[-1] is not skip:
+                element.clear()
+
+        assert root is not None
+        return root
+
+
+class _Keep(dict):
+    '''
+    取得する要素以下のすべての要素を残すためのノード。
+    '''
+
+    def get(self, key, default=None):  # pylint: disable=W0613
+        return self
+
+
+_KEEP = _Keep()
+
+_ITEM = compile_path('ib:Item')
+_AREAS = compile_path('ib:Areas')
+_AREA = compile_path('ib:Areas/ib:Area')
+_KIND_NAME = compile_path('ib:Kind/ib:Name')
+_AREA_NAME = compile_path('ib:Name')
+_AREA_CODE = compile_path('ib:Code')
+
+TITLE = 'ib:Head/ib:Title'
+HEADLINE = 'ib:Head/ib:Headline/ib:Text'
+EVENT_ID = 'ib:Head/ib:EventID'
+INFORMATION = 'ib:Head/ib:Headline/ib:Information'
+FORECAST_COMMENT = 'seis:Body/seis:Comments/seis:ForecastComment/seis:Text'
+MAGNITUDE = 'seis:Body/seis:Earthquake/jmx_eb:Magnitude'
+HYPOCENTER_AREA = 'seis:Body/seis:Earthquake/seis:Hypocenter/seis:Area/seis:Name'
+HYPOCENTER_COORDINATE = 'seis:Body/seis:Earthquake/seis:Hypocenter/seis:Area/jmx_eb:Coordinate'
+MAX_INTENSITY = 'seis:Body/seis:Intensity/seis:Observation/seis:MaxInt'
+
+EARTHQUAKE_INTENSITY_REPORT = Extractor({
+    'body': HEADLINE,
+    'event_id': EVENT_ID,
+    'areas': Field(INFORMATION, parse=information_items, default=[]),
+    'info': FORECAST_COMMENT,
+})
+
+EPICENTER_INFORMATION = Extractor({
+    'body': HEADLINE,
+    'event_id': EVENT_ID,
+    'magnitude': MAGNITUDE,
+    'area': HYPOCENTER_AREA,
+    'coordinate': Field(HYPOCENTER_COORDINATE, parse=parse_coordinate),
+    'info': FORECAST_COMMENT,
+})
+
+EPICENTER_AND_SEISMIC_INTENSITY = Extractor({
+    'body': HEADLINE,
+    'event_id': EVENT_ID,
+    'magnitude': MAGNITUDE,
+    'area': HYPOCENTER_AREA,
+    'coordinate': Field(HYPOCENTER_COORDINATE, parse=parse_coordinate),
+    'max_seismic_intensity': MAX_INTENSITY,
+    'info': FORECAST_COMMENT,
+    'has_information': Field(INFORMATION, parse=lambda element: True, default=False),
+    'areas': Field(f"{INFORMATION}[@type='震源・震度に関する情報（市町村等）']", parse=information_items),
+    'regions': Field(f"{INFORMATION}[@type='震源・震度に関する情報（細分区域）']", parse=information_items, default=[]),
+})
+
+EARTHQUAKE_EARLY_WARNING = Extractor({
+    'body': HEADLINE,
+    'event_id': EVENT_ID,
+    'areas': Field(INFORMATION, parse=information_items, default=[]),
+})
+
+TSUNAMI = Extractor({
+    'title': TITLE,
+    'body': HEADLINE,
+    'event_id': EVENT_ID,
+    'areas': Field(INFORMATION, parse=information_items),
+})
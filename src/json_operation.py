@@ -2,7 +2,9 @@
 Copyright © 2020 YutoWatanabe
 '''
 import json
-from typing import Any
+import os
+import tempfile
+from typing import Any, Iterable, Iterator
 
 
 def json_read(json_file_path: str) -> Any:
@@ -15,7 +17,7 @@ def json_read(json_file_path: str) -> Any:
     Returns:
         Any: JSONの内容
     '''
-    with open(json_file_path, mode='r') as contents:
+    with open(json_file_path, mode='r', encoding='utf-8') as contents:
         json_body = json.load(contents)
 
     return json_body
@@ -24,10 +26,143 @@ def json_read(json_file_path: str) -> Any:
 def json_write(json_file_path: str, json_body: Any) -> None:
     '''
     JSONを保存する。
+    一時ファイルに書き込んでから置き換えるため、書き込み中に停止してもファイルは壊れません。
 
     Args:
         json_file_path (str): JSONファイルパス
         json_body (Any): JSONの内容
     '''
-    with open(json_file_path, mode='w') as contents:
-        json.dump(json_body, contents, indent=4, ensure_ascii=False)
+    atomic_write(json_file_path, [dumps(json_body)])
+
+
+def dumps(json_body: Any) -> str:
+    '''
+    JSONを保存する形式(空白なし)の文字列にする。
+
+    Args:
+        json_body (Any): JSONの内容
+
+    Returns:
+        str: JSON文字列
+    '''
+    return json.dumps(json_body, ensure_ascii=False, separators=(',', ':'))
+
+
+def atomic_write(file_path: str, lines: Iterable[Any], binary: bool = False) -> None:
+    '''
+    ファイルをアトミックに書き換える。
+    同じディレクトリの一時ファイルに書き込み、fsyncしてから置き換えます。
+
+    Args:
+        file_path (str): ファイルパス
+        lines (Iterable[Any]): 書き込む内容
+        binary (bool): Trueの場合は内容をbytesとして書き込む
+    '''
+    directory = os.path.dirname(os.path.abspath(file_path))
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, mode='wb' if binary else 'w', encoding=None if binary else 'utf-8') as contents:
+            contents.writelines(lines)
+            contents.flush()
+            os.fsync(contents.fileno())
+        os.replace(temporary_path, file_path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    _fsync_directory(directory)
+
+
+def _fsync_directory(directory: str) -> None:
+    '''
+    ディレクトリをfsyncしてrenameを永続化する。(対応していないOSでは何もしない)
+
+    Args:
+        directory (str): ディレクトリのパス
+    '''
+    try:
+        descriptor = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
+
+
+class Journal():
+    '''
+    追記専用のJSON Linesファイル。
+    変更分のみを追記し、不要な行が溜まったらcompactで書き直します。
+    '''
+
+    def __init__(self, file_path: str, sync: bool = False):
+        self.file_path = file_path
+        self.sync = sync
+        self.lines = 0
+        self.__contents = open(self.file_path, mode='a', encoding='utf-8')  # pylint: disable=R1732
+        self.__terminate_torn_line()
+
+    def replay(self) -> Iterator[Any]:
+        '''
+        記録を先頭から読み込みます。書き込み途中で壊れた行は無視します。
+
+        Yields:
+            Any: 記録
+        '''
+        self.lines = 0
+        with open(self.file_path, mode='r', encoding='utf-8') as contents:
+            for line in contents:
+                self.lines += 1
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def append(self, record: Any) -> None:
+        '''
+        記録を追記します。
+
+        Args:
+            record (Any): 記録
+        '''
+        self.__contents.write(dumps(record) + '\n')
+        self.__contents.flush()
+        if self.sync:
+            os.fsync(self.__contents.fileno())
+        self.lines += 1
+
+    def compact(self, records: Iterable[Any]) -> None:
+        '''
+        現在の記録だけでファイルをアトミックに書き直します。
+
+        Args:
+            records (Iterable[Any]): 残す記録
+        '''
+        records = list(records)
+        self.__contents.close()
+        atomic_write(self.file_path, (dumps(record) + '\n' for record in records))
+        self.lines = len(records)
+        self.__contents = open(self.file_path, mode='a', encoding='utf-8')  # pylint: disable=R1732
+
+    def close(self) -> None:
+        '''
+        ファイルを閉じます。
+        '''
+        self.__contents.close()
+
+    def __terminate_torn_line(self) -> None:
+        '''
+        最後の行が書き込み途中で終わっている場合は改行を追加し、次の記録と混ざらないようにします。
+        '''
+        with open(self.file_path, mode='rb') as contents:
+            contents.seek(0, os.SEEK_END)
+            if contents.tell() == 0:
+                return
+            contents.seek(-1, os.SEEK_END)
+            if contents.read(1) == b'\n':
+                return
+        self.__contents.write('\n')
+        self.__contents.flush()
@@ -1,41 +1,213 @@
 '''
 Copyright © 2020 YutoWatanabe
 '''
+import hashlib
+import logging
 import os
-import re
+import signal
+import sys
+import threading
 import time
-from typing import Any, Dict
+import xml.etree.ElementTree as ET
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
 import click
 import linebot
 import requests
-import xmltodict
-from linebot.models import FlexSendMessage
 
-from emergency_stop import stop
+from aggregator import EventAggregator
+from cache import LRUCache
+from dedup_store import DedupStore
+from delivery import LINE_API_ENDPOINT, DeliveryQueue, LineApi, LineSender, MulticastSender
+from emergency_stop import DegradedMode
+from events import (EarlyWarningAlarm, EarlyWarningForecast, EpicenterIntensityReport, EpicenterReport, Event,
+                    Intensity, IntensityReport, Tsunami, as_area_items)
+from feed import JMA_DETAIL_HOSTS, JMA_FEEDS, FeedReader, FeedSource, is_allowed_url, jma_feed, parse_time
+from http_client import HttpClient
+import jmx
 from json_operation import json_read, json_write
-from report import format_report
-from template import apply_template
+import metrics
+from report import ReportTracker
+from scheduler import FeedScheduler, PollScheduler
+from snapshot import Snapshot, write_snapshot
+from subscribers import SubscriberRegistry
+from template import template_key
+from webhook import LineWebhook
+from websub import WebSubSubscriber
+
+
+LOGGER = logging.getLogger(__name__)
+
+# 地震の情報を配信するフィード。状態ファイルは複数フィードに対応する前の名前のまま使用します
+PRIMARY_FEED = 'eqvol'
 
 
 @click.command()
 @click.option('--line-token', 'token', prompt=True, hide_input=True, help='Line token')
-def main(token: str):
+@click.option('--report-window', default=3600.0, show_default=True, help='同じ本文を第n報として数える期間(秒)')
+@click.option('--aggregate-window', default=60.0, show_default=True,
+              help='同じ地震の2件目以降の震度速報・震源に関する情報を1件の更新にまとめるまで待つ期間(秒)。最初の情報は待ちません')
+@click.option('--min-interval', default=5.0, show_default=True, help='地震活動中のポーリング間隔(秒)')
+@click.option('--max-interval', default=60.0, show_default=True, help='平常時の最大ポーリング間隔(秒)')
+@click.option('--decay', default=1.5, show_default=True, help='平常時にポーリング間隔を広げる倍率')
+@click.option('--active-window', default=600.0, show_default=True, help='情報を受信してから地震活動中とみなす期間(秒)')
+@click.option('--feed', 'feeds', multiple=True, type=click.Choice([name for name in JMA_FEEDS if name != PRIMARY_FEED]),
+              help='eqvolに加えて並列でポーリングするフィード。複数指定できます')
+@click.option('--targeted', is_flag=True,
+              help='購読者の地域・震度の設定に合わせてmulticastします。指定しない場合はbroadcast')
+@click.option('--channel-secret', default=None, help='Webhookの署名の検証に使用するチャネルシークレット')
+@click.option('--webhook-port', default=8000, show_default=True, help='LINEのWebhookを待ち受けるポート')
+@click.option('--push-hub', default=None, help='WebSubのハブのURL。指定した場合はPushで受信します')
+@click.option('--push-callback', default=None, help='ハブから到達できるこのbotのコールバックURL')
+@click.option('--push-port', default=8080, show_default=True, help='コールバックを待ち受けるポート')
+@click.option('--push-secret', default=None,
+              help='配信内容の署名(X-Hub-Signature)に使用する秘密鍵。--push-hubを指定する場合は必須')
+@click.option('--push-poll-interval', default=120.0, show_default=True, help='Push受信中のポーリング間隔(秒)')
+@click.option('--degraded-rate', default=6, show_default=True,
+              help='震度7を観測した後に1分あたりに送信する最大数(緊急地震速報(警報)・津波を除く)')
+@click.option('--degraded-cooldown', default=1800.0, show_default=True,
+              help='震度7を観測した後、情報が無い期間がこの秒数続いたら通常の配信に戻ります')
+@click.option('--snapshot', 'snapshot_path', default=None, type=click.Path(dir_okay=False),
+              help='再起動時に状態を復元するスナップショットのパス。指定しない場合はsaves/の外のsnapshot.bin')
+@click.option('--snapshot-interval', default=60.0, show_default=True,
+              help='スナップショットを書き込む間隔(秒)。0の場合は終了時のみ')
+@click.option('--metrics-port', default=None, type=int, help='指定した場合は/metricsでメトリクスを公開します')
+@click.option('--metrics-summary-interval', default=300.0, show_default=True,
+              help='メトリクスの要約をログに出力する間隔(秒)。0の場合は出力しません')
+def main(token: str, report_window: float, aggregate_window: float,  # pylint: disable=R0913,R0914
+         min_interval: float, max_interval: float, decay: float, active_window: float, feeds: Tuple[str, ...],
+         targeted: bool, channel_secret: Optional[str], webhook_port: int,
+         push_hub: Optional[str], push_callback: Optional[str], push_port: int, push_secret: Optional[str],
+         push_poll_interval: float, degraded_rate: int, degraded_cooldown: float,
+         snapshot_path: Optional[str], snapshot_interval: float,
+         metrics_port: Optional[int], metrics_summary_interval: float):
     '''
-    メイン。30秒ごとに実行します。
+    メイン。地震活動に合わせて間隔を変えながら実行します。
+    WebSubのハブを指定した場合はPushで受信し、ポーリングは取りこぼし対策として低頻度で続けます。
+    複数のフィードはそれぞれの間隔で並列に取得し、接続・詳細情報のキャッシュ・投稿済みの記録を共有します。
 
     Args:
         token (str): LINEのトークン
+        report_window (float): 同じ本文を第n報として数える期間(秒)
+        aggregate_window (float): 同じ地震の2件目以降の情報をまとめるまで待つ期間(秒)
+        min_interval (float): 地震活動中のポーリング間隔(秒)
+        max_interval (float): 平常時の最大ポーリング間隔(秒)
+        decay (float): 平常時にポーリング間隔を広げる倍率
+        active_window (float): 情報を受信してから地震活動中とみなす期間(秒)
+        feeds (Tuple[str, ...]): 追加でポーリングするフィード
+        targeted (bool): 購読者の設定に合わせてmulticastするか
+        channel_secret (Optional[str]): チャネルシークレット
+        webhook_port (int): LINEのWebhookを待ち受けるポート
+        push_hub (Optional[str]): WebSubのハブのURL
+        push_callback (Optional[str]): コールバックURL
+        push_port (int): コールバックを待ち受けるポート
+        push_secret (Optional[str]): 署名の秘密鍵
+        push_poll_interval (float): Push受信中のポーリング間隔(秒)
+        degraded_rate (int): 震度7を観測した後に1分あたりに送信する最大数
+        degraded_cooldown (float): 通常の配信に戻るまでの情報が無い期間(秒)
+        snapshot_path (Optional[str]): スナップショットのパス
+        snapshot_interval (float): スナップショットを書き込む間隔(秒)
+        metrics_port (Optional[int]): メトリクスを公開するポート
+        metrics_summary_interval (float): メトリクスの要約をログに出力する間隔(秒)
     '''
+    if push_hub is not None:
+        if push_callback is None:
+            raise click.UsageError('--push-callback is required with --push-hub')
+        if not push_secret:
+            # 署名を検証しないと、コールバックに届いた偽のフィード(緊急地震速報など)を配信してしまう
+            raise click.UsageError('--push-secret is required with --push-hub')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
     run_directory = os.path.dirname(__file__)
-    url = 'http://www.data.jma.go.jp/developer/xml/feed/eqvol.xml'
-    earthquake = Earthquake(run_directory, url, token)
+    primary = jma_feed(PRIMARY_FEED)
+    url = primary.url
+    registry = None
+    if targeted:
+        if channel_secret is None:
+            raise click.UsageError('--channel-secret is required with --targeted')
+        saves = os.path.join(run_directory, 'saves')
+        os.makedirs(saves, exist_ok=True)
+        registry = SubscriberRegistry(os.path.join(saves, 'subscribers.sqlite3'))
+    earthquake = Earthquake(run_directory, url, token, report_window=report_window, aggregate_window=aggregate_window,
+                            backfill_url=primary.backfill_url, feeds=[jma_feed(name) for name in feeds],
+                            registry=registry, snapshot_path=snapshot_path, degraded_rate=degraded_rate,
+                            degraded_cooldown=degraded_cooldown)
+    if registry is not None and channel_secret is not None:
+        webhook = LineWebhook(registry, channel_secret, earthquake.line_bot_api, port=webhook_port)
+        if not webhook.import_followers() and isinstance(earthquake.sender, MulticastSender):
+            # Webhookより前に友だちになったユーザーに届くよう、そのユーザーが受信する情報はbroadcastする
+            LOGGER.warning('Followers are not imported: broadcasting messages that unregistered users receive')
+            earthquake.sender.broadcast_unknown = True
+        webhook.start()
+    earthquake.delivery.start()
+
+    earthquake.register_metrics()
+    if metrics_port is not None:
+        metrics.MetricsServer(metrics_port).start()
+    if metrics_summary_interval > 0:
+        metrics.SummaryLogger(metrics_summary_interval).start()
+
+    if push_hub is not None:
+        subscriber = WebSubSubscriber(
+            push_hub, url, push_callback, lambda content: earthquake.process(content, advance_cursor=False),
+            port=push_port, secret=push_secret, http_client=earthquake.http)
+        subscriber.start()
+        schedulers = [PollScheduler(push_poll_interval, push_poll_interval, 1.0, 0.0, name=PRIMARY_FEED)]
+    else:
+        schedulers = [PollScheduler(min_interval, max_interval, decay, active_window, name=PRIMARY_FEED)]
+    schedulers.extend(
+        PollScheduler(min_interval, max_interval, decay, active_window, name=name) for name in earthquake.feeds
+        if name != PRIMARY_FEED)
+    scheduler = FeedScheduler(schedulers)
+
+    # 停止時(SIGTERM)はスナップショットを書き込んでから終了する
+    signal.signal(signal.SIGTERM, _terminate)
+    try:
+        _poll(earthquake, scheduler, snapshot_interval)
+    finally:
+        earthquake.save_snapshot()
+
+
+def _terminate(signum: int, _: Any):
+    '''
+    シグナルを受信した場合に終了します。例外で処理を抜けるため、実行中の処理のロックは解放されます。
+
+    Args:
+        signum (int): シグナル番号
+    '''
+    LOGGER.info('Received signal %d, shutting down', signum)
+    sys.exit(0)
+
+
+def _poll(earthquake: 'Earthquake', scheduler: FeedScheduler, snapshot_interval: float):
+    '''
+    フィードをポーリングし続けます。
+
+    Args:
+        earthquake (Earthquake): 地震情報
+        scheduler (FeedScheduler): ポーリングの間隔
+        snapshot_interval (float): スナップショットを書き込む間隔(秒)。0の場合は終了時のみ
+    '''
+    snapshot_at = time.time() + snapshot_interval
     while(True):  # pylint: disable=C0325
-        if earthquake.check_update():
-            earthquake.get_earthquake_information()
-            earthquake.find_latest()
-            earthquake.post_line()
-        time.sleep(30)
+        if 0 < snapshot_interval and snapshot_at <= time.time():
+            earthquake.save_snapshot()
+            snapshot_at = time.time() + snapshot_interval
+        due = scheduler.due()
+        updates = {name: earthquake.executor.submit(earthquake.check_update, name) for name in due}
+        for name in due:
+            event_ids = []
+            if updates[name].result():
+                event_ids = [message.event_id for message in earthquake.process(feed=name)]
+                event_ids.extend(earthquake.aggregator.pending())
+            scheduler.observe(name, event_ids)
+        # まとめる期間が過ぎた情報・震度7の後に保留した情報を送信する
+        waits = [wait for wait in (earthquake.aggregator.next_wait(), earthquake.degraded.next_wait(earthquake.clock()))
+                 if wait is not None]
+        if 0.0 in waits or earthquake.degraded.expired(earthquake.clock()):
+            earthquake.flush()
+            continue
+        time.sleep(min([scheduler.next_wait()] + waits))
 
 
 class Earthquake():  # pylint: disable=R0902
@@ -43,43 +215,189 @@ class Earthquake():  # pylint: disable=R0902
     地震情報を取得、フォーマット、LINEにpostします。
     '''
 
-    def __init__(self, save_directory: str, url: str, token: str):
+    def __init__(self, save_directory: str, url: str, token: str,  # pylint: disable=R0913,R0914
+                 detail_cache_size: int = 256, max_workers: int = 8,
+                 http_client: Optional[HttpClient] = None, report_window: float = 3600.0,
+                 line_bot_api: Optional[linebot.LineBotApi] = None, clock: Callable[[], float] = time.time,
+                 backfill_url: Optional[str] = None, feeds: Sequence[FeedSource] = (),
+                 registry: Optional[SubscriberRegistry] = None, aggregate_window: float = 60.0,
+                 snapshot_path: Optional[str] = None, degraded_rate: int = 6, degraded_cooldown: float = 1800.0,
+                 detail_hosts: Optional[Sequence[str]] = JMA_DETAIL_HOSTS, line_endpoint: str = LINE_API_ENDPOINT):
         self.url = url
+        # `url`(eqvol)に加えて取得するフィード。接続・詳細情報のキャッシュ・投稿済みの記録は共有します
+        self.feeds = {PRIMARY_FEED: FeedSource(PRIMARY_FEED, url, backfill_url)}
+        self.feeds.update((source.name, source) for source in feeds)
+        # 詳細情報を取得するホスト。Noneの場合は制限しません(リプレイなど、取得先がローカルの場合)
+        self.detail_hosts = detail_hosts
         self.token = token
         self.save_directory = save_directory
+        # 投稿済み・第n報の期限に使用する時刻。リプレイでは記録した時刻を使用します
+        self.clock = clock
         self.directory = os.path.join(self.save_directory, 'saves')
         if not os.path.isdir(self.directory):
             os.makedirs(self.directory)
 
-        self.responce: Any = None
+        # 前回終了時の状態。状態ファイルが無い・古い場合に補い、詳細情報のキャッシュは参照した時に展開します
+        # 状態ファイル(saves/)を消しても残るように、デフォルトはsaves/の外に置きます
+        self.snapshot_path = snapshot_path or os.path.join(self.save_directory, 'snapshot.bin')
+        self.snapshot = Snapshot.open(self.snapshot_path)
+        if self.snapshot is None and snapshot_path is None:
+            # 以前のデフォルト(saves/snapshot.bin)から読み込み、次回からは新しいパスに書き込む
+            self.snapshot = Snapshot.open(os.path.join(self.directory, 'snapshot.bin'))
+        self.__merge_snapshot_files()
+
+        self.responces: Dict[str, Any] = {}
+        # check_updateで受け取った検証用のヘッダ。すべてのエントリを処理できた場合のみ保存します
+        self.validators: Dict[str, Dict[str, Any]] = {}
         self.formated_text: Any = []
-        self.xml_root: Any = None
         self.post_message: Any = []
+        self.urgent_message: Any = []
+        self.detail_cache = LRUCache(detail_cache_size)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.http = http_client if http_client is not None else HttpClient(pool_size=max_workers + 2)
+        self.posted = DedupStore(os.path.join(self.directory, 'posted.log'))
+        self.report_tracker = ReportTracker(self.directory, report_window)
+        self.aggregator = EventAggregator(self.directory, aggregate_window, report_window)
+        self.lock = threading.Lock()
+        # 友だちの一覧の取得・返信に使用します。送信はlineで行います
+        self.line_bot_api = line_bot_api if line_bot_api is not None \
+            else linebot.LineBotApi(self.token, endpoint=line_endpoint)
+        self.line = LineApi(self.http, self.token, line_endpoint)
+        # 購読者の一覧を指定した場合は、地域・震度の設定に合わせてmulticastします
+        self.registry = registry
+        self.sender = MulticastSender(self.line, registry) if registry is not None else LineSender(self.line)
+        delivery_path = os.path.join(self.directory, 'delivery.log')
+        restore_delivery = not os.path.isfile(delivery_path)
+        self.delivery = DeliveryQueue(delivery_path, self.sender)
+        # 震度7を観測した場合は停止せずに送信量を抑えます
+        self.degraded = DegradedMode(degraded_rate, degraded_cooldown, save_directory=self.directory)
+        self.__import_legacy_posted()
+        self.__merge_snapshot_state(restore_delivery)
+
+    def register_metrics(self):
+        '''
+        状態ファイルのサイズ・送信待ちキュー・HTTP接続のゲージを、このインスタンスから求めるよう設定します。
+        '''
+        metrics.STATE_FILE_BYTES.set_function(lambda: metrics.file_sizes(self.directory))
+        metrics.DEGRADED.set_function(lambda: float(self.degraded.active(self.clock())))
+        metrics.QUEUE_DEPTH.set_function(lambda: self.delivery.stats()['depth'])
+        metrics.QUEUE_AGE.set_function(lambda: self.delivery.stats()['age'])
+        metrics.HTTP_CONNECTIONS.set_function(
+            lambda: {(state,): value for state, value in self.http.stats().items()})
+        if self.registry is not None:
+            registry = self.registry
+            metrics.SUBSCRIBERS.set_function(lambda: len(registry))
+
+    def save_snapshot(self):
+        '''
+        再起動時に復元する状態(状態ファイル・投稿済みの記録・詳細情報のキャッシュ・送信待ちのメッセージ)を
+        スナップショットに書き込みます。
+        '''
+        with self.lock, metrics.STAGE_SECONDS.time(stage='snapshot'):
+            files = {}
+            for name in sorted(os.listdir(self.directory)):
+                if name.endswith('.json'):
+                    files[name] = self.__load_buffer(os.path.join(self.directory, name), None)
+            details = {url: None if text is None else text.to_dict() for url, text in self.detail_cache.items()}
+            if self.snapshot is not None:
+                # まだ復元していない詳細情報も、キャッシュの上限まで新しい順に残す
+                remaining = [(url, values) for url, values in self.snapshot.get('details', {}).items()
+                             if url not in details]
+                keep = max(0, self.detail_cache.max_size - len(details))
+                merged = dict(remaining[len(remaining) - keep:] if keep else [])
+                merged.update(details)
+                details = merged
+                # 展開済みのセクションは閉じた後も参照できるため、以降も__restore_detailで復元する
+                self.snapshot.close()
+            sections = {
+                'files': {name: value for name, value in files.items() if value is not None},
+                'posted': self.posted.records(),
+                'details': details,
+                'delivery': [message.to_dict() for message in self.delivery.pending()],
+            }
+            size = write_snapshot(self.snapshot_path, sections)
+        LOGGER.info('Saved snapshot: %d bytes', size)
 
-    def check_update(self) -> bool:
+    def check_update(self, feed: str = PRIMARY_FEED) -> bool:
         '''
         サイトが更新されているか確認します。
+        前回取得時の`Last-Modified`・`ETag`を`If-Modified-Since`・`If-None-Match`として送信し、
+        304が返ってきた場合は更新なしとします(本文はダウンロードされません)。
+        フィードごとに記録するため、複数のフィードを並列に確認できます。
+        受け取ったヘッダはget_earthquake_informationで詳細情報をすべて取得できた場合に保存します。
+        (取得に失敗したエントリがある場合に、次回も304にならず再取得できるように)
+
+        Args:
+            feed (str): フィードの名前
 
         Returns:
             bool: 更新されていた場合True。されていない場合はFalse。
         '''
-        is_update = False
+        last_acquisition_file_path = self.__state_path('last_acquisition', feed)
+        last_acquisition = self.__load_buffer(last_acquisition_file_path, {'latest': None})
+
+        headers = {}
+        if last_acquisition.get('latest'):
+            headers['If-Modified-Since'] = last_acquisition['latest']
+        if last_acquisition.get('etag'):
+            headers['If-None-Match'] = last_acquisition['etag']
+
+        metrics.POLLS.inc(feed=feed)
         try:
-            self.responce = requests.get(self.url)
-        except requests.exceptions.ConnectionError:
+            with metrics.STAGE_SECONDS.time(stage='check_update'):
+                responce = self.http.get(self.feeds[feed].url, headers=headers)
+        except requests.exceptions.RequestException:
+            metrics.ERRORS.inc(kind='feed_fetch')
             return False
-        last_acquisition_file_path = os.path.join(self.directory, 'last_acquisition.json')
-        last_acquisition = self.__load_buffer(last_acquisition_file_path, {'latest': None})
 
-        last_modified: str = self.responce.headers['Last-Modified']
+        if responce.status_code == 304:
+            metrics.NOT_MODIFIED.inc(feed=feed)
+            return False
+        if not responce.ok:
+            metrics.ERRORS.inc(kind='feed_fetch')
+            return False
+        self.responces[feed] = responce
+
+        validators = {
+            'latest': responce.headers.get('Last-Modified'),
+            'etag': responce.headers.get('ETag'),
+        }
+        if validators['latest'] is None and validators['etag'] is None:
+            # 検証用のヘッダが無い場合は本文のハッシュで比較する
+            validators['digest'] = hashlib.sha1(responce.content).hexdigest()
+
+        if validators == last_acquisition:
+            metrics.NOT_MODIFIED.inc(feed=feed)
+            return False
 
-        if last_modified != last_acquisition['latest']:
-            is_update = True
-            self.__save_buffer(last_acquisition_file_path, {'latest': last_modified})
+        self.validators[feed] = validators
+        return True
 
-        return is_update
+    def process(self, content: Optional[bytes] = None, advance_cursor: bool = True,
+                feed: str = PRIMARY_FEED) -> List[Any]:
+        '''
+        地震速報を取得・フォーマットしてLINEにpostします。
+        ポーリングとPush(WebSub)、複数のフィードから呼ばれるため、同時には実行されません。
 
-    def get_earthquake_information(self):
+        Args:
+            content (Optional[bytes]): フィードの内容。Noneの場合はcheck_updateで取得した内容
+            advance_cursor (bool): フィードのカーソルを進めるか
+            feed (str): フィードの名前
+
+        Returns:
+            List[Any]: postした情報
+        '''
+        with self.lock, metrics.STAGE_SECONDS.time(stage='cycle'):
+            with metrics.STAGE_SECONDS.time(stage='get_earthquake_information'):
+                self.get_earthquake_information(content, advance_cursor, feed)
+            with metrics.STAGE_SECONDS.time(stage='find_latest'):
+                self.find_latest()
+            with metrics.STAGE_SECONDS.time(stage='post_line'):
+                self.post_line()
+            return self.urgent_message + self.post_message
+
+    def get_earthquake_information(self, content: Optional[bytes] = None,  # pylint: disable=R0912,R0914
+                                   advance_cursor: bool = True, feed: str = PRIMARY_FEED):
         '''
         地震速報を取得します。
         - 震度速報
@@ -89,78 +407,292 @@ class Earthquake():  # pylint: disable=R0902
         - 緊急地震速報(警報)
 
         すべてをフォーマットします。
+        フィードは前回処理したエントリ(カーソル)までを逐次読み込みます。
+        一度取得した詳細情報はURLをキーにキャッシュし、新しいエントリのみ並列で取得します。
+        緊急地震速報はフィードを読み込んだ時点で取得を始め、他の情報より先にフォーマットして送信待ちキューに追加します。
+        それ以外のフォーマットはフィードの順番どおりに行います。
+        高頻度フィードがカーソルより先に進んでいた場合は、長期フィードから取りこぼしたエントリを補います。
+
+        Args:
+            content (Optional[bytes]): フィードの内容。Noneの場合はcheck_updateで取得した内容
+            advance_cursor (bool): フィードのカーソルを進めるか。
+                Pushで受信した内容は一部のエントリのみの場合があるためFalseにします。
+            feed (str): フィードの名前
         '''
         self.formated_text = []
+        self.urgent_message = []
 
-        assert self.responce is not None, 'Can not read page.'
+        validators = None
+        if content is None:
+            assert feed in self.responces, 'Can not read page.'
+            content = self.responces[feed].content
+            validators = self.validators.pop(feed, None)
 
-        self.responce.encoding = 'UTF-8'
-        text = self.responce.text
+        cursor_path = self.__state_path('feed_cursor', feed)
+        cursor = self.__load_buffer(cursor_path, None)
 
+        entries = []
+        documents: Dict[str, Future] = {}
+        reader = FeedReader(cursor)
         try:
-            self.xml_root = xmltodict.parse(text)
-        except xmltodict.expat.ExpartError:
+            with metrics.STAGE_SECONDS.time(stage='feed_parse'):
+                for entry in reader.read(content):
+                    handler = self.__entry_handler(entry)
+                    entries.append((handler, entry, time.time()))
+                    if handler is not None and self.__is_urgent(entry.title):
+                        self.__fetch(entry.url, documents)
+        except ET.ParseError:
+            metrics.ERRORS.inc(kind='feed_parse')
             return
+        if advance_cursor and cursor is not None and not reader.reached_cursor:
+            self.__backfill(self.feeds[feed], cursor, entries)
+        metrics.ENTRIES.inc(len(entries))
+
+        for handler, entry, _ in entries:
+            if handler is not None:
+                self.__fetch(entry.url, documents)
+
+        self.__dispatch_urgent(entries, documents)
+
+        new_cursor = entries[0][1].to_cursor() if entries else cursor
+        failed = False
+        for index, (handler, entry, detected_at) in enumerate(entries):
+            if handler is None:
+                continue
+            fetched, text = self.__format_entry(handler, entry, documents)
+            if not fetched:
+                # 取得に失敗したエントリは次回再取得できるようにカーソルを進めない
+                new_cursor = entries[index + 1][1].to_cursor() if index + 1 < len(entries) else cursor
+                failed = True
+                continue
+
+            if text is not None:
+                self.formated_text.append(text.detected(detected_at))
+
+        if advance_cursor and new_cursor != cursor:
+            self.__save_buffer(cursor_path, new_cursor)
+        if validators is not None and not failed:
+            self.__save_buffer(self.__state_path('last_acquisition', feed), validators)
 
-        for child in self.xml_root['feed']['entry']:
-            title = child['title']
-            tsunami = re.search(r'津波', title)
-            if title == '震度速報':
-                url = child['link']['@href']
-                self.__earthquake_intensity_report(url)
-            elif title == '震源に関する情報':
-                url = child['link']['@href']
-                self.__epicenter_information(url)
-            elif title == '震源・震度に関する情報':
-                url = child['link']['@href']
-                self.__information_on_epicenter_and_seismic_intensity(url)
-            elif title == '緊急地震速報（予報）':
-                url = child['link']['@href']
-                self.__earthquake_early_warning_forecast(url)
-            elif title == '緊急地震速報（警報）':
-                url = child['link']['@href']
-                self.__earthquake_early_warning_alarm(url)
-            elif tsunami:
-                url = child['link']['@href']
-                self.__tsunami(url)
+    def flush(self) -> List[Any]:
+        '''
+        まとめる期間が過ぎた同じ地震の情報をLINEにpostします。フィードの更新が無い場合に呼びます。
+
+        Returns:
+            List[Any]: postした情報
+        '''
+        with self.lock, metrics.STAGE_SECONDS.time(stage='cycle'):
+            self.formated_text = []
+            self.urgent_message = []
+            self.find_latest()
+            self.post_line()
+            return self.post_message
 
     def find_latest(self):
         '''
         最新の情報を振り分ける。
+        同じ地震(EventID)の震度速報・震源に関する情報はまとめるため、期間が過ぎるまで送信しません。
         また、同じ震源の地震情報が複数投稿された場合に「第何報」をつける。
         '''
         self.post_message = []
-        earthquake_info_path = os.path.join(self.directory, 'latest_earthquake_info.json')
-        earthquake_information = self.__load_buffer(earthquake_info_path, [])
+        now = self.clock()
 
-        latest_information = earthquake_information
+        ready = []
         self.formated_text.reverse()
         for individual in self.formated_text:
-            if individual['data'] not in earthquake_information:
-                if individual['title'] == '震度速報' or individual['title'] == '震源・震度に関する情報':
-                    report_num = format_report(self.directory, individual['body'])
-                    if report_num > 1:
-                        individual['title'] += f'\n第{report_num}報'
+            if individual.data not in self.posted:
+                ready.extend(self.aggregator.add(individual, now))
+
+                self.posted.add(individual.data, now)
+        ready.extend(self.aggregator.expire(now))
 
-                self.post_message.append(individual)
+        for individual in ready:
+            if isinstance(individual, (IntensityReport, EpicenterIntensityReport)):
+                individual.report = self.report_tracker.next(individual.body, now)
 
-                latest_information.append(individual['data'])
+            self.post_message.append(individual)
 
-        self.__save_buffer(earthquake_info_path, latest_information)
+        self.posted.compact(now)
+        self.report_tracker.save()
+        self.aggregator.save()
 
     def post_line(self):
         '''
         LINEにpostする。
+        送信待ちキューにまとめて追加し、送信はワーカースレッドが優先度の高い順に行います。
+        '''
+        self.post_message = self.degraded.filter(self.urgent_message, self.post_message, self.clock())
+        self.delivery.put_many(self.post_message)
+
+    def __dispatch_urgent(self, entries: List[Tuple[Any, Any, float]], documents: Dict[str, Future]):
+        '''
+        緊急地震速報を他の情報より先にフォーマットし、送信待ちキューに追加します。
+        追加した情報は投稿済みとして記録するため、find_latestでは除外されます。
+        震度7を観測した後は他の情報と同じく送信量を抑えるモードを通します(警報は制限せず、予報は送信しません)。
+
+        Args:
+            entries (List[Tuple[Any, Any, float]]): フォーマットする関数、エントリ、検知した時刻
+            documents (Dict[str, Future]): URLと取得中の詳細情報
+        '''
+        for handler, entry, detected_at in reversed(entries):
+            if handler is None or not self.__is_urgent(entry.title):
+                continue
+            _, text = self.__format_entry(handler, entry, documents)
+            if text is None or text.data in self.posted:
+                continue
+            message = text.detected(detected_at)
+            self.posted.add(message.data, self.clock())
+            dispatched = self.degraded.filter([], [message], self.clock())
+            self.delivery.put_many(dispatched)
+            self.urgent_message.extend(dispatched)
+
+    def __backfill(self, source: FeedSource, cursor: Dict[str, Any], entries: List[Tuple[Any, Any, float]]):
+        '''
+        高頻度フィードがカーソルより先に進んでいた(取りこぼしがある)場合に、
+        長期フィードのカーソルより新しいエントリを追加し、新しい順に並べ直します。
+
+        Args:
+            source (FeedSource): フィード
+            cursor (Dict[str, Any]): 前回処理したエントリ
+            entries (List[Tuple[Any, Any, float]]): フォーマットする関数、エントリ、検知した時刻
         '''
-        line_bot_api = linebot.LineBotApi(self.token)
-        for message in self.post_message:
-            flex_message = FlexSendMessage(
-                alt_text=message["body"],
-                contents=apply_template(message))
-            line_bot_api.broadcast(flex_message)
-        stop(self.post_message, line_bot_api)
+        if source.backfill_url is None:
+            return
+        LOGGER.warning('Feed %s rolled past the cursor %s, backfilling from %s',
+                       source.name, cursor['id'], source.backfill_url)
+        metrics.BACKFILLS.inc(feed=source.name)
+        try:
+            responce = self.http.get(source.backfill_url)
+        except requests.exceptions.RequestException:
+            metrics.ERRORS.inc(kind='feed_fetch')
+            return
+        if not responce.ok:
+            metrics.ERRORS.inc(kind='feed_fetch')
+            return
 
-    def __earthquake_intensity_report(self, url):
+        seen = {entry.id for _, entry, _ in entries}
+        reader = FeedReader(cursor)
+        try:
+            for entry in reader.read(responce.content):
+                if entry.id not in seen:
+                    entries.append((self.__entry_handler(entry), entry, time.time()))
+        except ET.ParseError:
+            metrics.ERRORS.inc(kind='feed_parse')
+            return
+        if not reader.reached_cursor:
+            LOGGER.warning('Long feed %s does not reach the cursor either', source.backfill_url)
+        entries.sort(key=lambda item: parse_time(item[1].updated), reverse=True)
+
+    def __state_path(self, name: str, feed: str) -> str:
+        '''
+        フィードごとの状態ファイルのパスを返します。
+
+        Args:
+            name (str): 状態ファイルの名前
+            feed (str): フィードの名前
+
+        Returns:
+            str: パス。eqvolは複数フィードに対応する前と同じ`<name>.json`、それ以外は`<name>_<feed>.json`
+        '''
+        if feed == PRIMARY_FEED:
+            return os.path.join(self.directory, f'{name}.json')
+        return os.path.join(self.directory, f'{name}_{feed}.json')
+
+    def __fetch(self, url: str, documents: Dict[str, Future]):
+        '''
+        キャッシュに無い詳細情報の取得を開始します。
+
+        Args:
+            url (str): 詳細情報のURL
+            documents (Dict[str, Future]): URLと取得中の詳細情報
+        '''
+        if url not in documents and url not in self.detail_cache and not self.__restore_detail(url):
+            documents[url] = self.executor.submit(self.__request_text, url)
+
+    def __format_entry(self, handler: Callable[[str, str], Any], entry: Any,
+                       documents: Dict[str, Future]) -> Tuple[bool, Any]:
+        '''
+        エントリの詳細情報をフォーマットします。フォーマットした情報はキャッシュします。
+
+        Args:
+            handler (Callable[[str, str], Any]): フォーマットする関数
+            entry (Any): フィードのエントリ
+            documents (Dict[str, Future]): URLと取得中の詳細情報
+
+        Returns:
+            Tuple[bool, Any]: 取得できたか、フォーマットした情報(対象外の場合はNone)
+        '''
+        if entry.url not in documents:
+            return True, self.detail_cache.get(entry.url)
+
+        document = documents[entry.url].result()
+        if document is None:
+            return False, None
+        del documents[entry.url]
+        try:
+            with metrics.FORMAT_SECONDS.time(type=template_key(entry.title)):
+                text = handler(entry.url, document)
+        except ET.ParseError:
+            metrics.ERRORS.inc(kind='detail_parse')
+            return True, None
+        self.detail_cache.put(entry.url, text)
+        return True, text
+
+    @staticmethod
+    def __is_urgent(title: str) -> bool:
+        '''
+        他の情報より先に送信するエントリか判定します。
+
+        Args:
+            title (str): エントリのタイトル
+
+        Returns:
+            bool: 緊急地震速報(予報・警報)の場合True
+        '''
+        return title.startswith('緊急地震速報')
+
+    def __entry_handler(self, entry: Any) -> Optional[Callable[[str, str], Any]]:
+        '''
+        エントリをフォーマットする関数を選択します。詳細情報のURLが気象庁以外のエントリは取得しません。
+
+        Args:
+            entry (Any): フィードのエントリ
+
+        Returns:
+            Optional[Callable[[str, str], Any]]: フォーマットする関数。対象外の場合はNone。
+        '''
+        handler = self.__select_handler(entry.title)
+        if handler is not None and not is_allowed_url(entry.url, self.detail_hosts):
+            LOGGER.warning('Ignored %s with untrusted detail URL %s', entry.title, entry.url)
+            metrics.ERRORS.inc(kind='detail_url')
+            return None
+        return handler
+
+    def __select_handler(self, title: str) -> Optional[Callable[[str, str], Any]]:
+        '''
+        タイトルからフォーマットする関数を選択します。
+
+        Args:
+            title (str): エントリのタイトル
+
+        Returns:
+            Optional[Callable[[str, str], Any]]: フォーマットする関数。対象外の場合はNone。
+        '''
+        handlers = {
+            '震度速報': self.__earthquake_intensity_report,
+            '震源に関する情報': self.__epicenter_information,
+            '震源・震度に関する情報': self.__information_on_epicenter_and_seismic_intensity,
+            '緊急地震速報（予報）': self.__earthquake_early_warning_forecast,
+            '緊急地震速報（警報）': self.__earthquake_early_warning_alarm,
+        }
+        if title in handlers:
+            return handlers[title]
+        if '津波' in title:
+            return self.__tsunami
+        return None
+
+    @staticmethod
+    def __earthquake_intensity_report(url, earthquake_details):
         '''
         フォーマット。
         -----
@@ -174,39 +706,16 @@ class Earthquake():  # pylint: disable=R0902
         -----
         > 震度速報
         '''
-        text = {}
         try:
-            earthquake_details = self.__request_text(url)
-            details_root = xmltodict.parse(earthquake_details)
-
-            text['title'] = '震度速報'
-            text['body'] = details_root['Report']['Head']['Headline']['Text']
-
-            area_info = self.__format_area(details_root)
-
-            area_text = []
-            for element in area_info:
-                area_text.append(f'[{element}] {area_info[element]}')
-            text['areas'] = area_text
-            text['info'] = details_root['Report']['Body']['Comments']['ForecastComment']['Text']
-            text['data'] = {
-                'event_id': details_root['Report']['Head']['EventID'],
-                'url': url
-            }
-        except xmltodict.expat.ExpatError:
-            text['title'] = '震度速報'
-            text['body'] = 'No data.'
-            text['areas'] = ['[N/A] No data.']
-            text['info'] = '今後の情報に注意してください。'
-            text['data'] = {
-                'event_id': 0000,
-                'serial': 1,
-                'url': url
-            }
+            details = jmx.EARTHQUAKE_INTENSITY_REPORT.extract(earthquake_details)
+        except ET.ParseError:
+            return IntensityReport(0000, url, 'No data.', '今後の情報に注意してください。', None)
 
-        self.formated_text.append(text)
+        return IntensityReport(details['event_id'], url, details['body'], details['info'],
+                               as_area_items(details['areas']))
 
-    def __epicenter_information(self, url):
+    @staticmethod
+    def __epicenter_information(url, earthquake_details):
         '''
         フォーマット
         -----
@@ -220,22 +729,13 @@ class Earthquake():  # pylint: disable=R0902
         -----
         > 震源に関する情報
         '''
-        text = {}
-        earthquake_details = self.__request_text(url)
-        details_root = xmltodict.parse(earthquake_details)
-
-        text['title'] = '震源に関する情報'
-        text['body'] = details_root['Report']['Head']['Headline']['Text']
-        text['magnitude'] = details_root['Report']['Body']['Earthquake']['jmx_eb:Magnitude']['#text']
-        text['area'] = details_root['Report']['Body']['Earthquake']['Hypocenter']['Area']['Name']
-        text['info'] = details_root['Report']['Body']['Comments']['ForecastComment']['Text']
-        text['data'] = {
-            'event_id': details_root['Report']['Head']['EventID'],
-            'url': url
-        }
-        self.formated_text.append(text)
+        details = jmx.EPICENTER_INFORMATION.extract(earthquake_details)
 
-    def __information_on_epicenter_and_seismic_intensity(self, url):
+        return EpicenterReport(details['event_id'], url, details['body'], details['magnitude'], details['area'],
+                               details['info'], details['coordinate'])
+
+    @staticmethod
+    def __information_on_epicenter_and_seismic_intensity(url, earthquake_details):
         '''
         フォーマット
         -----
@@ -252,31 +752,18 @@ class Earthquake():  # pylint: disable=R0902
         -----
         > 震源・震度に関する情報 (震度3以上のみ)
         '''
-        text = {}
-        earthquake_details = self.__request_text(url)
-        details_root = xmltodict.parse(earthquake_details)
-
-        text['title'] = '震源・震度に関する情報'
-        text['body'] = details_root['Report']['Head']['Headline']['Text']
-        text['magnitude'] = details_root['Report']['Body']['Earthquake']['jmx_eb:Magnitude']['#text']
-        text['area'] = details_root['Report']['Body']['Earthquake']['Hypocenter']['Area']['Name']
-        text['max_seismic_intensity'] = str(details_root['Report']['Body']['Intensity']['Observation']['MaxInt'])
-        text['info'] = details_root['Report']['Body']['Comments']['ForecastComment']['Text']
-        text['data'] = {
-            'event_id': details_root['Report']['Head']['EventID'],
-            'url': url
-        }
-        if 'Information' in details_root['Report']['Head']['Headline']:
-            area_info = self.__format_area_detailed(details_root)
-            area_text = []
-            for element in area_info:
-                area_text.append(f'[{element}] {area_info[element]}')
-            text['areas'] = area_text
+        details = jmx.EPICENTER_AND_SEISMIC_INTENSITY.extract(earthquake_details)
 
-        if text['max_seismic_intensity'] in ['3', '4', '5-', '5+', '6-', '6+', '7']:
-            self.formated_text.append(text)
+        max_intensity = Intensity.parse(details['max_seismic_intensity'])
+        if max_intensity is None or max_intensity < Intensity.THREE:
+            return None
+        return EpicenterIntensityReport(
+            details['event_id'], url, details['body'], details['magnitude'], details['area'], details['info'],
+            details['coordinate'], max_intensity, details['has_information'],
+            as_area_items(details['areas']), as_area_items(details['regions']) or ())
 
-    def __earthquake_early_warning_forecast(self, url):
+    @staticmethod
+    def __earthquake_early_warning_forecast(url, earthquake_details):
         '''
         フォーマット
         -----
@@ -285,20 +772,12 @@ class Earthquake():  # pylint: disable=R0902
         -----
         > 緊急地震速報（予報）
         '''
-        text = {}
-        earthquake_details = self.__request_text(url)
-        details_root = xmltodict.parse(earthquake_details)
+        details = jmx.EARTHQUAKE_EARLY_WARNING.extract(earthquake_details)
 
-        text['title'] = '緊急地震速報(予報)'
-        text['body'] = details_root['Report']['Head']['Headline']['Text']
-        text['data'] = {
-            'event_id': details_root['Report']['Head']['EventID'],
-            'url': url
-        }
+        return EarlyWarningForecast(details['event_id'], url, details['body'])
 
-        self.formated_text.append(text)
-
-    def __earthquake_early_warning_alarm(self, url):
+    @staticmethod
+    def __earthquake_early_warning_alarm(url, earthquake_details):
         '''
         フォーマット
         -----
@@ -309,26 +788,12 @@ class Earthquake():  # pylint: disable=R0902
         -----
         > 緊急地震速報（警報）
         '''
-        text = {}
-        earthquake_details = self.__request_text(url)
-        details_root = xmltodict.parse(earthquake_details)
+        details = jmx.EARTHQUAKE_EARLY_WARNING.extract(earthquake_details)
 
-        text['title'] = '緊急地震速報 (警報)'
-        text['body'] = details_root['Report']['Head']['Headline']['Text']
-        text['data'] = {
-            'event_id': details_root['Report']['Head']['EventID'],
-            'url': url
-        }
-
-        area_info = self.__format_area(details_root)
-        area_text = []
-        for element in area_info:
-            area_text.append(area_info[element])
-        text['areas'] = area_text
+        return EarlyWarningAlarm(details['event_id'], url, details['body'], as_area_items(details['areas']) or ())
 
-        self.formated_text.append(text)
-
-    def __tsunami(self, url):
+    @staticmethod
+    def __tsunami(url, earthquake_details):
         '''
         フォーマット
         -----
@@ -340,111 +805,105 @@ class Earthquake():  # pylint: disable=R0902
         エリアは津波予報では表示されない
         > 津波関係すべて
         '''
-        text = {}
-        earthquake_details = self.__request_text(url)
-        details_root = xmltodict.parse(earthquake_details)
+        details = jmx.TSUNAMI.extract(earthquake_details)
 
-        text['title'] = details_root['Report']['Head']['Title']
-        text['body'] = details_root['Report']['Head']['Headline']['Text']
-        text['data'] = {
-            'event_id': details_root['Report']['Head']['EventID'],
-            'url': url
-        }
-
-        if 'Information' in details_root['Report']['Head']['Headline']:
-            area_info = self.__format_area(details_root)
-            text['area'] = area_info[0]
-
-        self.formated_text.append(text)
+        return Tsunami(details['event_id'], url, details['body'], details['title'], as_area_items(details['areas']))
 
-    def __format_area(self, details: Any) -> Dict[str, str]:
+    def __request_text(self, url: str) -> Optional[str]:
         '''
-        震度とエリアの情報をフォーマットします。
+        リンクの内容を返します。
 
         Args:
-            details (Any): 元データ
+            url (str): URL
 
         Returns:
-            Dict[str, str]: フォーマットされたデータ。例: {'震度4': 'エリア1', '震度3': 'エリア2, エリア3, エリア4'}
+            Optional[str]: 内容。取得できなかった場合はNone。
         '''
-        informations = details['Report']['Head']['Headline']['Information']
-        if isinstance(informations, list):
-            information = informations[0]['Item']
-        else:
-            information = informations['Item']
-
-        return self.__select_area(information)
+        try:
+            with metrics.STAGE_SECONDS.time(stage='detail_fetch'):
+                responce = self.http.get(url)
+        except requests.exceptions.RequestException:
+            metrics.ERRORS.inc(kind='detail_fetch')
+            return None
+        if not responce.ok:
+            metrics.ERRORS.inc(kind='detail_fetch')
+            return None
+        responce.encoding = 'UTF-8'
+        return responce.text
 
-    def __format_area_detailed(self, details: Any) -> Dict[str, str]:
+    def __merge_snapshot_files(self):
         '''
-        震度とエリアの情報をフォーマットします。震源・震度に関する情報用
-
-        Args:
-            details (Any): 元データ
-
-        Returns:
-            Dict[str, str]: フォーマットされたデータ。例: {'震度4': 'エリア1', '震度3': 'エリア2, エリア3, エリア4'}
-        '''
-        informations = details['Report']['Head']['Headline']['Information']
-        if isinstance(informations, list):
-            for element in informations:
-                if element['@type'] == '震源・震度に関する情報（市町村等）':
-                    infomation = element['Item']
-                    break
-            else:
-                return {'Null': 'No data.'}
-        else:
-            infomation = element['Item']
-
-        return self.__select_area(infomation)
+        スナップショットから状態ファイルを補います。
+        状態ファイルは変更のたびに書き込むため基本的にはファイルを優先し、無い場合と、
+        フィードのカーソルがスナップショットより古い場合のみ書き込みます。
+        '''
+        if self.snapshot is None:
+            return
+        for name, value in self.snapshot.get('files', {}).items():
+            path = os.path.join(self.directory, os.path.basename(name))
+            if os.path.isfile(path):
+                current = self.__load_buffer(path, None)
+                if not name.startswith('feed_cursor') or (current and parse_time(current['updated'])
+                                                          >= parse_time(value['updated'])):
+                    continue
+            json_write(path, value)
+            LOGGER.info('Restored %s from snapshot', name)
 
-    @staticmethod
-    def __select_area(information: Any) -> Dict[str, str]:
+    def __merge_snapshot_state(self, restore_delivery: bool):
         '''
-        エリアを取得します。
+        スナップショットの投稿済みの記録を追加し、送信待ちキューのファイルが無かった場合は送信待ちのメッセージを戻します。
 
         Args:
-            infomation[Any]: [{'Kind': {'Name': '震度'}, 'Areas': {'Area': [{'Name': '場所', 'Code': ''}]}}]
-        Returns:
-            Dict[str, str]: {'震度': 'エリア1、エリア2'}
-        '''
-        area_info = {}
-        if isinstance(information, list):
-            for individual in information:
-                seismic_intensity = individual['Kind']['Name']
-                areas = []
-                if isinstance(individual['Areas']['Area'], list):
-                    for area in individual['Areas']['Area']:
-                        areas.append(area['Name'])
-                else:
-                    areas.append(individual['Areas']['Area']['Name'])
-                area_info[seismic_intensity] = '、'.join(areas)
-        else:
-            seismic_intensity = information['Kind']['Name']
-            areas = []
-            if isinstance(information['Areas']['Area'], list):
-                for area in information['Areas']['Area']:
-                    areas.append(area['Name'])
-            else:
-                areas.append(information['Areas']['Area']['Name'])
-            area_info[seismic_intensity] = '、'.join(areas)
-
-        return area_info
+            restore_delivery (bool): 送信待ちのメッセージを戻すか
+        '''
+        if self.snapshot is None:
+            return
+        added = self.posted.merge(self.snapshot.get('posted', []))
+        if added:
+            LOGGER.info('Restored %d posted records from snapshot', added)
+        if not restore_delivery:
+            return
+        messages = []
+        for values in self.snapshot.get('delivery', []):
+            try:
+                messages.append(Event.from_dict(values))
+            except (KeyError, TypeError, ValueError):
+                LOGGER.warning('Discarded unreadable message in snapshot')
+        self.delivery.put_many(messages)
 
-    @staticmethod
-    def __request_text(url: str) -> Any:
+    def __restore_detail(self, url: str) -> bool:
         '''
-        リンクの内容を返します。
+        スナップショットにフォーマット済みの詳細情報があればキャッシュに追加します。
 
         Args:
-            url (str): URL
+            url (str): 詳細情報のURL
 
         Returns:
-            Any: 内容
+            bool: 追加した場合True
         '''
-        responce = requests.get(url)
-        responce.encoding = 'UTF-8'
-        return responce.text
+        if self.snapshot is None:
+            return False
+        details = self.snapshot.get('details', {})
+        if url not in details:
+            return False
+        try:
+            text = Event.from_dict(details[url]) if details[url] is not None else None
+        except (KeyError, TypeError, ValueError):
+            return False
+        self.detail_cache.put(url, text)
+        return True
+
+    def __import_legacy_posted(self):
+        '''
+        以前の形式(latest_earthquake_info.json)で保存された投稿済みの情報を読み込み、ファイルを削除します。
+        '''
+        legacy_path = os.path.join(self.directory, 'latest_earthquake_info.json')
+        if not os.path.isfile(legacy_path):
+            return
+        for data in json_read(legacy_path):
+            self.posted.add(data)
+        self.posted.compact(force=True)
+        os.remove(legacy_path)
 
     @staticmethod
     def __load_buffer(path: str, empty_element: Any) -> Any:
@@ -460,7 +919,11 @@ class Earthquake():  # pylint: disable=R0902
             Any: バッファの内容。新規作成した場合は`empty_element`がそのまま返される。
         '''
         if os.path.isfile(path):
-            buffer = json_read(path)
+            try:
+                buffer = json_read(path)
+            except ValueError:
+                # 以前のバージョンで書き込み中に停止して壊れたファイルは読み捨てる
+                buffer = empty_element
         else:
             buffer = empty_element
 
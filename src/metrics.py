@@ -0,0 +1,505 @@
+'''
+Copyright © 2020 YutoWatanabe
+'''
+import abc
+import bisect
+import contextlib
+import logging
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    from http.server import ThreadingHTTPServer  # pylint: disable=C0412
+except ImportError:  # Python 3.6
+    class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):  # type: ignore
+        '''
+        リクエストごとにスレッドで処理するHTTPサーバー。(Python 3.7以降のhttp.serverと同じ)
+        '''
+        daemon_threads = True
+
+LOGGER = logging.getLogger(__name__)
+
+# 秒単位のヒストグラムの境界
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# (サフィックス, ラベル, 値)
+Sample = Tuple[str, Dict[str, str], float]
+
+
+class Registry():
+    '''
+    メトリクスをまとめ、Prometheusのテキスト形式で出力します。
+    '''
+
+    def __init__(self):
+        self.metrics: List['Metric'] = []
+        self.lock = threading.Lock()
+
+    def register(self, metric: 'Metric'):
+        '''
+        メトリクスを登録します。
+
+        Args:
+            metric (Metric): メトリクス
+        '''
+        with self.lock:
+            self.metrics.append(metric)
+
+    def exposition(self) -> str:
+        '''
+        Prometheusのテキスト形式(text/plain; version=0.0.4)で出力します。
+
+        Returns:
+            str: すべてのメトリクス
+        '''
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics)
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for suffix, labels, value in metric.samples():
+                lines.append(f'{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Metric(abc.ABC):
+    '''
+    ラベルごとに値を保持するメトリクス。
+    '''
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 registry: Optional[Registry] = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        '''
+        ラベルの値を定義した順に並べます。
+
+        Args:
+            labels (Dict[str, Any]): ラベル
+
+        Returns:
+            Tuple[str, ...]: ラベルの値
+
+        Raises:
+            ValueError: ラベルが定義と一致しない場合
+        '''
+        if set(labels) != set(self.labels):
+            raise ValueError(f'{self.name} expects labels {self.labels}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labels)
+
+    @abc.abstractmethod
+    def samples(self) -> Iterator[Sample]:
+        '''
+        出力する値を返します。
+        '''
+
+    def label_dict(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        '''
+        ラベルの値をDictに戻します。
+
+        Args:
+            key (Tuple[str, ...]): ラベルの値
+
+        Returns:
+            Dict[str, str]: ラベル
+        '''
+        return dict(zip(self.labels, key))
+
+
+class Counter(Metric):
+    '''
+    増加のみするカウンタ。
+    '''
+    kind = 'counter'
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any):
+        '''
+        加算します。
+
+        Args:
+            amount (float): 加算する値
+            **labels (Any): ラベル
+        '''
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        '''
+        現在の値を返します。ラベルを省略した場合は合計を返します。
+
+        Returns:
+            float: 値
+        '''
+        with self.lock:
+            if not labels:
+                return sum(self.values.values())
+            return self.values.get(self.key(labels), 0.0)
+
+    def samples(self) -> Iterator[Sample]:
+        with self.lock:
+            values = sorted(self.values.items())
+        for key, value in values:
+            yield '_total', self.label_dict(key), value
+
+
+class Gauge(Metric):
+    '''
+    増減する値。`set_function`を指定した場合は出力時に値を求めます。
+    '''
+    kind = 'gauge'
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.function: Optional[Callable[[], Any]] = None
+
+    def set(self, value: float, **labels: Any):
+        '''
+        値を設定します。
+
+        Args:
+            value (float): 値
+            **labels (Any): ラベル
+        '''
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def set_function(self, function: Callable[[], Any]):
+        '''
+        出力時に値を求める関数を設定します。
+
+        Args:
+            function (Callable[[], Any]): ラベルが無い場合は値、ある場合は{ラベルの値のTuple: 値}を返す関数
+        '''
+        self.function = function
+
+    def samples(self) -> Iterator[Sample]:
+        values: Dict[Tuple[str, ...], float]
+        if self.function is not None:
+            try:
+                result = self.function()
+            except Exception:  # pylint: disable=W0703
+                LOGGER.exception('Failed to collect %s', self.name)
+                return
+            values = result if self.labels else {(): result}
+        else:
+            with self.lock:
+                values = dict(self.values)
+        for key, value in sorted(values.items()):
+            yield '', self.label_dict(key), value
+
+
+class Histogram(Metric):
+    '''
+    値の分布。Prometheusのhistogramと同じく累積のバケットで出力します。
+    '''
+    kind = 'histogram'
+
+    def __init__(self, *args: Any, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # ラベルの値: [各バケットの件数(+Infを含む), 合計]
+        self.values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any):
+        '''
+        値を記録します。
+
+        Args:
+            value (float): 値
+            **labels (Any): ラベル
+        '''
+        key = self.key(labels)
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            counts, total = self.values[key]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        '''
+        withブロックの経過時間(秒)を記録します。
+
+        Args:
+            **labels (Any): ラベル
+        '''
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels: Any) -> int:
+        '''
+        記録した件数を返します。ラベルを省略した場合は合計を返します。
+
+        Returns:
+            int: 件数
+        '''
+        with self.lock:
+            if not labels:
+                return sum(sum(counts) for counts, _ in self.values.values())
+            counts, _ = self.values.get(self.key(labels), ([0], [0.0]))
+            return sum(counts)
+
+    def quantile(self, quantile: float, **labels: Any) -> Optional[float]:
+        '''
+        バケットから分位数を推定します。(バケット内は線形補間)
+
+        Args:
+            quantile (float): 0から1
+            **labels (Any): ラベル
+
+        Returns:
+            Optional[float]: 推定値。記録が無い場合はNone
+        '''
+        with self.lock:
+            if labels:
+                entries = [self.values[self.key(labels)]] if self.key(labels) in self.values else []
+            else:
+                entries = list(self.values.values())
+            counts = [sum(values) for values in zip(*(counts for counts, _ in entries))]
+        total = sum(counts)
+        if total == 0:
+            return None
+
+        rank = quantile * total
+        cumulative = 0
+        for index, count in enumerate(counts):
+            if cumulative + count >= rank and count > 0:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def samples(self) -> Iterator[Sample]:
+        with self.lock:
+            values = sorted((key, (list(counts), total[0])) for key, (counts, total) in self.values.items())
+        for key, (counts, total) in values:
+            labels = self.label_dict(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield '_bucket', dict(labels, le=_format_value(bound)), cumulative
+            yield '_sum', labels, total
+            yield '_count', labels, cumulative
+
+
+STAGE_SECONDS = Histogram(
+    'alert_bot_stage_seconds', 'Time spent in each stage of a cycle.', ('stage',))
+FORMAT_SECONDS = Histogram(
+    'alert_bot_format_seconds', 'Time to parse and format a detail document, by message type.', ('type',))
+DELIVERY_LATENCY_SECONDS = Histogram(
+    'alert_bot_delivery_latency_seconds', 'Time from detecting an entry in the feed to the broadcast call.',
+    ('type',))
+POLLS = Counter('alert_bot_polls', 'Feed polls.', ('feed',))
+NOT_MODIFIED = Counter(
+    'alert_bot_not_modified', 'Feed polls answered with 304 or unchanged validators.', ('feed',))
+BACKFILLS = Counter('alert_bot_backfills', 'Polls that read the long feed to fill a gap in the short feed.', ('feed',))
+ENTRIES = Counter('alert_bot_entries', 'New feed entries read.')
+MESSAGES_SENT = Counter('alert_bot_messages_sent', 'Messages broadcast to LINE.', ('type',))
+CONSOLIDATED = Counter(
+    'alert_bot_consolidated', 'Bulletins merged into another message for the same EventID instead of being sent.',
+    ('type',))
+ERRORS = Counter('alert_bot_errors', 'Errors by kind.', ('kind',))
+MULTICAST_RECIPIENTS = Counter(
+    'alert_bot_multicast_recipients', 'Recipients of targeted messages; each counts against the message quota.',
+    ('type',))
+SHED = Counter(
+    'alert_bot_shed', 'Messages dropped (suppressed, coalesced) or held back (rate_limited) in degraded mode.',
+    ('type', 'reason'))
+MODE_TRANSITIONS = Counter(
+    'alert_bot_mode_transitions', 'Switches between normal and degraded (load-shedding) delivery.', ('mode',))
+DEGRADED = Gauge('alert_bot_degraded', '1 while delivery is degraded after seismic intensity 7, otherwise 0.')
+SUBSCRIBERS = Gauge('alert_bot_subscribers', 'Registered subscribers for targeted delivery.')
+STATE_FILE_BYTES = Gauge('alert_bot_state_file_bytes', 'Size of each state file.', ('file',))
+QUEUE_DEPTH = Gauge('alert_bot_delivery_queue_depth', 'Messages waiting to be broadcast.')
+QUEUE_AGE = Gauge('alert_bot_delivery_queue_age_seconds', 'Age of the oldest message waiting to be broadcast.')
+HTTP_CONNECTIONS = Gauge('alert_bot_http_connections', 'HTTP requests to JMA by connection state.', ('state',))
+POLL_INTERVAL = Gauge('alert_bot_poll_interval_seconds', 'Current polling interval.', ('feed',))
+
+
+def file_sizes(directory: str) -> Dict[Tuple[str, ...], float]:
+    '''
+    ディレクトリ内のファイルサイズを返します。
+
+    Args:
+        directory (str): ディレクトリ
+
+    Returns:
+        Dict[Tuple[str, ...], float]: {(ファイル名,): サイズ(byte)}
+    '''
+    sizes: Dict[Tuple[str, ...], float] = {}
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            sizes[(name,)] = os.path.getsize(path)
+    return sizes
+
+
+def summary() -> str:
+    '''
+    ログに出力する要約を返します。
+
+    Returns:
+        str: 要約
+    '''
+    parts = [
+        f'polls={POLLS.value():.0f}',
+        f'not_modified={NOT_MODIFIED.value():.0f}',
+        f'backfills={BACKFILLS.value():.0f}',
+        f'entries={ENTRIES.value():.0f}',
+        f'sent={MESSAGES_SENT.value():.0f}',
+        f'consolidated={CONSOLIDATED.value():.0f}',
+        f'shed={SHED.value():.0f}',
+        f'errors={ERRORS.value():.0f}',
+    ]
+    for name, histogram, labels in (
+            ('latency', DELIVERY_LATENCY_SECONDS, {}),
+            ('check_update', STAGE_SECONDS, {'stage': 'check_update'}),
+            ('detail_fetch', STAGE_SECONDS, {'stage': 'detail_fetch'}),
+            ('find_latest', STAGE_SECONDS, {'stage': 'find_latest'}),
+            ('broadcast', STAGE_SECONDS, {'stage': 'broadcast'})):
+        median = histogram.quantile(0.5, **labels)
+        if median is not None:
+            p95 = histogram.quantile(0.95, **labels) or 0.0
+            parts.append(f'{name}_p50={median * 1000:.1f}ms {name}_p95={p95 * 1000:.1f}ms')
+    return ' '.join(parts)
+
+
+class SummaryLogger():
+    '''
+    一定間隔でメトリクスの要約をログに出力します。
+    '''
+
+    def __init__(self, interval: float = 300.0):
+        self.interval = interval
+        self.__stopped = threading.Event()
+
+    def start(self):
+        '''
+        出力を開始します。
+        '''
+        threading.Thread(target=self.__run, name='metrics-summary', daemon=True).start()
+
+    def stop(self):
+        '''
+        出力を停止します。
+        '''
+        self.__stopped.set()
+
+    def __run(self):
+        while not self.__stopped.wait(self.interval):
+            LOGGER.info('Metrics: %s', summary())
+
+
+class MetricsServer():
+    '''
+    `/metrics`でメトリクスを公開するHTTPサーバー。
+    '''
+
+    def __init__(self, port: int = 9100, host: str = '127.0.0.1', registry: Registry = REGISTRY):
+        self.port = port
+        self.host = host
+        self.registry = registry
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    def start(self):
+        '''
+        HTTPサーバーを起動します。
+        '''
+        self.server = ThreadingHTTPServer((self.host, self.port), _handler(self.registry))
+        threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True).start()
+        LOGGER.info('Metrics listening on http://%s:%d/metrics', self.host, self.server.server_address[1])
+
+    def stop(self):
+        '''
+        HTTPサーバーを停止します。
+        '''
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+def _handler(registry: Registry) -> type:
+    '''
+    レジストリを出力するリクエストハンドラを生成します。
+
+    Args:
+        registry (Registry): レジストリ
+
+    Returns:
+        type: BaseHTTPRequestHandlerのサブクラス
+    '''
+
+    class Handler(BaseHTTPRequestHandler):
+        '''
+        メトリクスを返します。
+        '''
+
+        def do_GET(self):  # pylint: disable=C0103
+            '''
+            /metrics
+            '''
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.exposition().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # pylint: disable=W0622
+            LOGGER.debug(format, *args)
+
+    return Handler
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    '''
+    ラベルを出力形式にします。例: {stage="check_update"}
+    '''
+    if not labels:
+        return ''
+    escaped = (
+        f'{name}="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in labels.items())
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value: float) -> str:
+    '''
+    値を出力形式にします。
+    '''
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
@@ -0,0 +1,324 @@
+'''
+Copyright © 2020 YutoWatanabe
+
+記録したフィード(eqvol.xml)と詳細情報を、実際のEarthquakeの処理に流して再生します。
+気象庁・LINEには接続せず、詳細情報のURLはローカルのファイル、送信は記録用のシンクに置き換えます。
+
+    python src/replay.py [ディレクトリ] --speed 100 --output sent.jsonl
+
+ディレクトリの構成:
+    feeds/20240101T161100Z.xml   フィードのスナップショット。ファイル名の時刻(UTC)の順に再生します
+                                 (ファイル名に時刻が無い場合はフィードのupdated)
+    data/xxxx.xml                詳細情報。URLのファイル名で対応付けます
+feeds/ が無い場合は、ディレクトリ直下の eqvol*.xml を再生します。(make_fixtures.pyで生成したbenchmark/fixtures/m7 など)
+'''
+import calendar
+import collections
+import contextlib
+import glob
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Dict, List, NamedTuple, Optional, TextIO
+from urllib.parse import urlparse
+
+import click
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from feed import ATOM, parse_time
+from main import Earthquake
+import metrics
+from template import template_key
+
+LOGGER = logging.getLogger(__name__)
+
+FEED_URL = 'http://replay.invalid/eqvol.xml'
+# 送信を記録するLINE APIのエンドポイント
+LINE_ENDPOINT = 'http://line.replay.invalid'
+_TIMESTAMP_PATTERN = re.compile(r'(\d{8})T?(\d{6})')
+
+
+class Snapshot(NamedTuple):
+    '''
+    フィードのスナップショット。
+    '''
+    time: float
+    path: str
+
+
+def find_snapshots(directory: str) -> List[Snapshot]:
+    '''
+    スナップショットを時刻の順に返します。
+
+    Args:
+        directory (str): 記録したディレクトリ
+
+    Returns:
+        List[Snapshot]: スナップショット
+    '''
+    feeds = os.path.join(directory, 'feeds')
+    if os.path.isdir(feeds):
+        paths = glob.glob(os.path.join(feeds, '*.xml'))
+    else:
+        paths = glob.glob(os.path.join(directory, 'eqvol*.xml'))
+    return sorted((Snapshot(snapshot_time(path), path) for path in paths))
+
+
+def snapshot_time(path: str) -> float:
+    '''
+    スナップショットの時刻を返します。ファイル名の時刻(UTC)、無い場合はフィードのupdated。
+
+    Args:
+        path (str): スナップショットのファイル
+
+    Returns:
+        float: UNIX時間
+    '''
+    match = _TIMESTAMP_PATTERN.search(os.path.basename(path))
+    if match:
+        return float(calendar.timegm(time.strptime(''.join(match.groups()), '%Y%m%d%H%M%S')))
+    for _, element in ET.iterparse(path):
+        if element.tag == f'{ATOM}updated':
+            return parse_time(element.text or '')
+    return os.path.getmtime(path)
+
+
+def _response(request: requests.PreparedRequest, status_code: int, content: bytes = b'',
+              headers: Optional[Dict[str, str]] = None) -> requests.Response:
+    '''
+    requests.Responseを生成します。
+    '''
+    responce = requests.Response()
+    responce.status_code = status_code
+    responce._content = content  # pylint: disable=W0212
+    responce.headers = CaseInsensitiveDict(headers or {})
+    responce.url = request.url or ''
+    responce.request = request
+    return responce
+
+
+class ArchiveAdapter(BaseAdapter):
+    '''
+    フィードのURLには再生中のスナップショット、それ以外のURLにはdata/の同じ名前のファイルを返します。
+    スナップショットの時刻をLast-Modifiedとして返し、条件付きGETに対応します。
+    '''
+
+    def __init__(self, directory: str):
+        super().__init__()
+        self.data_directory = os.path.join(directory, 'data')
+        if not os.path.isdir(self.data_directory):
+            self.data_directory = directory
+        self.snapshot: Optional[Snapshot] = None
+        self.requests = 0
+        self.missing = 0
+
+    def send(self, request: requests.PreparedRequest, stream: bool = False,  # pylint: disable=R0913,W0221
+             timeout: Any = None, verify: Any = True, cert: Any = None, proxies: Any = None) -> requests.Response:
+        self.requests += 1
+        if request.url == FEED_URL:
+            return self.__feed(request)
+
+        path = os.path.join(self.data_directory, os.path.basename(urlparse(str(request.url)).path))
+        if not os.path.isfile(path):
+            self.missing += 1
+            LOGGER.warning('No archived document for %s', request.url)
+            return _response(request, 404)
+        with open(path, mode='rb') as file:
+            return _response(request, 200, file.read(), {'Content-Type': 'application/xml'})
+
+    def close(self):
+        pass
+
+    def __feed(self, request: requests.PreparedRequest) -> requests.Response:
+        '''
+        再生中のスナップショットを返します。
+        '''
+        if self.snapshot is None:
+            return _response(request, 404)
+        last_modified = formatdate(self.snapshot.time, usegmt=True)
+        since = request.headers.get('If-Modified-Since')
+        if since is not None and parsedate_to_datetime(since).timestamp() >= self.snapshot.time:
+            return _response(request, 304)
+        with open(self.snapshot.path, mode='rb') as file:
+            return _response(request, 200, file.read(), {
+                'Content-Type': 'application/atom+xml', 'Last-Modified': last_modified})
+
+
+class RecordingSink(BaseAdapter):
+    '''
+    LINE APIの代わりに送信された内容を記録します。
+    `LINE_ENDPOINT`にマウントするため、震度7の配信を絞るおしらせも記録されます。
+    '''
+
+    def __init__(self, output: Optional[TextIO] = None):
+        super().__init__()
+        self.output = output
+        self.clock = time.time
+        self.requests = 0
+        self.messages: List[Any] = []
+
+    def send(self, request: requests.PreparedRequest, stream: bool = False,  # pylint: disable=R0913,W0221
+             timeout: Any = None, verify: Any = True, cert: Any = None, proxies: Any = None) -> requests.Response:
+        self.requests += 1
+        body = json.loads(request.body or b'{}')
+        for message in body.get('messages', []):
+            self.messages.append(message)
+        if self.output is not None:
+            record = {'time': self.clock(), 'path': urlparse(str(request.url)).path,
+                      'messages': body.get('messages', [])}
+            self.output.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return _response(request, 200, b'{}', {'Content-Type': 'application/json'})
+
+    def close(self):
+        pass
+
+
+class Replay():  # pylint: disable=R0902
+    '''
+    スナップショットを順に再生します。
+    '''
+
+    def __init__(self, directory: str, save_directory: str, sink: RecordingSink,  # pylint: disable=R0913
+                 speed: float = 0.0, report_window: float = 3600.0, aggregate_window: float = 60.0):
+        self.snapshots = find_snapshots(directory)
+        self.speed = speed
+        self.sink = sink
+        self.adapter = ArchiveAdapter(directory)
+        self.simulated_time = self.snapshots[0].time if self.snapshots else time.time()
+        sink.clock = lambda: self.simulated_time
+
+        self.earthquake = Earthquake(
+            save_directory, FEED_URL, 'replay', report_window=report_window, aggregate_window=aggregate_window,
+            clock=lambda: self.simulated_time, detail_hosts=None, line_endpoint=LINE_ENDPOINT)
+        self.earthquake.http.session.mount('http://', self.adapter)
+        self.earthquake.http.session.mount('https://', self.adapter)
+        self.earthquake.http.session.mount(LINE_ENDPOINT, sink)
+
+        self.cycles = 0
+        self.updated = 0
+        self.processed: List[Any] = []
+
+    def run(self) -> float:
+        '''
+        再生します。
+
+        Returns:
+            float: 経過時間(秒)
+        '''
+        started = time.perf_counter()
+        self.earthquake.delivery.start()
+        try:
+            for snapshot in self.snapshots:
+                self.__wait(snapshot.time, started)
+                self.simulated_time = snapshot.time
+                self.adapter.snapshot = snapshot
+                self.cycles += 1
+                if self.earthquake.check_update():
+                    self.updated += 1
+                    self.processed.extend(self.earthquake.process())
+                else:
+                    self.processed.extend(self.earthquake.flush())
+            # 記録の終わりでまとめるのを待っている情報は、期間が過ぎたものとして送信する
+            if self.earthquake.aggregator.pending():
+                self.simulated_time += self.earthquake.aggregator.window
+                self.processed.extend(self.earthquake.flush())
+        finally:
+            self.earthquake.delivery.join(60)
+            self.earthquake.delivery.stop()
+        return time.perf_counter() - started
+
+    def __wait(self, target: float, started: float):
+        '''
+        再生速度に合わせて待機します。
+
+        Args:
+            target (float): 次のスナップショットの時刻
+            started (float): 再生を開始した時刻(time.perf_counter)
+        '''
+        if self.speed <= 0 or not self.snapshots:
+            return
+        delay = (target - self.snapshots[0].time) / self.speed - (time.perf_counter() - started)
+        if delay > 0:
+            time.sleep(delay)
+
+    def summary(self, elapsed: float) -> List[str]:
+        '''
+        再生結果の要約を返します。
+
+        Args:
+            elapsed (float): 経過時間(秒)
+
+        Returns:
+            List[str]: 要約の各行
+        '''
+        types = collections.Counter(template_key(message.title) for message in self.processed)
+        reports = sum(1 for message in self.processed if message.report > 1)
+        keys = collections.Counter(
+            (message.event_id, message.url) for message in self.processed)
+        duplicates = sum(count - 1 for count in keys.values())
+        span = self.snapshots[-1].time - self.snapshots[0].time if self.snapshots else 0.0
+
+        lines = [
+            f'snapshots: {len(self.snapshots)} ({span / 3600:.1f} h recorded), cycles: {self.cycles}, '
+            f'updated: {self.updated}, elapsed: {elapsed:.2f} s ({self.cycles / max(elapsed, 1e-9):.1f} cycles/s)',
+            f'messages: {len(self.processed)} formatted, {len(self.sink.messages)} sent '
+            f'in {self.sink.requests} API calls, 第n報: {reports}, duplicates: {duplicates}',
+            f'documents: {self.adapter.requests} requests, {self.adapter.missing} missing',
+        ]
+        lines.extend(f'  {name}: {count}' for name, count in sorted(types.items()))
+        if metrics.MODE_TRANSITIONS.value(mode='degraded'):
+            degraded = self.earthquake.degraded
+            until = formatdate(degraded.until, usegmt=True) if degraded.until is not None else 'recovered'
+            lines.append(f'degraded mode: entered {metrics.MODE_TRANSITIONS.value(mode="degraded"):.0f} times, '
+                         f'shed {metrics.SHED.value():.0f} messages, {degraded.held()} held, until {until}')
+        lines.append(f'metrics: {metrics.summary()}')
+        return lines
+
+
+@click.command()
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--speed', default=0.0, show_default=True, help='再生速度(倍)。0の場合は待機せずに再生します')
+@click.option('--output', default=None, type=click.Path(dir_okay=False), help='送信した内容を書き込むJSON Linesファイル')
+@click.option('--save-directory', default=None, type=click.Path(file_okay=False),
+              help='状態を保存するディレクトリ。指定しない場合は一時ディレクトリ')
+@click.option('--report-window', default=3600.0, show_default=True, help='同じ本文を第n報として数える期間(秒)')
+@click.option('--aggregate-window', default=60.0, show_default=True,
+              help='同じ地震の2件目以降の震度速報・震源に関する情報を1件の更新にまとめるまで待つ期間(秒)。最初の情報は待ちません')
+@click.option('--verbose', is_flag=True, help='処理のログを出力します')
+def main(directory: str, speed: float, output: Optional[str],  # pylint: disable=R0913
+         save_directory: Optional[str], report_window: float, aggregate_window: float, verbose: bool):
+    '''
+    記録したフィードを再生します。
+
+    Args:
+        directory (str): 記録したディレクトリ
+        speed (float): 再生速度(倍)
+        output (Optional[str]): 送信した内容を書き込むファイル
+        save_directory (Optional[str]): 状態を保存するディレクトリ
+        report_window (float): 同じ本文を第n報として数える期間(秒)
+        aggregate_window (float): 同じ地震の2件目以降の情報をまとめるまで待つ期間(秒)
+        verbose (bool): ログを出力するか
+    '''
+    logging.basicConfig(level=logging.INFO if verbose else logging.WARNING,
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    with contextlib.ExitStack() as stack:
+        temporary = stack.enter_context(tempfile.TemporaryDirectory())
+        recorded = stack.enter_context(open(output, mode='w', encoding='utf-8')) if output else None
+        replay = Replay(directory, save_directory or temporary, RecordingSink(recorded), speed, report_window,
+                        aggregate_window)
+        if not replay.snapshots:
+            raise click.UsageError(f'No feed snapshots found in {directory}')
+        elapsed = replay.run()
+        for line in replay.summary(elapsed):
+            click.echo(line)
+
+
+if __name__ == '__main__':
+    main()  # pylint: disable=E1120
@@ -1,61 +1,101 @@
 '''
 Copyright © 2020 YutoWatanabe
 '''
+import heapq
 import os
-import datetime
+import time
+from typing import Dict, List, Optional, Tuple
 
 from json_operation import json_read, json_write
 
 
-def format_report(save_directory: str, body: str) -> int:
+class ReportTracker():
     '''
-    第何報かを返します。
-    - 比較対象は前回のものから1h(3600s)
-    - 本文が同じ内容だった場合に対してReturnが+1ずつ増加していきます
+    第何報かを管理します。
+    - 比較対象は前回のものから`window`秒(デフォルト1h)
+    - 本文が同じ内容だった場合に対して第何報かが+1ずつ増加していきます
 
-    Args:
-        save_directory(str): ファイルを保存するディレクトリ
-        body(str): 本文
-
-    Returns:
-        int: 第何報か
+    本文ごとの回数はメモリ上で管理し、ファイルへは変更があった場合にsaveで書き込みます。
     '''
-    save_file_path = os.path.join(save_directory, 'report.json')
-    now = datetime.datetime.now()
-
-    if os.path.isfile(save_file_path):
-        previous_data = json_read(save_file_path)
-    else:
-        previous_data = []
-
-    if previous_data != []:
-        delete_data = []
-        for index, element in enumerate(previous_data):
-            date = datetime.datetime.strptime(str(element['date']), r'%Y%m%d%H%M%S')
-            diff_date = now - date
-            if diff_date.seconds > 3600:
-                delete_data.append(index)
-
-        delete_data.sort(reverse=True)
-        for element in delete_data:
-            del previous_data[element]
-
-    is_existence = False
-    for element in previous_data:
-        if body == element['subject']:
-            is_existence = True
-            element['report'] += 1
-            report = element['report']
-            element['date'] = now.strftime(r'%Y%m%d%H%M%S')
-            break
-    if not is_existence:
-        report = 1
-        data = {
-            'date': now.strftime(r'%Y%m%d%H%M%S'),
-            'subject': body,
-            'report': report
-        }
-        previous_data.append(data)
-
-    json_write(save_file_path, previous_data)
-    return report
+
+    def __init__(self, save_directory: str, window: float = 3600.0):
+        self.save_file_path = os.path.join(save_directory, 'report.json')
+        self.window = window
+        # 本文: [第何報か, 期限(UNIX時間)]
+        self.__reports: Dict[str, List[float]] = {}
+        # (期限, 本文)。更新前の古い要素も残るため、取り出すときに期限を確認する
+        self.__expiry: List[Tuple[float, str]] = []
+        self.__changed = False
+        self.__load()
+
+    def next(self, body: str, now: Optional[float] = None) -> int:
+        '''
+        第何報かを返します。
+
+        Args:
+            body(str): 本文
+            now (Optional[float]): 現在時刻(UNIX時間)
+
+        Returns:
+            int: 第何報か
+        '''
+        now = time.time() if now is None else now
+        self.expire(now)
+
+        report = self.__reports.get(body)
+        if report is None:
+            report = [0, 0.0]
+            self.__reports[body] = report
+        report[0] += 1
+        report[1] = now + self.window
+        heapq.heappush(self.__expiry, (report[1], body))
+        self.__changed = True
+
+        return int(report[0])
+
+    def expire(self, now: Optional[float] = None):
+        '''
+        期限切れの要素を削除します。
+
+        Args:
+            now (Optional[float]): 現在時刻(UNIX時間)
+        '''
+        now = time.time() if now is None else now
+        while self.__expiry and self.__expiry[0][0] <= now:
+            expires, body = heapq.heappop(self.__expiry)
+            report = self.__reports.get(body)
+            if report is not None and report[1] == expires:
+                del self.__reports[body]
+                self.__changed = True
+
+    def save(self):
+        '''
+        変更があった場合のみファイルに保存します。
+        '''
+        if not self.__changed:
+            return
+        json_write(self.save_file_path, [
+            {'subject': body, 'report': int(report), 'expires': expires}
+            for body, (report, expires) in self.__reports.items()])
+        self.__changed = False
+
+    def __load(self):
+        '''
+        ファイルから読み込みます。
+        '''
+        if not os.path.isfile(self.save_file_path):
+            return
+        try:
+            elements = json_read(self.save_file_path)
+        except ValueError:
+            return
+
+        for element in elements:
+            if 'expires' in element:
+                expires = float(element['expires'])
+            else:
+                # 以前の形式({'date': '%Y%m%d%H%M%S', ...})
+                date = time.strptime(str(element['date']), r'%Y%m%d%H%M%S')
+                expires = time.mktime(date) + self.window
+            self.__reports[element['subject']] = [element['report'], expires]
+            heapq.heappush(self.__expiry, (expires, element['subject']))
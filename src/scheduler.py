@@ -0,0 +1,142 @@
+'''
+Copyright © 2020 YutoWatanabe
+'''
+import logging
+import random
+import time
+from typing import Iterable, List, Optional
+
+from cache import LRUCache
+import metrics
+
+LOGGER = logging.getLogger(__name__)
+
+
+class PollScheduler():  # pylint: disable=R0902
+    '''
+    ポーリング間隔を決定します。
+    新しいEventIDを受信した場合・最後に情報を受信してから`active_window`秒の間は`min_interval`で取得し、
+    それ以外は`decay`倍ずつ`max_interval`まで間隔を広げます。
+    '''
+
+    def __init__(self, min_interval: float = 5.0, max_interval: float = 60.0,  # pylint: disable=R0913
+                 decay: float = 1.5, active_window: float = 600.0, jitter: float = 0.1, name: str = 'eqvol'):
+        self.name = name
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.decay = decay
+        self.active_window = active_window
+        self.jitter = jitter
+        self.interval = min_interval
+        self.last_activity: Optional[float] = None
+        self.__event_ids = LRUCache(1024)
+        self.__active = False
+
+    def observe(self, event_ids: Iterable[str], now: Optional[float] = None):
+        '''
+        今回のポーリングで受信した情報を記録します。
+
+        Args:
+            event_ids (Iterable[str]): 受信した情報のEventID。受信しなかった場合は空
+            now (Optional[float]): 現在時刻(UNIX時間)
+        '''
+        now = time.time() if now is None else now
+        received = False
+        for event_id in event_ids:
+            received = True
+            if event_id not in self.__event_ids:
+                LOGGER.info('New event: %s (%s)', event_id, self.name)
+            self.__event_ids.put(event_id, now)
+        if received:
+            self.last_activity = now
+
+    def is_active(self, now: Optional[float] = None) -> bool:
+        '''
+        地震活動中か判定します。
+
+        Args:
+            now (Optional[float]): 現在時刻(UNIX時間)
+
+        Returns:
+            bool: 最後に情報を受信してから`active_window`秒以内の場合True
+        '''
+        now = time.time() if now is None else now
+        return self.last_activity is not None and now - self.last_activity < self.active_window
+
+    def next_interval(self, now: Optional[float] = None) -> float:
+        '''
+        次のポーリングまでの待機時間を返します。
+
+        Args:
+            now (Optional[float]): 現在時刻(UNIX時間)
+
+        Returns:
+            float: 待機時間(秒)。ジッターを含む
+        '''
+        active = self.is_active(now)
+        if active:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * self.decay)
+
+        metrics.POLL_INTERVAL.set(self.interval, feed=self.name)
+
+        if active != self.__active:
+            self.__active = active
+            LOGGER.info('Polling mode of %s: %s (interval %.1fs)',
+                        self.name, 'active' if active else 'quiet', self.interval)
+        LOGGER.debug('Next poll of %s in %.1fs', self.name, self.interval)
+
+        return max(self.interval * random.uniform(1 - self.jitter, 1 + self.jitter), 0.0)
+
+
+class FeedScheduler():
+    '''
+    複数のフィードのポーリングをまとめて管理します。
+    フィードごとのPollSchedulerで間隔を決め、次に取得するフィードと待機時間を返します。
+    '''
+
+    def __init__(self, schedulers: Iterable[PollScheduler]):
+        self.schedulers = {scheduler.name: scheduler for scheduler in schedulers}
+        # 次に取得する時刻(UNIX時間)。起動直後はすべてのフィードを取得する
+        self.__due = {name: 0.0 for name in self.schedulers}
+
+    def due(self, now: Optional[float] = None) -> List[str]:
+        '''
+        取得する時刻になったフィードを返します。
+
+        Args:
+            now (Optional[float]): 現在時刻(UNIX時間)
+
+        Returns:
+            List[str]: フィードの名前
+        '''
+        now = time.time() if now is None else now
+        return [name for name, due in self.__due.items() if due <= now]
+
+    def observe(self, name: str, event_ids: Iterable[str], now: Optional[float] = None):
+        '''
+        フィードを取得した結果を記録し、次に取得する時刻を決めます。
+
+        Args:
+            name (str): フィードの名前
+            event_ids (Iterable[str]): 受信した情報のEventID。受信しなかった場合は空
+            now (Optional[float]): 現在時刻(UNIX時間)
+        '''
+        now = time.time() if now is None else now
+        scheduler = self.schedulers[name]
+        scheduler.observe(event_ids, now)
+        self.__due[name] = now + scheduler.next_interval(now)
+
+    def next_wait(self, now: Optional[float] = None) -> float:
+        '''
+        次にいずれかのフィードを取得するまでの待機時間を返します。
+
+        Args:
+            now (Optional[float]): 現在時刻(UNIX時間)
+
+        Returns:
+            float: 待機時間(秒)
+        '''
+        now = time.time() if now is None else now
+        return max(min(self.__due.values(), default=now) - now, 0.0)
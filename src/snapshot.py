@@ -0,0 +1,132 @@
+'''
+Copyright © 2020 YutoWatanabe
+
+再起動時に状態を復元するためのスナップショット。
+状態をセクションごとに圧縮したJSONとして1つのファイルに書き込み、読み込み時はファイルをmmapして
+使用するセクションのみ展開します。
+
+    [MAGIC][索引の長さ(8バイト, little endian)][索引(JSON)][セクション...]
+    索引: {セクション名: [索引の後ろからのオフセット, 長さ]}
+'''
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+from typing import Any, Dict, Optional
+
+from json_operation import atomic_write, dumps
+
+LOGGER = logging.getLogger(__name__)
+
+MAGIC = b'LINE-alert-bot snapshot 1\n'
+_LENGTH = struct.Struct('<Q')
+
+
+def write_snapshot(path: str, sections: Dict[str, Any]) -> int:
+    '''
+    スナップショットをアトミックに書き込みます。
+
+    Args:
+        path (str): ファイルのパス
+        sections (Dict[str, Any]): {セクション名: JSONにできる内容}
+
+    Returns:
+        int: ファイルのサイズ(バイト)
+    '''
+    index: Dict[str, Any] = {}
+    chunks = []
+    offset = 0
+    for name, value in sections.items():
+        chunk = zlib.compress(dumps(value).encode('utf-8'), 1)
+        index[name] = [offset, len(chunk)]
+        chunks.append(chunk)
+        offset += len(chunk)
+    header = dumps(index).encode('utf-8')
+    atomic_write(path, [MAGIC, _LENGTH.pack(len(header)), header] + chunks, binary=True)
+    return len(MAGIC) + _LENGTH.size + len(header) + offset
+
+
+class Snapshot():
+    '''
+    読み込んだスナップショット。
+    セクションは最初に参照した時に展開し、展開した内容を保持します。
+    '''
+
+    def __init__(self, path: str):
+        '''
+        Args:
+            path (str): ファイルのパス
+
+        Raises:
+            OSError: ファイルを開けない場合
+            ValueError: スナップショットの形式ではない場合
+        '''
+        self.path = path
+        with open(path, mode='rb') as contents:
+            self.__map = mmap.mmap(contents.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if self.__map[:len(MAGIC)] != MAGIC:
+                raise ValueError(f'{path} is not a snapshot')
+            start = len(MAGIC) + _LENGTH.size
+            length, = _LENGTH.unpack_from(self.__map, len(MAGIC))
+            self.__index: Dict[str, Any] = json.loads(self.__map[start:start + length].decode('utf-8'))
+            self.__base = start + length
+        except (ValueError, struct.error):
+            self.__map.close()
+            raise
+        self.__sections: Dict[str, Any] = {}
+
+    @staticmethod
+    def open(path: str) -> Optional['Snapshot']:
+        '''
+        スナップショットを開きます。
+
+        Args:
+            path (str): ファイルのパス
+
+        Returns:
+            Optional[Snapshot]: スナップショット。ファイルが無い・壊れている場合はNone
+        '''
+        if not os.path.isfile(path):
+            return None
+        try:
+            return Snapshot(path)
+        except (OSError, ValueError) as error:
+            LOGGER.warning('Ignored unreadable snapshot %s: %s', path, error)
+            return None
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.__index
+
+    def get(self, name: str, default: Any = None) -> Any:
+        '''
+        セクションの内容を返します。
+
+        Args:
+            name (str): セクション名
+            default (Any): セクションが無い・壊れている場合に返す値
+
+        Returns:
+            Any: 内容
+        '''
+        if name in self.__sections:
+            return self.__sections[name]
+        if name not in self.__index or self.__map.closed:
+            return default
+        offset, length = self.__index[name]
+        start = self.__base + offset
+        try:
+            value = json.loads(zlib.decompress(self.__map[start:start + length]).decode('utf-8'))
+        except (ValueError, zlib.error) as error:
+            LOGGER.warning('Ignored broken section %s in %s: %s', name, self.path, error)
+            value = default
+        self.__sections[name] = value
+        return value
+
+    def close(self):
+        '''
+        ファイルを閉じます。展開済みのセクションは引き続き参照できます。
+        '''
+        self.__map.close()
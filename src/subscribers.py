@@ -0,0 +1,342 @@
+'''
+Copyright © 2020 YutoWatanabe
+'''
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from events import WARNING_RANK, AreaKey, Intensity
+from geo import LocationIndex
+from jmx import CITY_CODE_TYPE, REGION_CODE_TYPE
+
+# SQLiteのIN句に一度に渡すエリアコードの数
+_QUERY_CHUNK = 500
+
+_HAS_AREAS = 'EXISTS (SELECT 1 FROM areas WHERE areas.user_id = subscribers.user_id)'
+_HAS_LOCATION = 'EXISTS (SELECT 1 FROM locations WHERE locations.user_id = subscribers.user_id)'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS subscribers (
+    user_id TEXT PRIMARY KEY,
+    threshold INTEGER NOT NULL,
+    followed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS areas (
+    code_type TEXT NOT NULL,
+    area_code TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    PRIMARY KEY (code_type, area_code, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS areas_user_id ON areas (user_id);
+CREATE TABLE IF NOT EXISTS locations (
+    user_id TEXT PRIMARY KEY,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL
+);
+'''
+
+# 登録できるエリアコードの桁数とコード種別
+_CODE_TYPES = {3: REGION_CODE_TYPE, 7: CITY_CODE_TYPE}
+
+
+def area_key(code: str) -> Optional[AreaKey]:
+    '''
+    購読者が指定したエリアコードを、桁数からコード種別を求めて情報のエリアと比較できる形式にします。
+
+    Args:
+        code (str): エリアコード。地震情報／細分区域(3桁)・市町村等(7桁)
+
+    Returns:
+        Optional[AreaKey]: (コード種別, エリアコード)。登録できないコードの場合はNone
+    '''
+    if not code.isdigit() or len(code) not in _CODE_TYPES:
+        return None
+    return (_CODE_TYPES[len(code)], code)
+
+
+class Subscriber(NamedTuple):
+    '''
+    購読者の設定。
+    '''
+    user_id: str
+    threshold: int
+    # 受信するエリア(コード種別, エリアコード)。空の場合はすべてのエリア
+    areas: Tuple[AreaKey, ...]
+    # 位置(緯度, 経度)。震源からの距離で受信します
+    location: Optional[Tuple[float, float]] = None
+
+
+class SubscriberRegistry():
+    '''
+    LINEの友だち(購読者)と、受信するエリアコード・位置・震度の閾値をSQLiteに保存します。
+    エリアコードから購読者を引く索引(areasテーブルの主キー)と、位置を登録した購読者の配列(LocationIndex)で、
+    情報ごとの送信先を求めます。
+    '''
+
+    def __init__(self, path: str, default_threshold: int = Intensity.THREE):
+        self.path = path
+        self.default_threshold = default_threshold
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.__migrate()
+        self.connection.executescript(_SCHEMA)
+        # 位置を登録した購読者。変更があった場合は次に使用する時に作り直します
+        self.__locations: Optional[LocationIndex] = None
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM subscribers').fetchone()[0]
+
+    def follow(self, user_id: str, now: Optional[float] = None):
+        '''
+        購読者を追加します。追加済みの場合は設定を残します。
+
+        Args:
+            user_id (str): LINEのユーザーID
+            now (Optional[float]): 現在時刻(UNIX時間)
+        '''
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR IGNORE INTO subscribers (user_id, threshold, followed_at) VALUES (?, ?, ?)',
+                (user_id, self.default_threshold, time.time() if now is None else now))
+
+    def follow_many(self, user_ids: Iterable[str], now: Optional[float] = None) -> int:
+        '''
+        購読者をまとめて追加します。追加済みの場合は設定を残します。
+
+        Args:
+            user_ids (Iterable[str]): LINEのユーザーID
+            now (Optional[float]): 現在時刻(UNIX時間)
+
+        Returns:
+            int: 新しく追加した購読者の数
+        '''
+        now = time.time() if now is None else now
+        with self.lock, self.connection:
+            self.connection.execute('BEGIN')
+            before = self.connection.total_changes
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO subscribers (user_id, threshold, followed_at) VALUES (?, ?, ?)',
+                ((user_id, self.default_threshold, now) for user_id in user_ids))
+            return self.connection.total_changes - before
+
+    def unfollow(self, user_id: str):
+        '''
+        購読者と設定を削除します。
+
+        Args:
+            user_id (str): LINEのユーザーID
+        '''
+        with self.lock, self.connection:
+            self.connection.execute('BEGIN')
+            self.connection.execute('DELETE FROM areas WHERE user_id = ?', (user_id,))
+            self.connection.execute('DELETE FROM locations WHERE user_id = ?', (user_id,))
+            self.connection.execute('DELETE FROM subscribers WHERE user_id = ?', (user_id,))
+            self.__locations = None
+
+    def set_areas(self, user_id: str, areas: Iterable[AreaKey]):
+        '''
+        受信するエリアを置き換えます。
+
+        Args:
+            user_id (str): LINEのユーザーID
+            areas (Iterable[AreaKey]): (コード種別, エリアコード)。空の場合はすべてのエリア
+        '''
+        self.follow(user_id)
+        with self.lock, self.connection:
+            self.connection.execute('BEGIN')
+            self.connection.execute('DELETE FROM areas WHERE user_id = ?', (user_id,))
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO areas (code_type, area_code, user_id) VALUES (?, ?, ?)',
+                ((code_type, code, user_id) for code_type, code in areas))
+
+    def set_threshold(self, user_id: str, threshold: int):
+        '''
+        受信する震度の閾値を設定します。
+
+        Args:
+            user_id (str): LINEのユーザーID
+            threshold (int): 震度の順位
+        '''
+        self.follow(user_id)
+        with self.lock:
+            self.connection.execute('UPDATE subscribers SET threshold = ? WHERE user_id = ?', (threshold, user_id))
+            self.__locations = None
+
+    def set_location(self, user_id: str, location: Optional[Tuple[float, float]]):
+        '''
+        位置を設定します。
+
+        Args:
+            user_id (str): LINEのユーザーID
+            location (Optional[Tuple[float, float]]): (緯度, 経度)。Noneの場合は削除
+        '''
+        self.follow(user_id)
+        with self.lock:
+            if location is None:
+                self.connection.execute('DELETE FROM locations WHERE user_id = ?', (user_id,))
+            else:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO locations (user_id, latitude, longitude) VALUES (?, ?, ?)',
+                    (user_id, location[0], location[1]))
+            self.__locations = None
+
+    def get(self, user_id: str) -> Optional[Subscriber]:
+        '''
+        購読者の設定を返します。
+
+        Args:
+            user_id (str): LINEのユーザーID
+
+        Returns:
+            Optional[Subscriber]: 設定。購読者ではない場合はNone
+        '''
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT threshold FROM subscribers WHERE user_id = ?', (user_id,)).fetchone()
+            if row is None:
+                return None
+            areas = self.connection.execute(
+                'SELECT code_type, area_code FROM areas WHERE user_id = ? ORDER BY area_code, code_type',
+                (user_id,)).fetchall()
+            location = self.connection.execute(
+                'SELECT latitude, longitude FROM locations WHERE user_id = ?', (user_id,)).fetchone()
+        return Subscriber(user_id, row[0], tuple((code_type, code) for code_type, code in areas),
+                          tuple(location) if location else None)
+
+    def receives_by_default(self, targets: Dict[AreaKey, int]) -> bool:
+        '''
+        設定していない(一覧に無い)購読者が受信する情報か返します。
+
+        Args:
+            targets (Dict[AreaKey, int]): {(コード種別, エリアコード): 震度の順位}
+
+        Returns:
+            bool: すべての地域・デフォルトの震度の閾値で受信する場合True
+        '''
+        highest = max(targets.values()) if targets else WARNING_RANK
+        return highest == WARNING_RANK or highest >= self.default_threshold
+
+    def recipients(self, targets: Dict[AreaKey, int], hypocenter: Optional[Dict[str, Any]] = None) -> List[str]:
+        '''
+        情報を送信する購読者を返します。
+        エリア・位置のどちらかが情報と一致した購読者に送信します。情報に無い条件(エリアの無い情報の
+        エリア、震源の無い情報の位置)では絞り込まず、震度の閾値のみで判定します。
+        - エリア: 登録したエリアのいずれかの震度が閾値以上
+        - 位置: 震央からマグニチュードに応じた半径以内で、最大震度が閾値以上
+        震度ではない情報(WARNING_RANK)のエリア、震度の無い情報は閾値に関係なく送信します。
+
+        Args:
+            targets (Dict[AreaKey, int]): {(コード種別, エリアコード): 震度の順位}
+            hypocenter (Optional[Dict[str, Any]]): 震源。{'latitude', 'longitude', 'radius'}
+
+        Returns:
+            List[str]: LINEのユーザーID
+        '''
+        highest = max(targets.values()) if targets else WARNING_RANK
+        with self.lock:
+            if not targets and hypocenter is None:
+                return [user_id for user_id, in self.connection.execute('SELECT user_id FROM subscribers')]
+
+            users: Set[str] = set()
+            if targets:
+                users.update(self.__area_recipients(targets))
+            else:
+                users.update(self.__threshold_recipients(_HAS_AREAS, highest))
+
+            if hypocenter is not None:
+                locations = self.__location_index()
+                users.update(locations.within(
+                    hypocenter['latitude'], hypocenter['longitude'], hypocenter['radius'],
+                    None if highest == WARNING_RANK else highest))
+            else:
+                users.update(self.__threshold_recipients(f'{_HAS_LOCATION} AND NOT {_HAS_AREAS}', highest))
+
+            users.update(self.__threshold_recipients(f'NOT {_HAS_AREAS} AND NOT {_HAS_LOCATION}', highest))
+        return sorted(users)
+
+    def __area_recipients(self, targets: Dict[AreaKey, int]) -> Iterable[str]:
+        '''
+        登録したエリアのいずれかの震度が閾値以上の購読者を返します。エリアはコード種別ごとに比較します。
+
+        Args:
+            targets (Dict[AreaKey, int]): {(コード種別, エリアコード): 震度の順位}
+
+        Yields:
+            str: LINEのユーザーID
+        '''
+        codes: Dict[str, List[str]] = {}
+        for code_type, code in targets:
+            codes.setdefault(code_type, []).append(code)
+        for code_type, same_type in codes.items():
+            for start in range(0, len(same_type), _QUERY_CHUNK):
+                chunk = same_type[start:start + _QUERY_CHUNK]
+                rows = self.connection.execute(
+                    'SELECT areas.area_code, areas.user_id, subscribers.threshold FROM areas '
+                    'JOIN subscribers ON subscribers.user_id = areas.user_id '
+                    f'WHERE areas.code_type = ? AND areas.area_code IN ({",".join("?" * len(chunk))})',
+                    [code_type] + chunk)
+                for code, user_id, threshold in rows:
+                    rank = targets[(code_type, code)]
+                    if rank == WARNING_RANK or rank >= threshold:
+                        yield user_id
+
+    def __threshold_recipients(self, condition: str, highest: int) -> Iterable[str]:
+        '''
+        `condition`に一致し、最大震度が閾値以上の購読者を返します。
+
+        Args:
+            condition (str): 購読者の条件(SQL)
+            highest (int): 情報の最大震度の順位。WARNING_RANKの場合は閾値に関係なく返します
+
+        Returns:
+            Iterable[str]: LINEのユーザーID
+        '''
+        rows = self.connection.execute(
+            f'SELECT user_id FROM subscribers WHERE {condition} AND (? = ? OR threshold <= ?)',
+            (highest, WARNING_RANK, highest))
+        return (user_id for user_id, in rows)
+
+    def __migrate(self):
+        '''
+        コード種別の無い以前のareasテーブルを、桁数から種別を求めて書き直します。求められないコードは削除します。
+        '''
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(areas)')]
+        if not columns or 'code_type' in columns:
+            return
+        with self.connection:
+            self.connection.execute('BEGIN')
+            self.connection.execute('ALTER TABLE areas RENAME TO areas_without_type')
+            self.connection.execute('DROP INDEX IF EXISTS areas_user_id')
+            for statement in _SCHEMA.split(';'):
+                self.connection.execute(statement)
+            rows = self.connection.execute('SELECT area_code, user_id FROM areas_without_type').fetchall()
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO areas (code_type, area_code, user_id) VALUES (?, ?, ?)',
+                ((key[0], key[1], user_id) for key, user_id in ((area_key(code), user_id) for code, user_id in rows)
+                 if key is not None))
+            self.connection.execute('DROP TABLE areas_without_type')
+
+    def __location_index(self) -> LocationIndex:
+        '''
+        位置を登録した購読者の配列を返します。
+
+        Returns:
+            LocationIndex: キーはユーザーID、値は震度の閾値
+        '''
+        if self.__locations is None:
+            rows = self.connection.execute(
+                'SELECT locations.user_id, latitude, longitude, threshold FROM locations '
+                'JOIN subscribers ON subscribers.user_id = locations.user_id').fetchall()
+            keys, latitudes, longitudes, thresholds = zip(*rows) if rows else ((), (), (), ())
+            self.__locations = LocationIndex(keys, latitudes, longitudes, thresholds)
+        return self.__locations
+
+    def close(self):
+        '''
+        データベースを閉じます。
+        '''
+        with self.lock:
+            self.connection.close()
@@ -1,8 +1,57 @@
 '''
 Copyright © 2020 YutoWatanabe
 '''
+import json
 import re
-from typing import Any
+import unicodedata
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+# テンプレートの値を埋め込む位置。例: @@title@@
+PLACEHOLDER = '@@{}@@'
+_SLOT_PATTERN = re.compile(r'@@(\w+)@@(?:([^"@]*?)@@\1@@)?')
+
+
+def alt_text(text: Any) -> str:
+    '''
+    通知に表示する代替テキストを返します。(LINEの上限は400文字)
+
+    Args:
+        text (Any): 送信する情報(events.Event)
+
+    Returns:
+        str: 代替テキスト。本文が無い場合はタイトル
+    '''
+    return (text.body or text.title)[:400]
+
+
+def template_key(title: str) -> str:
+    '''
+    テンプレートを選択するためにタイトルを正規化します。
+    全角・半角と空白の違いを無視します。例: `緊急地震速報（警報）` と `緊急地震速報 (警報)` は同じ
+
+    Args:
+        title (str): タイトル
+
+    Returns:
+        str: 正規化したタイトルの1行目。津波に関する情報は`津波`
+    '''
+    key = unicodedata.normalize('NFKC', title.split('\n')[0]).replace(' ', '')
+    return '津波' if '津波' in key else key
+
+
+def render_template(text: Any) -> bytes:
+    '''
+    テンプレートを適用したFlex MessageをJSONで返します。
+    起動時にコンパイルしたテンプレートに値を埋め込むだけなので、Dictを組み立て直しません。
+
+    Args:
+        text (Any): 送信する情報(events.Event)
+
+    Returns:
+        bytes: Flex Message(type, altText, contents)のJSON(UTF-8)
+    '''
+    template = _TEMPLATES.get(template_key(text.title), _ERROR)
+    return template.select(text).render(text)
 
 
 def apply_template(text: Any) -> Any:
@@ -10,55 +59,153 @@ def apply_template(text: Any) -> Any:
     タイトルから適切なテンプレートを指定します。
 
     Args:
-        text (Any): 送信するタイトルなどの情報が入ったDict
+        text (Any): 送信する情報(events.Event)
 
     Returns:
         Any: テンプレートを適用
     '''
-    title = text['title']
-    tsunami = re.search(r'津波', title)
-    seismic_intensity_bulletin = re.search(r'震度速報', title)
-    epicenter_and_seismic_intensity = re.search(r'震源・震度に関する情報', title)
-
-    if seismic_intensity_bulletin:
-        template = seismic_intensity_bulletin_template(text)
-    elif title == '震源に関する情報':
-        template = epicenter_information_template(text)
-    elif epicenter_and_seismic_intensity:
-        template = epicenter_and_seismic_intensity_template(text)
-    elif title == '緊急地震速報（予報）':
-        template = earthquake_early_warning_forecast_template(text)
-    elif title == '緊急地震速報（警報）':
-        template = earthquake_early_warning_alarm_template(text)
-    elif tsunami:
-        template = tsunami_template(text)
-    else:
-        template = {
-            "type": "bubble",
-            "body": {
-                "type": "box",
-                "layout": "vertical",
-                "contents": [
-                    {
-                        "type": "text",
-                        "text": "Error",
-                        "weight": "bold",
-                        "size": "xl",
-                        "align": "center",
-                        "color": "#fff77a",
-                        "wrap": True
-                    }
-                ]
-            },
-            "styles": {
-                "body": {
-                    "backgroundColor": "#010101",
-                    "separatorColor": "#010101"
+    return json.loads(render_template(text))['contents']
+
+
+class Skeleton():  # pylint: disable=R0903
+    '''
+    コンパイルしたテンプレート。
+    JSONにシリアライズしたテンプレートを値を埋め込む位置で分割して保持します。
+    '''
+    __slots__ = ('parts', 'slots')
+
+    def __init__(self, contents: Any):
+        '''
+        Args:
+            contents (Any): 値の代わりにPLACEHOLDERを埋め込んだテンプレート
+        '''
+        serialized = json.dumps({
+            'type': 'flex',
+            'altText': PLACEHOLDER.format('alt_text'),
+            'contents': contents,
+        }, ensure_ascii=False, separators=(',', ':'))
+
+        pieces = _SLOT_PATTERN.split(serialized)
+        # split結果は [文字列, 名前, 区切り文字, 文字列, 名前, 区切り文字, ..., 文字列]
+        self.parts: Tuple[bytes, ...] = tuple(piece.encode('utf-8') for piece in pieces[::3])
+        # 区切り文字はエスケープを戻し、結合してからまとめてエスケープする
+        self.slots: Tuple[Tuple[str, Optional[str]], ...] = tuple(
+            (name, None if separator is None else json.loads(f'"{separator}"'))
+            for name, separator in zip(pieces[1::3], pieces[2::3]))
+
+    def render(self, text: Any) -> bytes:
+        '''
+        値を埋め込みます。値は同じ名前の属性から取得します。
+
+        Args:
+            text (Any): 送信する情報(events.Event)
+
+        Returns:
+            bytes: JSON(UTF-8)
+        '''
+        values = {'alt_text': alt_text(text)}
+        chunks: List[bytes] = [self.parts[0]]
+        for (name, separator), part in zip(self.slots, self.parts[1:]):
+            value = values[name] if name in values else getattr(text, name)
+            if separator is not None:
+                value = separator.join(map(str, value))
+            chunks.append(_escape(str(value)))
+            chunks.append(part)
+        return b''.join(chunks)
+
+
+class Template(NamedTuple):
+    '''
+    メッセージの種類ごとのテンプレート。
+    `optional`の値の有無でレイアウトが変わる場合は、両方をコンパイルします。
+    '''
+    default: Skeleton
+    optional: Optional[str] = None
+    without_optional: Optional[Skeleton] = None
+
+    def select(self, text: Any) -> Skeleton:
+        '''
+        適用するテンプレートを返します。
+
+        Args:
+            text (Any): 送信する情報(events.Event)
+
+        Returns:
+            Skeleton: テンプレート
+        '''
+        if self.optional is not None and self.without_optional is not None \
+                and getattr(text, self.optional, None) is None:
+            return self.without_optional
+        return self.default
+
+
+def compile_template(template: Any, optional: Optional[str] = None) -> Template:
+    '''
+    テンプレートを生成する関数をコンパイルします。
+    リストの値(areas)は2要素を渡して区切り文字を求めます。
+
+    Args:
+        template (Any): テンプレートを生成する関数
+        optional (Optional[str]): 省略可能なキー
+
+    Returns:
+        Template: コンパイルしたテンプレート
+    '''
+    sample: Dict[str, Any] = {
+        name: PLACEHOLDER.format(name)
+        for name in ('title', 'body', 'info', 'magnitude', 'area', 'max_seismic_intensity')}
+    sample['areas'] = [PLACEHOLDER.format('areas')] * 2
+
+    without_optional = None
+    if optional is not None:
+        without_optional = Skeleton(template({key: value for key, value in sample.items() if key != optional}))
+    return Template(Skeleton(template(sample)), optional, without_optional)
+
+
+def _escape(value: str) -> bytes:
+    '''
+    JSONの文字列としてエスケープします。
+
+    Args:
+        value (str): 値
+
+    Returns:
+        bytes: 前後の`"`を除いたJSON文字列(UTF-8)
+    '''
+    return json.dumps(value, ensure_ascii=False)[1:-1].encode('utf-8')
+
+
+def error_template(_: Any) -> Any:
+    '''
+    対応するテンプレートが無い場合のテンプレート。
+
+    Returns:
+        Any: テンプレートを適用
+    '''
+    return {
+        "type": "bubble",
+        "body": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {
+                    "type": "text",
+                    "text": "Error",
+                    "weight": "bold",
+                    "size": "xl",
+                    "align": "center",
+                    "color": "#fff77a",
+                    "wrap": True
                 }
+            ]
+        },
+        "styles": {
+            "body": {
+                "backgroundColor": "#010101",
+                "separatorColor": "#010101"
             }
         }
-
-    return template
+    }
 
 
 def seismic_intensity_bulletin_template(text: Any) -> Any:
@@ -707,3 +854,75 @@ def tsunami_template(text: Any) -> Any:
         }
 
     return template
+
+
+def notice_template(text: Any) -> Any:
+    '''
+    おしらせのテンプレートを設定する。
+
+    Args:
+        text (Any): 送信するタイトルなどの情報が入ったDict
+                    title, body
+
+    Returns:
+        Any: テンプレートを適用
+    '''
+    title = text['title']
+    body = text['body']
+
+    template = {
+        "type": "bubble",
+        "header": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {
+                    "type": "text",
+                    "text": title,
+                    "size": "xl",
+                    "color": "#1c1c1c",
+                    "weight": "bold",
+                    "align": "center",
+                    "wrap": True
+                }
+            ]
+        },
+        "body": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {
+                    "type": "text",
+                    "text": body,
+                    "size": "md",
+                    "color": "#1c1c1c",
+                    "wrap": True
+                }
+            ]
+        },
+        "styles": {
+            "header": {
+                "backgroundColor": "#fff77a",
+                "separatorColor": "#fff77a"
+            },
+            "body": {
+                "backgroundColor": "#e9e8e8",
+                "separatorColor": "#e9e8e8"
+            }
+        }
+    }
+
+    return template
+
+
+# 起動時にコンパイルする。キーはtemplate_keyで正規化したタイトル
+_TEMPLATES = {
+    '震度速報': compile_template(seismic_intensity_bulletin_template),
+    '震源に関する情報': compile_template(epicenter_information_template),
+    '震源・震度に関する情報': compile_template(epicenter_and_seismic_intensity_template, optional='areas'),
+    '緊急地震速報(予報)': compile_template(earthquake_early_warning_forecast_template),
+    '緊急地震速報(警報)': compile_template(earthquake_early_warning_alarm_template),
+    '津波': compile_template(tsunami_template, optional='area'),
+    'おしらせ': compile_template(notice_template),
+}
+_ERROR = compile_template(error_template)
@@ -0,0 +1,262 @@
+'''
+Copyright © 2020 YutoWatanabe
+'''
+import logging
+import threading
+import unicodedata
+from http.server import BaseHTTPRequestHandler
+from typing import Any, List, Optional
+
+import linebot
+import requests
+from linebot.exceptions import InvalidSignatureError, LineBotApiError
+from linebot.models import FollowEvent, LocationMessage, MessageEvent, TextMessage, TextSendMessage, UnfollowEvent
+
+from events import Intensity
+from subscribers import SubscriberRegistry, area_key
+from websub import ThreadingHTTPServer
+
+LOGGER = logging.getLogger(__name__)
+
+HELP = '''【設定】
+地域 [エリアコード ...]: 受信する地域を設定します。複数指定できます
+  例) 地域 350 1310100
+  地震情報／細分区域(3桁)・市町村等(7桁)のコードが使えます
+  緊急地震速報(警報)・津波の情報は地域に関係なく送信します
+地域 すべて: すべての地域を受信します
+位置情報を送信: 震源からの距離(マグニチュードに応じた範囲)で受信します
+位置 解除: 位置を削除します
+震度 [震度]: 受信する最小の震度を設定します
+  例) 震度 4, 震度 5弱
+設定: 現在の設定を表示します'''
+
+
+class LineWebhook():
+    '''
+    LINEのWebhookを受け付け、友だち追加・ブロックと地域・震度の設定を購読者の一覧に反映します。
+    '''
+
+    def __init__(self, registry: SubscriberRegistry, channel_secret: str,  # pylint: disable=R0913
+                 line_bot_api: Optional[linebot.LineBotApi] = None, port: int = 8000, host: str = ''):
+        self.registry = registry
+        self.parser = linebot.WebhookParser(channel_secret)
+        self.line_bot_api = line_bot_api
+        self.port = port
+        self.host = host
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    def start(self):
+        '''
+        HTTPサーバーを起動します。
+        '''
+        self.server = ThreadingHTTPServer((self.host, self.port), _handler(self))
+        threading.Thread(target=self.server.serve_forever, name='line-webhook', daemon=True).start()
+        LOGGER.info('LINE webhook listening on port %d', self.server.server_address[1])
+
+    def stop(self):
+        '''
+        HTTPサーバーを停止します。
+        '''
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def import_followers(self) -> bool:
+        '''
+        友だちのユーザーIDの一覧(followers/ids)を取得して購読者に追加します。
+        Webhookを受け付ける前に友だちになっていたユーザーにも送信できるようにするため、起動時に呼びます。
+
+        Returns:
+            bool: 取り込めた場合True。APIを使用できない(認証済アカウントではない)などで取得できなかった場合False
+        '''
+        if self.line_bot_api is None:
+            return False
+        added = 0
+        start = None
+        try:
+            while True:
+                followers = self.line_bot_api.get_followers_ids(limit=1000, start=start)
+                added += self.registry.follow_many(followers.user_ids)
+                start = getattr(followers, 'next', None)
+                if not start:
+                    break
+        except (LineBotApiError, requests.exceptions.RequestException) as error:
+            LOGGER.warning('Failed to import followers: %s', error)
+            return False
+        LOGGER.info('Imported %d followers', added)
+        return True
+
+    def handle(self, body: str, signature: str):
+        '''
+        Webhookのイベントを処理します。
+
+        Args:
+            body (str): リクエストの本文
+            signature (str): X-Line-Signatureヘッダ
+
+        Raises:
+            InvalidSignatureError: 署名が一致しない場合
+        '''
+        for event in self.parser.parse(body, signature):
+            user_id = getattr(event.source, 'user_id', None)
+            if user_id is None:
+                continue
+            if isinstance(event, FollowEvent):
+                self.registry.follow(user_id)
+                LOGGER.info('Followed: %s', user_id)
+                self.__reply(event, HELP)
+            elif isinstance(event, UnfollowEvent):
+                self.registry.unfollow(user_id)
+                LOGGER.info('Unfollowed: %s', user_id)
+            elif isinstance(event, MessageEvent) and isinstance(event.message, TextMessage):
+                self.__reply(event, self.command(user_id, event.message.text))
+            elif isinstance(event, MessageEvent) and isinstance(event.message, LocationMessage):
+                self.registry.set_location(user_id, (event.message.latitude, event.message.longitude))
+                self.__reply(event, '送信された位置の周辺で発生した地震の情報を受信します。')
+
+    def command(self, user_id: str, text: str) -> str:
+        '''
+        設定のコマンドを実行します。
+
+        Args:
+            user_id (str): LINEのユーザーID
+            text (str): 送信されたテキスト
+
+        Returns:
+            str: 返信する内容
+        '''
+        words = unicodedata.normalize('NFKC', text).split()
+        commands = {
+            '地域': self.__set_areas,
+            '震度': self.__set_threshold,
+            '位置': self.__clear_location,
+            '設定': self.__show,
+        }
+        if not words or words[0] not in commands:
+            return HELP
+        return commands[words[0]](user_id, words[1:])
+
+    def __set_areas(self, user_id: str, arguments: List[str]) -> str:
+        '''
+        受信する地域を設定します。
+
+        Args:
+            user_id (str): LINEのユーザーID
+            arguments (List[str]): エリアコード(桁数でコード種別を判定します)。`すべて`の場合はすべての地域
+
+        Returns:
+            str: 返信する内容
+        '''
+        if not arguments:
+            return HELP
+        if arguments == ['すべて']:
+            self.registry.set_areas(user_id, [])
+            return 'すべての地域を受信します。'
+        areas = [area_key(code) for code in arguments]
+        if None in areas:
+            return 'エリアコードは3桁(細分区域)または7桁(市町村等)の数字で指定してください。\n\n' + HELP
+        self.registry.set_areas(user_id, [area for area in areas if area is not None])
+        return f'{"、".join(arguments)} の情報を受信します。'
+
+    def __set_threshold(self, user_id: str, arguments: List[str]) -> str:
+        '''
+        受信する最小の震度を設定します。
+
+        Args:
+            user_id (str): LINEのユーザーID
+            arguments (List[str]): 震度。例: ['5弱']
+
+        Returns:
+            str: 返信する内容
+        '''
+        threshold = Intensity.parse(''.join(arguments))
+        if threshold is None:
+            return '震度は 1〜7(5弱・5強・6弱・6強)で指定してください。'
+        self.registry.set_threshold(user_id, threshold)
+        return f'震度{threshold.label}以上の情報を受信します。'
+
+    def __clear_location(self, user_id: str, arguments: List[str]) -> str:
+        '''
+        位置を削除します。
+
+        Args:
+            user_id (str): LINEのユーザーID
+            arguments (List[str]): ['解除']
+
+        Returns:
+            str: 返信する内容
+        '''
+        if arguments != ['解除']:
+            return '位置はLINEの位置情報を送信して設定してください。\n\n' + HELP
+        self.registry.set_location(user_id, None)
+        return '位置を削除しました。'
+
+    def __show(self, user_id: str, _: List[str]) -> str:
+        '''
+        現在の設定を返します。
+
+        Args:
+            user_id (str): LINEのユーザーID
+
+        Returns:
+            str: 返信する内容
+        '''
+        subscriber = self.registry.get(user_id)
+        if subscriber is None:
+            return HELP
+        areas = '、'.join(code for _, code in subscriber.areas) if subscriber.areas else 'すべて'
+        location = '未設定' if subscriber.location is None else \
+            f'北緯{subscriber.location[0]:.2f} 東経{subscriber.location[1]:.2f}'
+        return f'地域: {areas}\n位置: {location}\n震度: {Intensity(subscriber.threshold).label}以上'
+
+    def __reply(self, event: Any, text: str):
+        '''
+        返信します。
+
+        Args:
+            event (Any): Webhookのイベント
+            text (str): 返信する内容
+        '''
+        if self.line_bot_api is None or not getattr(event, 'reply_token', None):
+            return
+        try:
+            self.line_bot_api.reply_message(event.reply_token, TextSendMessage(text=text))
+        except LineBotApiError as error:
+            LOGGER.warning('Failed to reply: %s', error)
+
+
+def _handler(webhook: LineWebhook) -> type:
+    '''
+    Webhookに対応するリクエストハンドラを生成します。
+
+    Args:
+        webhook (LineWebhook): Webhook
+
+    Returns:
+        type: BaseHTTPRequestHandlerのサブクラス
+    '''
+
+    class Handler(BaseHTTPRequestHandler):
+        '''
+        LINEのWebhook。
+        '''
+
+        def do_POST(self):  # pylint: disable=C0103
+            '''
+            イベントを処理して200を返します。
+            '''
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+            try:
+                webhook.handle(body, self.headers.get('X-Line-Signature', ''))
+            except InvalidSignatureError:
+                LOGGER.warning('Discarded LINE webhook with invalid signature')
+                self.send_error(400)
+                return
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, format, *args):  # pylint: disable=W0622
+            LOGGER.debug(format, *args)
+
+    return Handler
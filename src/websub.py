@@ -0,0 +1,220 @@
+'''
+Copyright © 2020 YutoWatanabe
+'''
+import hashlib
+import hmac
+import logging
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Callable, Optional
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from http_client import HttpClient
+
+LOGGER = logging.getLogger(__name__)
+
+SIGNATURE_METHODS = {
+    'sha1': hashlib.sha1,
+    'sha256': hashlib.sha256,
+    'sha384': hashlib.sha384,
+    'sha512': hashlib.sha512,
+}
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    '''
+    リクエストごとにスレッドで処理するHTTPサーバー。
+    '''
+    daemon_threads = True
+
+
+class WebSubSubscriber():  # pylint: disable=R0902
+    '''
+    WebSub(PubSubHubbub)のサブスクライバ。
+    HTTPサーバーを起動してハブに購読を登録し、配信されたAtomフィードを`on_feed`に渡します。
+    購読期限(lease)が切れる前に自動で再登録します。
+    '''
+
+    def __init__(self, hub: str, topic: str, callback_url: str,  # pylint: disable=R0913
+                 on_feed: Callable[[bytes], None], port: int = 8080, secret: Optional[str] = None,
+                 lease_seconds: int = 86400, http_client: Optional[HttpClient] = None):
+        self.hub = hub
+        self.topic = topic
+        self.callback_url = callback_url
+        self.on_feed = on_feed
+        self.port = port
+        self.secret = secret
+        self.lease_seconds = lease_seconds
+        self.http = http_client if http_client is not None else HttpClient()
+
+        self.server: Optional[ThreadingHTTPServer] = None
+        self.__renewal: Optional[threading.Timer] = None
+
+    def start(self):
+        '''
+        HTTPサーバーを起動し、ハブに購読を登録します。
+        '''
+        self.server = ThreadingHTTPServer(('', self.port), _handler(self))
+        threading.Thread(target=self.server.serve_forever, name='websub', daemon=True).start()
+        LOGGER.info('WebSub callback listening on port %d', self.server.server_address[1])
+        self.subscribe()
+
+    def stop(self):
+        '''
+        再登録を止め、HTTPサーバーを停止します。
+        '''
+        if self.__renewal is not None:
+            self.__renewal.cancel()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def subscribe(self, mode: str = 'subscribe'):
+        '''
+        ハブに購読を登録(解除)します。失敗した場合は1分後に再試行します。
+
+        Args:
+            mode (str): subscribe または unsubscribe
+        '''
+        data = {
+            'hub.mode': mode,
+            'hub.topic': self.topic,
+            'hub.callback': self.callback_url,
+            'hub.lease_seconds': str(self.lease_seconds),
+        }
+        if self.secret:
+            data['hub.secret'] = self.secret
+
+        try:
+            # 購読の要求は同じ内容を繰り返しても結果が変わらないためリトライする
+            responce = self.http.post(self.hub, data=data, retry=True)
+            accepted = responce.status_code in (202, 204)
+        except requests.exceptions.RequestException:
+            accepted = False
+        if not accepted:
+            LOGGER.warning('WebSub %s request to %s failed, retrying in 60s', mode, self.hub)
+            self.__schedule(60)
+
+    def verify(self, mode: str, topic: str, lease_seconds: Optional[str]) -> bool:
+        '''
+        ハブからの購読確認(intent verification)を検証します。
+
+        Args:
+            mode (str): hub.mode
+            topic (str): hub.topic
+            lease_seconds (Optional[str]): hub.lease_seconds
+
+        Returns:
+            bool: このサブスクライバが要求した購読の場合True
+        '''
+        if topic != self.topic or mode not in ('subscribe', 'unsubscribe'):
+            return False
+        if mode == 'subscribe':
+            lease = int(lease_seconds) if lease_seconds and lease_seconds.isdigit() else self.lease_seconds
+            # 期限の9割が経過したら再登録する
+            self.__schedule(max(lease * 0.9, 60))
+            LOGGER.info('WebSub subscription verified (lease %ds)', lease)
+        return True
+
+    def is_authentic(self, body: bytes, signature: Optional[str]) -> bool:
+        '''
+        配信された内容の署名(X-Hub-Signature)を検証します。
+
+        Args:
+            body (bytes): 配信された内容
+            signature (Optional[str]): X-Hub-Signatureヘッダ。例: sha1=xxxx
+
+        Returns:
+            bool: 正しい署名の場合True。secretを設定していない場合は常にTrue
+        '''
+        if not self.secret:
+            return True
+        if not signature or '=' not in signature:
+            return False
+        method, _, digest = signature.partition('=')
+        if method not in SIGNATURE_METHODS:
+            return False
+        expected = hmac.new(self.secret.encode('utf-8'), body, SIGNATURE_METHODS[method]).hexdigest()
+        return hmac.compare_digest(expected, digest)
+
+    def __schedule(self, delay: float):
+        '''
+        `delay`秒後に購読を再登録します。
+
+        Args:
+            delay (float): 待機時間(秒)
+        '''
+        if self.__renewal is not None:
+            self.__renewal.cancel()
+        self.__renewal = threading.Timer(delay, self.subscribe)
+        self.__renewal.daemon = True
+        self.__renewal.start()
+
+
+def _handler(subscriber: WebSubSubscriber) -> type:
+    '''
+    サブスクライバに対応するリクエストハンドラを生成します。
+
+    Args:
+        subscriber (WebSubSubscriber): サブスクライバ
+
+    Returns:
+        type: BaseHTTPRequestHandlerのサブクラス
+    '''
+
+    class Handler(BaseHTTPRequestHandler):
+        '''
+        WebSubのコールバック。
+        '''
+
+        def do_GET(self):  # pylint: disable=C0103
+            '''
+            購読確認。hub.challengeをそのまま返します。
+            '''
+            query = parse_qs(urlparse(self.path).query)
+
+            def value(name: str) -> str:
+                return query.get(name, [''])[0]
+
+            if not subscriber.verify(value('hub.mode'), value('hub.topic'), value('hub.lease_seconds')):
+                self.send_error(404)
+                return
+            challenge = value('hub.challenge').encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain')
+            self.send_header('Content-Length', str(len(challenge)))
+            self.end_headers()
+            self.wfile.write(challenge)
+
+        def do_POST(self):  # pylint: disable=C0103
+            '''
+            フィードの配信。先に応答してから処理します。
+            '''
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if not subscriber.is_authentic(body, self.headers.get('X-Hub-Signature')):
+                # 署名が一致しない場合も2xxを返して内容は捨てる(WebSubの仕様)
+                LOGGER.warning('Discarded WebSub payload with invalid signature')
+                self.__accept()
+                return
+            self.__accept()
+            try:
+                subscriber.on_feed(body)
+            except Exception:  # pylint: disable=W0703
+                LOGGER.exception('Failed to process pushed feed')
+
+        def __accept(self):
+            '''
+            202を返します。ハブを待たせないよう、処理の前に送信します。
+            '''
+            self.send_response(202)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            self.wfile.flush()
+
+        def log_message(self, format, *args):  # pylint: disable=W0622
+            LOGGER.debug(format, *args)
+
+    return Handler
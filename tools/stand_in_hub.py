@@ -0,0 +1,90 @@
+'''
+Copyright © 2020 YutoWatanabe
+
+ローカルでPush受信を試すためのWebSubハブの代わり。
+購読の登録を受け付けて購読確認を行い、記録済みのフィードを順番にPOSTします。
+
+    python tools/stand_in_hub.py --port 8081 --interval 5 feeds/*.xml
+    python src/main.py --push-hub http://127.0.0.1:8081/ --push-callback http://127.0.0.1:8080/ --push-secret local
+'''
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import click
+import requests
+
+
+def distribute(callback: str, topic: str, feeds: Tuple[str, ...], interval: float, secret: Optional[str]):
+    '''
+    購読確認を行い、フィードを配信します。
+
+    Args:
+        callback (str): サブスクライバのコールバックURL
+        topic (str): トピック(フィードのURL)
+        feeds (Tuple[str, ...]): 配信するフィードのファイル
+        interval (float): 配信間隔(秒)
+        secret (Optional[str]): 署名の秘密鍵
+    '''
+    challenge = secrets.token_hex(16)
+    responce = requests.get(callback, params={
+        'hub.mode': 'subscribe', 'hub.topic': topic, 'hub.challenge': challenge, 'hub.lease_seconds': '3600'},
+        timeout=10)
+    if responce.status_code != 200 or responce.text != challenge:
+        click.echo(f'verification failed: {responce.status_code} {responce.text!r}')
+        return
+    click.echo(f'verified {callback}')
+
+    for path in feeds:
+        time.sleep(interval)
+        with open(path, mode='rb') as feed:
+            body = feed.read()
+        headers = {'Content-Type': 'application/atom+xml'}
+        if secret:
+            headers['X-Hub-Signature'] = 'sha1=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha1).hexdigest()
+        started = time.perf_counter()
+        responce = requests.post(callback, data=body, headers=headers, timeout=10)
+        click.echo(f'pushed {path}: {responce.status_code} ({(time.perf_counter() - started) * 1000:.1f} ms)')
+
+
+@click.command()
+@click.option('--port', default=8081, show_default=True, help='待ち受けるポート')
+@click.option('--interval', default=5.0, show_default=True, help='フィードを配信する間隔(秒)')
+@click.argument('feeds', nargs=-1, type=click.Path(exists=True, dir_okay=False))
+def main(port: int, interval: float, feeds: Tuple[str, ...]):
+    '''
+    ハブを起動します。
+    '''
+    subscriptions: List[threading.Thread] = []
+
+    class Handler(BaseHTTPRequestHandler):
+        '''
+        購読の登録を受け付けます。
+        '''
+
+        def do_POST(self):  # pylint: disable=C0103
+            '''
+            hub.mode=subscribe を受け付けて、非同期で購読確認と配信を行います。
+            '''
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+            form = {key: values[0] for key, values in parse_qs(body).items()}
+            self.send_response(202)
+            self.end_headers()
+            if form.get('hub.mode') != 'subscribe':
+                return
+            thread = threading.Thread(target=distribute, args=(
+                form['hub.callback'], form['hub.topic'], feeds, interval, form.get('hub.secret')))
+            thread.start()
+            subscriptions.append(thread)
+
+    click.echo(f'stand-in hub listening on port {port}')
+    HTTPServer(('', port), Handler).serve_forever()
+
+
+if __name__ == '__main__':
+    main()  # pylint: disable=E1120